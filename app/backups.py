@@ -0,0 +1,47 @@
+"""Database backup copies, the first step of every snapshot (see snapshots.py).
+
+Copies are taken with SQLite's online backup API rather than by copying the
+file: the copy is made page by page through a read connection, so it is a
+consistent snapshot that includes whatever is still in the `-wal` file, and
+writers are only held off for one step of BACKUP_PAGES_PER_STEP pages at a
+time. Each copy is written under a temporary name, checked with
+`PRAGMA quick_check` and only then renamed into place, so the target file is
+always complete.
+"""
+import os
+import sqlite3
+
+from .database import DB_PATH
+
+BACKUP_DIR = os.path.join(os.path.dirname(DB_PATH), "backups")
+BACKUP_INTERVAL_HOURS = 24
+BACKUP_PAGES_PER_STEP = 1024       # 4 MiB at the default page size
+BACKUP_STEP_PAUSE_SECONDS = 0.005  # lets writers in between steps
+
+
+class BackupError(Exception):
+    """A backup copy failed its integrity check."""
+
+
+def copy_database(source_path: str, target_path: str):
+    """Copy a live database to `target_path` through the backup API and verify the copy."""
+    partial_path = target_path + ".partial"
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(partial_path)
+    try:
+        try:
+            source.backup(target, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_PAUSE_SECONDS)
+            # A backup is a single self-contained file, whatever the live database's journal mode
+            target.execute("PRAGMA journal_mode=DELETE")
+            result = target.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            target.close()
+            source.close()
+    except BaseException:
+        os.remove(partial_path)
+        raise
+
+    if result != "ok":
+        os.remove(partial_path)
+        raise BackupError(f"Backup of {source_path} failed its integrity check: {result}")
+    os.replace(partial_path, target_path)
@@ -0,0 +1,67 @@
+"""Process-level caches of task list responses and schedule analyses.
+
+Entries are stamped with the database version they were computed at (see
+versioning.py) and are only served while the database is still at that
+version, so any committed write, from this process or another, invalidates
+every entry at once. Results that depend on the clock (`is:overdue`) are
+additionally given a short time-to-live.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+MAX_ENTRIES = 256
+TIME_DEPENDENT_TTL_SECONDS = 30
+
+
+class ResultCache:
+    """A bounded LRU of response bodies, valid only for the data version they were computed at."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, expires, value = entry
+                if entry_version == version and (expires is None or expires > time.monotonic()):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, version: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store `value`, computed from data at `version` (read before running the query)."""
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (version, expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+task_results = ResultCache()
+# Keyed by (day, task_days); see schedule.py
+schedule_results = ResultCache(max_entries=16)
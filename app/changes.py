@@ -0,0 +1,136 @@
+"""Delta sync over the change log.
+
+Triggers (migrations 6 and 7) append a row to `change_log` for every write to
+tasks, categories and dependency edges, in the writing transaction. Deletes
+stay in the log as tombstones. A client keeps the highest sequence number it
+has applied and asks for everything after it; the answer is the *current*
+state of each changed entity, so a burst of edits to one task costs one row.
+
+The log is compacted from the front. Registered clients (those that pass a
+`client_id`) hold back compaction until they have confirmed a sequence
+number, unless they have not synced for CLIENT_EXPIRY_DAYS. A client asking
+for changes that have already been pruned gets HistoryPruned and must do a
+full reload.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from . import crud, graph, models
+
+CHANGE_BATCH_SIZE = 500
+KEEP_RECENT_CHANGES = 1000
+CLIENT_EXPIRY_DAYS = 30
+
+
+class HistoryPruned(Exception):
+    """The requested changes were compacted away; the client must resync from scratch."""
+
+
+def pruned_through(db: Session) -> int:
+    """Highest sequence number removed by compaction (0 if none).
+
+    Compaction only removes a prefix and always keeps the newest row, so this
+    is one below the oldest row left.
+    """
+    oldest = db.execute(select(func.min(models.change_log.c.seq))).scalar()
+    return oldest - 1 if oldest is not None else 0
+
+
+def record_client(db: Session, client_id: str, seq: int):
+    """Remember that `client_id` has applied every change up to `seq`."""
+    stmt = insert(models.sync_clients).values(client_id=client_id, seq=seq, seen_at=datetime.now())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.sync_clients.c.client_id],
+        set_={"seq": stmt.excluded.seq, "seen_at": stmt.excluded.seen_at}
+    )
+    # Bookkeeping, not data: through the connection so the data version stays put
+    db.connection().execute(stmt)
+    db.commit()
+
+
+def read_changes(db: Session, since: int = 0, limit: int = CHANGE_BATCH_SIZE, client_id: Optional[str] = None) -> dict:
+    """Everything changed after `since`, as a ChangeBatch-shaped dict.
+
+    Raises ValueError for a bad limit and HistoryPruned if `since` is older
+    than the compacted log.
+    """
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    if since < pruned_through(db):
+        raise HistoryPruned(f"Changes up to {pruned_through(db)} have been pruned; reload everything")
+    if client_id:
+        record_client(db, client_id, since)
+
+    limit = min(limit, crud.MAX_PAGE_SIZE)
+    rows = crud.get_changes(db, since, limit + 1)
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    task_ids, category_ids, edges = set(), set(), set()
+    for row in rows:
+        if row.entity == "task":
+            task_ids.add(row.entity_id)
+        elif row.entity == "category":
+            category_ids.add(row.entity_id)
+        elif row.entity == "dependency":
+            edges.add((row.entity_id, row.related_id))
+
+    seq = rows[-1].seq if rows else since
+    # Dependents whose blocked status flipped carry no log entry of their own
+    flipped = graph.blocked_status_changed(db, since, seq) - task_ids
+
+    # Whatever no longer exists was deleted, whatever op the log ended with
+    tasks = crud.get_tasks_by_ids(db, sorted(task_ids | flipped))
+    categories = [
+        category
+        for chunk in crud.chunks(sorted(category_ids))
+        for category in db.query(models.Category).filter(models.Category.id.in_(chunk))
+    ]
+    live_edges = set()
+    for chunk in crud.chunks(sorted(edges)):
+        live_edges.update(tuple(row) for row in db.execute(
+            select(models.task_dependencies.c.task_id, models.task_dependencies.c.depends_on_id)
+            .where(tuple_(models.task_dependencies.c.task_id, models.task_dependencies.c.depends_on_id).in_(chunk))
+        ))
+
+    found_tasks = {t.id for t in tasks}
+    found_categories = {c.id for c in categories}
+    return {
+        "since": since,
+        "seq": seq,
+        "more": more,
+        "tasks": tasks,
+        "categories": categories,
+        "dependencies": sorted(live_edges),
+        "deleted": {
+            "tasks": sorted(task_ids - found_tasks),
+            "categories": sorted(category_ids - found_categories),
+            "dependencies": sorted(edges - live_edges),
+        },
+    }
+
+
+def compact(db: Session) -> int:
+    """Drop log entries every active client has confirmed, keeping the newest KEEP_RECENT_CHANGES.
+
+    Returns the number of entries removed.
+    """
+    conn = db.connection()
+    cutoff = datetime.now() - timedelta(days=CLIENT_EXPIRY_DAYS)
+    conn.execute(delete(models.sync_clients).where(models.sync_clients.c.seen_at < cutoff))
+
+    mark = crud.latest_change_seq(db) - max(KEEP_RECENT_CHANGES, 1)
+    lowest_client = conn.execute(select(func.min(models.sync_clients.c.seq))).scalar()
+    if lowest_client is not None:
+        mark = min(mark, lowest_client)
+    if mark <= pruned_through(db):
+        db.commit()
+        return 0
+
+    removed = conn.execute(delete(models.change_log).where(models.change_log.c.seq <= mark)).rowcount
+    db.commit()
+    return removed
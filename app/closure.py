@@ -0,0 +1,187 @@
+"""Transitive closure of the dependency graph.
+
+`task_closure(ancestor_id, descendant_id, depth)` has a row for every pair of
+tasks joined by a chain of blocking edges: the ancestor is upstream (a
+blocker, a blocker's blocker...), the descendant downstream, and depth is the
+length of the shortest chain. "Everything that blocks X" and "everything X
+holds up" are then single indexed lookups instead of one query per level.
+
+Every write to `task_dependencies` updates the closure in the same
+transaction:
+
+- New edges out of one task (create_task, update_task adding blockers) join
+  the blocker's ancestors to the task's descendants in one INSERT.
+- Anything else (removed blockers, deleted tasks, imports) recomputes the
+  rows of the affected tasks and everything downstream of them, one
+  topological level at a time, from the edges and the rows upstream.
+
+The table is proportional to the number of connected pairs: cheap for many
+small projects, quadratic for one long chain.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Union
+
+from sqlalchemy import and_, delete, func, literal, or_, select, true, union_all
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import chunks
+from .graph import is_open
+
+_closure = models.task_closure
+_edges = models.task_dependencies.c
+
+Executor = Union[Session, Connection]
+
+
+def ancestors(db: Executor, task_id: int) -> Dict[int, int]:
+    """Every task upstream of `task_id`, with the length of the shortest chain to it."""
+    c = _closure.c
+    return dict(db.execute(select(c.ancestor_id, c.depth).where(c.descendant_id == task_id)).all())
+
+
+def descendants(db: Executor, task_id: int) -> Dict[int, int]:
+    """Every task downstream of `task_id`, with the length of the shortest chain from it."""
+    c = _closure.c
+    return dict(db.execute(select(c.descendant_id, c.depth).where(c.ancestor_id == task_id)).all())
+
+
+def _descendant_ids(db: Executor, task_ids: Iterable[int]) -> Set[int]:
+    c = _closure.c
+    found = set()
+    for chunk in chunks(task_ids):
+        found.update(db.execute(select(c.descendant_id).where(c.ancestor_id.in_(chunk))).scalars())
+    return found
+
+
+def add_edges(db: Executor, task_id: int, blocker_ids: Iterable[int]):
+    """Extend the closure with new edges `task_id` -> each of `blocker_ids`, already written.
+
+    Each new pair's depth is the shortest of its chains through the new
+    edges; pairs that were already connected keep the shorter depth.
+    """
+    blocker_ids = list(blocker_ids)
+    if not blocker_ids:
+        return
+    c = _closure.c
+    up = union_all(
+        select(_edges.depends_on_id.label("ancestor_id"), literal(1).label("depth"))
+        .where(_edges.task_id == task_id, _edges.depends_on_id.in_(blocker_ids)),
+        select(c.ancestor_id, (c.depth + 1).label("depth")).where(c.descendant_id.in_(blocker_ids)),
+    ).subquery("up")
+    down = union_all(
+        select(literal(task_id).label("descendant_id"), literal(0).label("depth")),
+        select(c.descendant_id, c.depth).where(c.ancestor_id == task_id),
+    ).subquery("down")
+
+    stmt = insert(_closure).from_select(
+        ["ancestor_id", "descendant_id", "depth"],
+        select(up.c.ancestor_id, down.c.descendant_id, func.min(up.c.depth + down.c.depth))
+        .select_from(up.join(down, true()))
+        .where(true())  # SQLite needs a WHERE before GROUP BY ... ON CONFLICT to parse the upsert
+        .group_by(up.c.ancestor_id, down.c.descendant_id)
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[c.ancestor_id, c.descendant_id],
+        set_={"depth": func.min(c.depth, stmt.excluded.depth)},
+    ))
+
+
+def _levels(db: Executor, task_ids: Set[int]) -> List[List[int]]:
+    """`task_ids` in topological levels: each task after every blocker it has in the set."""
+    blockers = defaultdict(set)
+    for chunk in chunks(task_ids):
+        for task_id, depends_on_id in db.execute(
+            select(_edges.task_id, _edges.depends_on_id).where(_edges.task_id.in_(chunk))
+        ):
+            if depends_on_id in task_ids:
+                blockers[task_id].add(depends_on_id)
+
+    dependents = defaultdict(list)
+    for task_id, ids in blockers.items():
+        for blocker_id in ids:
+            dependents[blocker_id].append(task_id)
+    waiting = {task_id: len(blockers[task_id]) for task_id in task_ids}
+    level = [task_id for task_id, count in waiting.items() if count == 0]
+    levels, placed = [], 0
+    while level:
+        levels.append(level)
+        placed += len(level)
+        following = []
+        for task_id in level:
+            for dependent in dependents[task_id]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    following.append(dependent)
+        level = following
+    if placed < len(task_ids):
+        # A cycle from before cycles were rejected: its tasks get their rows from outside it only
+        levels.append([task_id for task_id, count in waiting.items() if count > 0])
+    return levels
+
+
+def recompute(db: Executor, task_ids: Iterable[int]):
+    """Rewrite the closure rows of `task_ids` and everything downstream of them.
+
+    Call after changing the edges out of `task_ids` (or deleting tasks),
+    before the closure is read again. Rows upstream of the affected tasks
+    are unaffected and are reused.
+    """
+    affected = set(task_ids)
+    if not affected:
+        return
+    affected |= _descendant_ids(db, affected)
+    c = _closure.c
+    for chunk in chunks(affected):
+        db.execute(delete(_closure).where(c.descendant_id.in_(chunk)))
+
+    for level in _levels(db, affected):
+        for chunk in chunks(level):
+            pairs = union_all(
+                select(_edges.depends_on_id.label("ancestor_id"), _edges.task_id.label("descendant_id"),
+                       literal(1).label("depth"))
+                .where(_edges.task_id.in_(chunk)),
+                select(c.ancestor_id, _edges.task_id, c.depth + 1)
+                .join(models.task_dependencies, c.descendant_id == _edges.depends_on_id)
+                .where(_edges.task_id.in_(chunk)),
+            ).subquery("pairs")
+            db.execute(insert(_closure).from_select(
+                ["ancestor_id", "descendant_id", "depth"],
+                select(pairs.c.ancestor_id, pairs.c.descendant_id, func.min(pairs.c.depth))
+                .where(pairs.c.ancestor_id != pairs.c.descendant_id)
+                .group_by(pairs.c.ancestor_id, pairs.c.descendant_id)
+            ))
+
+
+def rebuild(db: Executor):
+    """Recompute the whole closure from task_dependencies."""
+    db.execute(delete(_closure))
+    recompute(db, db.execute(select(_edges.task_id).distinct()).scalars().all())
+
+
+def remove_tasks(db: Executor, task_ids: Iterable[int]):
+    """Drop the edges of tasks about to be deleted, and their closure rows with them.
+
+    Every row with a deleted ancestor has a descendant downstream of it, so
+    recomputing the deleted tasks' downstream removes those rows too.
+    """
+    task_ids = list(task_ids)
+    for chunk in chunks(task_ids):
+        db.execute(delete(models.task_dependencies).where(
+            or_(_edges.task_id.in_(chunk), _edges.depends_on_id.in_(chunk))
+        ))
+    recompute(db, task_ids)
+
+
+def open_ancestor_exists(task_id_column):
+    """SQL criterion: some task upstream of `task_id_column` is open (see graph.is_open)."""
+    c = _closure.c
+    blockers = models.Task.__table__.alias("blockers")
+    return (
+        select(c.ancestor_id)
+        .join(blockers, blockers.c.id == c.ancestor_id)
+        .where(and_(c.descendant_id == task_id_column, is_open(blockers.c)))
+        .exists()
+    )
@@ -1,13 +1,52 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, func, desc
-from typing import List, Optional, Union
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import or_, and_, not_, func, desc, literal_column, select, case, update, delete
+from typing import List, Optional, Tuple, Union
 from datetime import datetime, timedelta
-from . import models, schemas
+import base64
+import json
+from . import models, schemas, fts, tags, search_query, graph, closure
+from .database import chunks
+
+MAX_PAGE_SIZE = 500
+DEFAULT_READY_LIMIT = 20
+# Spacing between neighbouring task positions; a move takes the midpoint of its
+# neighbours, and a group is only renumbered once a gap has been split down to nothing
+POSITION_GAP = 1024
 
 # Categories
 def get_categories(db: Session):
     return db.query(models.Category).all()
 
+def get_category_summaries(db: Session) -> List[dict]:
+    """Categories with open/overdue/completed task counts, from a single GROUP BY."""
+    Task = models.Task
+    counts = {
+        row.category_id: row
+        for row in db.query(
+            Task.category_id,
+            func.sum(case((Task.completed == False, 1), else_=0)).label("open_count"),
+            func.sum(case((and_(Task.completed == False, Task.due_date < datetime.now()), 1), else_=0)).label("overdue_count"),
+            func.sum(case((Task.completed == True, 1), else_=0)).label("completed_count"),
+        ).filter(
+            Task.archived == False,
+            Task.category_id != None
+        ).group_by(Task.category_id)
+    }
+
+    summaries = []
+    for c in get_categories(db):
+        row = counts.get(c.id)
+        summaries.append({
+            "id": c.id,
+            "name": c.name,
+            "query": c.query,
+            "open_count": row.open_count if row else 0,
+            "overdue_count": row.overdue_count if row else 0,
+            "completed_count": row.completed_count if row else 0,
+        })
+    return summaries
+
 def get_category(db: Session, category_id: int):
     return db.query(models.Category).filter(models.Category.id == category_id).first()
 
@@ -28,25 +67,113 @@ def delete_category(db: Session, category_id: int):
     return db_category
 
 def clear_all_data(db: Session):
-    """Delete all tasks and categories."""
+    """Delete all tasks, their dependencies and all categories.
+
+    Runs in the caller's transaction; the caller commits.
+    """
+    db.execute(delete(models.task_dependencies))
+    db.execute(delete(models.task_closure))
     db.query(models.Task).delete()
     db.query(models.Category).delete()
-    db.commit()
 
 # Tasks
-def get_task(db: Session, task_id: int):
+# Subtasks follow their parent's archived state and category (see _update_subtree)
+SUBTREE_FIELDS = ("archived", "category_id")
+
+def _subtree(task_ids):
+    """Recursive CTE of the ids of `task_ids` (a list or an id subquery) and all their subtasks, however deep."""
+    # Nested inside the statement that uses it: sqlite3 reports no rowcount for an UPDATE/DELETE led by WITH
+    tree = select(models.Task.id).where(models.Task.id.in_(task_ids)).cte("subtree", recursive=True, nesting=True)
+    # UNION rather than UNION ALL, so a parent_id loop in old data ends instead of recursing forever
+    return tree.union(select(models.Task.id).join(tree, models.Task.parent_id == tree.c.id))
+
+def prefetch_task_trees(db: Session, tasks: List[models.Task]):
+    """Load the subtask trees and dependencies of `tasks` up front.
+
+    Serializing a task touches `subtasks`, `blocked_by` and `blocking`; left
+    lazy, that is several SELECTs per task per level. This reads every tree in
+    one recursive query (per IN (...) chunk of roots), links children to parents
+    in a single pass, and adds two queries for dependencies.
+    """
+    nodes = {}
+    root_chunks = list(chunks(t.id for t in tasks))
+    for chunk in root_chunks:
+        tree = _subtree(chunk)
+        for task in (
+            db.query(models.Task)
+            .filter(models.Task.id.in_(select(tree.c.id)))
+            .order_by(models.Task.id)
+        ):
+            nodes.setdefault(task.id, task)
+    if len(root_chunks) > 1:
+        # Keep children in id order across chunks
+        nodes = dict(sorted(nodes.items()))
+    for task in tasks:
+        nodes.setdefault(task.id, task)
+
+    children = {task_id: [] for task_id in nodes}
+    for task in nodes.values():
+        if task.parent_id in children and task.parent_id != task.id:
+            children[task.parent_id].append(task)
+    for task_id, task in nodes.items():
+        set_committed_value(task, "subtasks", children[task_id])
+
+    blocked_by = {task_id: [] for task_id in nodes}
+    blocking = {task_id: [] for task_id in nodes}
+    edges = models.task_dependencies.c
+    for chunk in chunks(nodes):
+        for task_id, depends_on_id in db.execute(
+            select(edges.task_id, edges.depends_on_id)
+            .where(or_(edges.task_id.in_(chunk), edges.depends_on_id.in_(chunk)))
+        ):
+            if task_id in blocked_by:
+                blocked_by[task_id].append(depends_on_id)
+            if depends_on_id in blocking:
+                blocking[depends_on_id].append(task_id)
+
+    # Dependency endpoints outside the loaded trees
+    related = dict(nodes)
+    missing = {i for ids in (*blocked_by.values(), *blocking.values()) for i in ids} - related.keys()
+    for chunk in chunks(missing):
+        for task in db.query(models.Task).filter(models.Task.id.in_(chunk)):
+            related[task.id] = task
+
+    for task_id, task in nodes.items():
+        set_committed_value(task, "blocked_by", [related[i] for i in blocked_by[task_id] if i in related])
+        set_committed_value(task, "blocking", [related[i] for i in blocking[task_id] if i in related])
+    return tasks
+
+def _load_task(db: Session, task_id: int):
     return db.query(models.Task).filter(models.Task.id == task_id).first()
 
-def get_tasks(
-    db: Session,
-    category_id: Optional[int] = None,
-    search: Optional[str] = None,
-    show_archived: bool = False,
-    priority: Optional[int] = None
-):
-    query = db.query(models.Task)
+def get_task(db: Session, task_id: int):
+    task = _load_task(db, task_id)
+    if task:
+        prefetch_task_trees(db, [task])
+    return task
+
+def get_tasks_by_ids(db: Session, task_ids: List[int]) -> List[models.Task]:
+    """Load the given tasks (missing ids are skipped), with their trees prefetched."""
+    tasks = []
+    for chunk in chunks(task_ids):
+        tasks.extend(db.query(models.Task).filter(models.Task.id.in_(chunk)))
+    prefetch_task_trees(db, tasks)
+    return tasks
+
+def latest_change_seq(db: Session) -> int:
+    return db.execute(select(func.coalesce(func.max(models.change_log.c.seq), 0))).scalar()
 
-    # If category_id is provided, check if it's a smart category
+def get_changes(db: Session, since: int, limit: int = MAX_PAGE_SIZE):
+    """change_log rows after sequence number `since`, oldest first."""
+    return db.execute(
+        select(models.change_log)
+        .where(models.change_log.c.seq > since)
+        .order_by(models.change_log.c.seq)
+        .limit(limit)
+    ).all()
+
+def _resolve_smart_category(db: Session, category_id: Optional[int], search: Optional[str]):
+    """Fold a smart category's saved query into the search; returns (category_id, search)."""
     if category_id is not None:
         db_category = get_category(db, category_id)
         if db_category and db_category.query:
@@ -57,64 +184,37 @@ def get_tasks(
                 search = db_category.query
             # Don't filter by category_id since the smart query handles it
             category_id = None
+    return category_id, search
+
+def search_is_time_dependent(db: Session, category_id: Optional[int] = None, search: Optional[str] = None) -> bool:
+    """Whether the results can change with the clock alone (e.g. `is:overdue`)."""
+    _, search = _resolve_smart_category(db, category_id, search)
+    if not search:
+        return False
+    return search_query.compile_search(search_query.normalize(search), fts.is_available(db)).uses_now
+
+def _build_task_query(
+    db: Session,
+    category_id: Optional[int] = None,
+    search: Optional[str] = None,
+    show_archived: bool = False,
+    priority: Optional[int] = None
+):
+    """Build the filtered task query and its sort keys, as (expression, ascending) pairs."""
+    query = db.query(models.Task)
+    rank = None
+    category_id, search = _resolve_smart_category(db, category_id, search)
 
     if search:
-        # Split search into tokens
-        tokens = search.split()
-        filters = []
-        remaining_search = []
-        
-        for token in tokens:
-            if token.lower().startswith('is:'):
-                val = token[3:].lower()
-                if val == 'overdue':
-                    filters.append(models.Task.due_date < datetime.now())
-                    filters.append(models.Task.completed == False)
-                elif val == 'completed':
-                    filters.append(models.Task.completed == True)
-                elif val == 'pending':
-                    filters.append(models.Task.completed == False)
-                elif val == 'archived':
-                    show_archived = True
-                    filters.append(models.Task.archived == True)
-            elif token.lower().startswith('priority:') or token.lower().startswith('p:'):
-                parts = token.split(':')
-                if len(parts) > 1:
-                    val = parts[1].lower()
-                    p_map = {'high': 0, 'h': 0, 'normal': 1, 'n': 1, 'low': 2, 'l': 2}
-                    if val in p_map:
-                        filters.append(models.Task.priority == p_map[val])
-                    elif val.isdigit():
-                        filters.append(models.Task.priority == int(val))
-            elif token.lower().startswith('has:'):
-                val = token[4:].lower()
-                if val == 'due':
-                    filters.append(models.Task.due_date != None)
-                elif val == 'tags':
-                    filters.append(models.Task.hashtags != None)
-                    filters.append(models.Task.hashtags != '')
-                elif val in ('description', 'desc'):
-                    filters.append(models.Task.description != None)
-                    filters.append(models.Task.description != '')
-            elif token.lower().startswith('category:'):
-                parts = token.split(':')
-                if len(parts) > 1:
-                    cat_name = parts[1]
-                    query = query.join(models.Category, isouter=True).filter(models.Category.name.ilike(f"%{cat_name}%"))
-            else:
-                remaining_search.append(token)
-
-        if filters:
-            query = query.filter(*filters)
-
-        if remaining_search:
-            text_search = " ".join(remaining_search)
-            search_filter = or_(
-                models.Task.title.ilike(f"%{text_search}%"),
-                models.Task.description.ilike(f"%{text_search}%"),
-                models.Task.hashtags.ilike(f"%{text_search}%")
-            )
-            query = query.filter(search_filter)
+        plan = search_query.compile_search(search_query.normalize(search), fts.is_available(db))
+        if plan.criteria:
+            query = query.filter(*plan.criteria)
+        if plan.hits is not None:
+            query = query.join(plan.hits, plan.hits.c.task_id == models.Task.id)
+            rank = plan.hits.c.rank
+        if plan.uses_now:
+            query = query.params(now=datetime.now())
+        show_archived = show_archived or plan.includes_archived
     else:
         # Only show top-level tasks if not searching
         query = query.filter(models.Task.parent_id == None)
@@ -128,7 +228,115 @@ def get_tasks(
     if priority is not None:
         query = query.filter(models.Task.priority == priority)
 
-    return query.order_by(models.Task.priority.asc(), models.Task.position.asc(), models.Task.id.desc()).all()
+    # Within a priority group, full-text matches are ordered by relevance (BM25).
+    # The coalesce() expressions match the ix_tasks_list_order index (see migrations.py).
+    sort_keys = [(func.coalesce(models.Task.priority, literal_column("1")), True)]
+    if rank is not None:
+        sort_keys.append((rank, True))
+    sort_keys += [
+        (func.coalesce(models.Task.position, literal_column("0")), True),
+        (models.Task.id, False),
+    ]
+    return query, sort_keys
+
+def _order_by(sort_keys):
+    return [expr.asc() if ascending else expr.desc() for expr, ascending in sort_keys]
+
+def encode_cursor(values) -> str:
+    """Encode the sort-key values of the last row of a page as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, key_count: int) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != key_count:
+        raise ValueError("Invalid cursor")
+    # Only scalars can be bound as sort keys; anything else would fail in the query
+    if not all(v is None or (isinstance(v, (int, float, str)) and not isinstance(v, bool)) for v in values):
+        raise ValueError("Invalid cursor")
+    return values
+
+def _after_cursor(sort_keys, values):
+    """Keyset predicate: rows strictly after `values` in sort order."""
+    clauses = []
+    for i, (expr, ascending) in enumerate(sort_keys):
+        equal_prefix = [sort_keys[j][0] == values[j] for j in range(i)]
+        beyond = expr > values[i] if ascending else expr < values[i]
+        clauses.append(and_(*equal_prefix, beyond))
+    return or_(*clauses)
+
+def get_tasks(
+    db: Session,
+    category_id: Optional[int] = None,
+    search: Optional[str] = None,
+    show_archived: bool = False,
+    priority: Optional[int] = None
+):
+    query, sort_keys = _build_task_query(db, category_id, search, show_archived, priority)
+    return prefetch_task_trees(db, query.order_by(*_order_by(sort_keys)).all())
+
+def get_tasks_page(
+    db: Session,
+    limit: int,
+    cursor: Optional[str] = None,
+    category_id: Optional[int] = None,
+    search: Optional[str] = None,
+    show_archived: bool = False,
+    priority: Optional[int] = None
+) -> Tuple[List[models.Task], Optional[str]]:
+    """Return one page of get_tasks() results and the cursor of the next page (None on the last page).
+
+    Pages are keyed on the (priority, [rank,] position, id) sort, so each page
+    is an index range scan no matter how deep into the list it is.
+    """
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    query, sort_keys = _build_task_query(db, category_id, search, show_archived, priority)
+    if cursor:
+        query = query.filter(_after_cursor(sort_keys, decode_cursor(cursor, len(sort_keys))))
+
+    rows = (
+        query.add_columns(*[expr for expr, _ in sort_keys])
+        .order_by(*_order_by(sort_keys))
+        .limit(limit + 1)
+        .all()
+    )
+    tasks = prefetch_task_trees(db, [row[0] for row in rows[:limit]])
+    next_cursor = encode_cursor(rows[limit - 1][1:]) if len(rows) > limit else None
+    return tasks, next_cursor
+
+# Most urgent first: priority, then due date (undated last), then list position.
+# The expressions match the ix_tasks_ready index (see migrations.py).
+READY_ORDER = (
+    func.coalesce(models.Task.priority, literal_column("1")),
+    models.Task.due_date.is_(None),
+    models.Task.due_date,
+    func.coalesce(models.Task.position, literal_column("0")),
+    models.Task.id,
+)
+
+def get_ready_tasks(db: Session, limit: int = DEFAULT_READY_LIMIT) -> List[models.Task]:
+    """Open tasks with nothing open upstream of them, most urgent first.
+
+    Reads the ix_tasks_ready index in order and probes the closure table for
+    each candidate, so it stops after `limit` ready tasks instead of ranking
+    every open one.
+    """
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    tasks = (
+        db.query(models.Task)
+        .filter(graph.is_open(models.Task), not_(closure.open_ancestor_exists(models.Task.id)))
+        .order_by(*READY_ORDER)
+        .limit(min(limit, MAX_PAGE_SIZE))
+        .all()
+    )
+    return prefetch_task_trees(db, tasks)
 
 def create_task(db: Session, task: schemas.TaskCreate):
     task_data = task.dict()
@@ -140,7 +348,7 @@ def create_task(db: Session, task: schemas.TaskCreate):
         models.Task.priority == task_data.get('priority', 1),
         models.Task.parent_id == task_data.get('parent_id')
     ).scalar()
-    task_data['position'] = (max_pos or 0) + 1
+    task_data['position'] = (max_pos or 0) + POSITION_GAP
 
     db_task = models.Task(**task_data)
     
@@ -149,12 +357,61 @@ def create_task(db: Session, task: schemas.TaskCreate):
         db_task.blocked_by = blockers
 
     db.add(db_task)
+    db.flush()
+    closure.add_edges(db, db_task.id, db_task.blocked_by_ids)
+    tags.sync_task_tags(db, [db_task.id])
     db.commit()
     db.refresh(db_task)
     return db_task
 
+def next_due_date(due_date: datetime, recurrence: str) -> Optional[datetime]:
+    """The due date after `due_date` for a recurrence pattern, or None if it isn't understood."""
+    r = recurrence.lower()
+    if r == 'daily':
+        return due_date + timedelta(days=1)
+    if r == 'weekly':
+        return due_date + timedelta(weeks=1)
+    if r == 'monthly':
+        # Simplified monthly: just add 30 days
+        return due_date + timedelta(days=30)
+    units = {'d': 'days', 'w': 'weeks'}
+    if r[-1:] in units:
+        try:
+            return due_date + timedelta(**{units[r[-1]]: int(r[:-1])})
+        except ValueError:
+            return None
+    return None
+
+def roll_over_recurring_tasks(db: Session) -> int:
+    """Move completed recurring tasks on to their next due date.
+
+    update_task does this when a task is completed; bulk updates and imports
+    don't, and leave recurring tasks completed until this catches them.
+    """
+    count = 0
+    for db_task in db.query(models.Task).filter(
+        models.Task.completed == True,
+        models.Task.archived == False,
+        models.Task.recurrence.is_not(None),
+        models.Task.due_date.is_not(None)
+    ):
+        new_due_date = next_due_date(db_task.due_date, db_task.recurrence)
+        if new_due_date is not None:
+            db_task.completed = False
+            db_task.due_date = new_due_date
+            count += 1
+    db.commit()
+    return count
+
 def update_task(db: Session, task_id: int, task_update: Union[schemas.TaskCreate, schemas.TaskUpdate, dict]):
-    db_task = get_task(db, task_id)
+    """Update a task; returns None if it doesn't exist.
+
+    Archiving, unarchiving or recategorizing a task does the same to all its
+    subtasks, and a task moved under a new parent takes that parent's category
+    along with its subtasks. Raises ValueError if new blockers would form a
+    cycle, or if the new parent is missing or inside the task's own subtree.
+    """
+    db_task = _load_task(db, task_id)
     if not db_task:
         return None
 
@@ -164,7 +421,23 @@ def update_task(db: Session, task_id: int, task_update: Union[schemas.TaskCreate
         update_data = task_update.dict(exclude_unset=True)
     
     blocked_by_ids = update_data.pop('blocked_by_ids', None)
-    
+    if blocked_by_ids:
+        graph.check_blockers(db, task_id, blocked_by_ids)
+
+    # Only changes cascade: clients send the whole task back on every save
+    subtree_updates = {
+        k: update_data[k] for k in SUBTREE_FIELDS if k in update_data and update_data[k] != getattr(db_task, k)
+    }
+    new_parent_id = update_data.get('parent_id')
+    if new_parent_id is not None and new_parent_id != db_task.parent_id:
+        if new_parent_id in _subtree_ids(db, [task_id]):
+            raise ValueError(f"Task {new_parent_id} is a subtask of task {task_id}; it can't become its parent")
+        parent = _load_task(db, new_parent_id)
+        if not parent:
+            raise ValueError(f"Parent task {new_parent_id} not found")
+        # A moved subtree joins its new parent's category unless told otherwise
+        subtree_updates.setdefault('category_id', parent.category_id)
+
     for var, value in update_data.items():
         # Preserve existing position if not explicitly set
         if var == 'position' and value is None:
@@ -175,40 +448,31 @@ def update_task(db: Session, task_id: int, task_update: Union[schemas.TaskCreate
         setattr(db_task, var, value)
 
     if blocked_by_ids is not None:
+        old_ids = set(db_task.blocked_by_ids)
         blockers = db.query(models.Task).filter(models.Task.id.in_(blocked_by_ids)).all()
         db_task.blocked_by = blockers
+        db.flush()
+        new_ids = set(db_task.blocked_by_ids)
+        if old_ids - new_ids:
+            closure.recompute(db, [task_id])
+        else:
+            closure.add_edges(db, task_id, new_ids - old_ids)
 
-    # Handle recurring tasks
+    # Handle recurring tasks: completing one moves it to its next due date
     if db_task.completed and db_task.recurrence and db_task.due_date:
-        # Move due date forward
-        new_due_date = db_task.due_date
-        
-        r = db_task.recurrence.lower()
-        if r == 'daily':
-            new_due_date += timedelta(days=1)
-        elif r == 'weekly':
-            new_due_date += timedelta(weeks=1)
-        elif r == 'monthly':
-            # Simplified monthly: just add 30 days
-            new_due_date += timedelta(days=30)
-        elif r.endswith('d'):
-            try:
-                days = int(r[:-1])
-                new_due_date += timedelta(days=days)
-            except ValueError:
-                pass
-        elif r.endswith('w'):
-            try:
-                weeks = int(r[:-1])
-                new_due_date += timedelta(weeks=weeks)
-            except ValueError:
-                pass
-        
-        # If we successfully calculated a new date, reset completed status and update due date
-        if new_due_date != db_task.due_date:
+        new_due_date = next_due_date(db_task.due_date, db_task.recurrence)
+        if new_due_date is not None:
             db_task.completed = False
             db_task.due_date = new_due_date
 
+    if 'hashtags' in update_data:
+        db.flush()
+        tags.sync_task_tags(db, [task_id])
+
+    if subtree_updates:
+        db.flush()
+        _update_subtree(db, [task_id], subtree_updates)
+
     db.commit()
     db.refresh(db_task)
     return db_task
@@ -224,38 +488,196 @@ def bulk_update_tasks(db: Session, task_ids: List[int], updates: dict):
         return 0
 
     count = db.query(models.Task).filter(models.Task.id.in_(task_ids)).update(clean_updates, synchronize_session=False)
+    _update_subtree(db, task_ids, {k: v for k, v in clean_updates.items() if k in SUBTREE_FIELDS})
+    if 'hashtags' in clean_updates:
+        tags.sync_task_tags(db, task_ids)
     db.commit()
     return count
 
 def bulk_delete_tasks(db: Session, task_ids: List[int]):
-    """Delete multiple tasks at once."""
+    """Delete multiple tasks at once, with their subtasks. Returns the number of tasks deleted."""
     if not task_ids:
         return 0
-    
-    count = db.query(models.Task).filter(models.Task.id.in_(task_ids)).delete(synchronize_session=False)
+
+    count = _delete_subtrees(db, task_ids)
     db.commit()
     return count
 
+def _subtree_ids(db: Session, task_ids: List[int]) -> List[int]:
+    """`task_ids` and the ids of all their subtasks."""
+    found = {}
+    for chunk in chunks(task_ids):
+        found.update(dict.fromkeys(db.execute(select(_subtree(chunk).c.id)).scalars()))
+    return list(found)
+
+def _delete_subtrees(db: Session, task_ids: List[int]) -> int:
+    """Delete `task_ids` with all their subtasks, their edges and their closure rows. Returns the tasks deleted."""
+    closure.remove_tasks(db, _subtree_ids(db, task_ids))
+    count = 0
+    for chunk in chunks(task_ids):
+        count += db.execute(
+            delete(models.Task).where(models.Task.id.in_(select(_subtree(chunk).c.id))),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+    db.expire_all()
+    return count
+
+def _update_subtree(db: Session, task_ids: List[int], values: dict) -> int:
+    """Set `values` on `task_ids` and all their subtasks. Returns the rows written."""
+    if not values:
+        return 0
+    count = 0
+    for chunk in chunks(task_ids):
+        count += db.execute(
+            update(models.Task).where(models.Task.id.in_(select(_subtree(chunk).c.id))).values(values),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+    db.expire_all()
+    return count
+
 def delete_task(db: Session, task_id: int):
-    db_task = get_task(db, task_id)
+    db_task = _load_task(db, task_id)
     if db_task:
-        db.delete(db_task)
+        _delete_subtrees(db, [task_id])
         db.commit()
     return db_task
 
-def archive_completed_tasks(db: Session, category_id: Optional[int] = None):
-    query = db.query(models.Task).filter(
+def get_task_dependencies(db: Session, task_id: int) -> Optional[dict]:
+    """Every task upstream and downstream of a task, nearest first (None if it doesn't exist)."""
+    if not _load_task(db, task_id):
+        return None
+    def links(depths):
+        return [{"id": i, "depth": d} for i, d in sorted(depths.items(), key=lambda item: (item[1], item[0]))]
+    return {
+        "blockers": links(closure.ancestors(db, task_id)),
+        "downstream": links(closure.descendants(db, task_id)),
+    }
+
+def archive_completed_tasks(db: Session, category_id: Optional[int] = None, due_before: Optional[datetime] = None):
+    """Archive completed tasks, with their subtasks, in one statement.
+
+    Returns the number of completed tasks archived; subtasks archived along
+    with them aren't counted.
+    """
+    completed = select(models.Task.id).where(
         models.Task.completed == True,
         models.Task.archived == False
     )
     if category_id is not None:
-        query = query.filter(models.Task.category_id == category_id)
+        completed = completed.where(models.Task.category_id == category_id)
+    if due_before is not None:
+        completed = completed.where(models.Task.due_date < due_before)
 
-    count = query.update({"archived": True})
+    count = db.execute(select(func.count()).select_from(completed.subquery())).scalar()
+    db.execute(
+        update(models.Task)
+        .where(models.Task.id.in_(select(_subtree(completed).c.id)), models.Task.archived.isnot(True))
+        .values(archived=True),
+        execution_options={"synchronize_session": False},
+    )
     db.commit()
     return count
 
 def reorder_tasks(db: Session, task_ids: List[int]):
-    for index, task_id in enumerate(task_ids):
-        db.query(models.Task).filter(models.Task.id == task_id).update({"position": index})
+    """Renumber the given tasks in list order (prefer move_task, which writes one row)."""
+    if task_ids:
+        db.execute(update(models.Task), [
+            {"id": task_id, "position": (index + 1) * POSITION_GAP}
+            for index, task_id in enumerate(task_ids)
+        ])
+    db.commit()
+
+def _position_group(db: Session, task: models.Task):
+    """Tasks sharing `task`'s priority and parent, i.e. the list it is positioned in."""
+    return db.query(models.Task).filter(
+        models.Task.priority == task.priority,
+        models.Task.parent_id == task.parent_id
+    )
+
+def _rebalance_positions(db: Session, task: models.Task) -> List[int]:
+    """Respace `task`'s group at POSITION_GAP intervals, keeping its order. Returns the ids written."""
+    ids = [
+        row.id for row in _position_group(db, task)
+        .with_entities(models.Task.id)
+        .order_by(func.coalesce(models.Task.position, 0).asc(), models.Task.id.desc())
+    ]
+    db.execute(update(models.Task), [
+        {"id": task_id, "position": (index + 1) * POSITION_GAP}
+        for index, task_id in enumerate(ids)
+    ])
+    db.expire_all()
+    return ids
+
+def move_task(
+    db: Session,
+    task_id: int,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    priority: Optional[int] = None
+) -> Optional[List[models.Task]]:
+    """Move a task to sit after `after_id` and/or before `before_id`, optionally into another priority list.
+
+    Priority and position change in one transaction. Normally only the moved
+    task is written: it takes the midpoint of its neighbours' positions. If
+    the neighbours are adjacent, the target group is respaced first.
+
+    Returns the affected tasks, moved task first (None if it doesn't exist);
+    raises ValueError if a neighbour is missing or in another list, or if
+    `after_id` doesn't come before `before_id`.
+    """
+    db_task = _load_task(db, task_id)
+    if not db_task:
+        return None
+
+    if priority is not None and priority != db_task.priority:
+        db_task.priority = priority
+        db.flush()
+
+    def neighbour(neighbour_id):
+        if neighbour_id is None:
+            return None
+        other = _load_task(db, neighbour_id)
+        if not other or other.id == task_id:
+            raise ValueError(f"Invalid neighbour task {neighbour_id}")
+        if other.priority != db_task.priority or other.parent_id != db_task.parent_id:
+            raise ValueError(f"Task {neighbour_id} is not in the same list")
+        return other
+
+    def bounds():
+        after, before = neighbour(after_id), neighbour(before_id)
+        group = _position_group(db, db_task).filter(models.Task.id != task_id)
+        position = func.coalesce(models.Task.position, 0)
+        lo = (after.position or 0) if after else None
+        hi = (before.position or 0) if before else None
+        # With one neighbour given, the other side is whatever currently follows/precedes it
+        if after and not before:
+            hi = group.filter(position > lo).with_entities(func.min(position)).scalar()
+        elif before and not after:
+            lo = group.filter(position < hi).with_entities(func.max(position)).scalar()
+        elif not after and not before:
+            lo = group.with_entities(func.max(position)).scalar()
+        return lo, hi
+
+    affected_ids = [task_id]
+    lo, hi = bounds()
+    if lo is not None and hi is not None and hi - lo < 2:
+        affected_ids += [i for i in _rebalance_positions(db, db_task) if i != task_id]
+        lo, hi = bounds()
+    if after_id is not None and before_id is not None and lo >= hi:
+        # Respacing keeps the order, so these neighbours really are the wrong way round
+        raise ValueError(f"Task {after_id} does not come before task {before_id}")
+
+    if lo is None and hi is None:
+        new_position = POSITION_GAP
+    elif hi is None:
+        new_position = lo + POSITION_GAP
+    elif lo is None:
+        new_position = hi - POSITION_GAP
+    else:
+        new_position = (lo + hi) // 2
+
+    db_task.position = new_position
     db.commit()
+
+    by_id = {t.id: t for t in get_tasks_by_ids(db, affected_ids)}
+    return [by_id[i] for i in affected_ids if i in by_id]
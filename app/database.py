@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 
@@ -8,13 +8,88 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(BASE_DIR, "sharpei.db")
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Storage profiles: PRAGMAs applied to every pooled connection.
+# "wal" lets readers (the UI, the MCP server) run while a write is in progress;
+# "compat" keeps SQLite's default rollback journal for filesystems without WAL support.
+STORAGE_PROFILES = {
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,         # ms to wait on a locked database before failing
+        "mmap_size": 268435456,       # 256 MiB of memory-mapped reads
+        "cache_size": -65536,         # negative = KiB, i.e. 64 MiB page cache
+        "temp_store": "MEMORY",
+    },
+    "compat": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+        "mmap_size": 0,
+        "cache_size": -2000,
+        "temp_store": "DEFAULT",
+    },
+}
+
+# Settings, overridable through the environment
+DB_PROFILE = os.environ.get("SHARPEI_DB_PROFILE", "wal")
+DB_POOL_SIZE = int(os.environ.get("SHARPEI_DB_POOL_SIZE", "8"))
+DB_MAX_OVERFLOW = int(os.environ.get("SHARPEI_DB_MAX_OVERFLOW", "16"))
+DB_POOL_TIMEOUT = int(os.environ.get("SHARPEI_DB_POOL_TIMEOUT", "30"))
+# Keep IN (...) lists well below SQLite's bound-parameter limit
+IN_CHUNK_SIZE = 500
+
+
+def apply_pragmas(dbapi_connection, profile: str = DB_PROFILE):
+    """Apply a storage profile's PRAGMAs to a raw sqlite3 connection."""
+    pragmas = STORAGE_PROFILES[profile]
+    cursor = dbapi_connection.cursor()
+    try:
+        # journal_mode first: it is the one setting that is persisted in the file
+        cursor.execute(f"PRAGMA journal_mode={pragmas['journal_mode']}")
+        for name, value in pragmas.items():
+            if name != "journal_mode":
+                cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def create_sqlite_engine(url: str, profile: str = DB_PROFILE, **overrides):
+    """Create a pooled SQLite engine configured with the given storage profile."""
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile: {profile}")
+
+    options = {
+        "connect_args": {"check_same_thread": False},
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    options.update(overrides)
+    new_engine = create_engine(url, **options)
+
+    @event.listens_for(new_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, profile)
+
+    return new_engine
+
+
+engine = create_sqlite_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def init_db(bind=None):
+    """Create missing tables and apply pending migrations; run by every process before it serves."""
+    from . import models  # noqa: F401 - registers the tables and the migration hook on Base
+    Base.metadata.create_all(bind=bind or engine)
+
+def chunks(ids):
+    """Split `ids` into lists of at most IN_CHUNK_SIZE, one per IN (...) query."""
+    ids = list(ids)
+    for i in range(0, len(ids), IN_CHUNK_SIZE):
+        yield ids[i:i + IN_CHUNK_SIZE]
+
 def get_db():
     db = SessionLocal()
     try:
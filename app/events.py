@@ -0,0 +1,78 @@
+"""Server-sent events for task changes.
+
+Writes are recorded in `change_log` by triggers, in the same transaction as
+the write itself, so the log also covers changes made by the MCP server
+process. The `/api/events` stream polls the log and sends each changed task
+as an event:
+
+    id: <change_log seq>
+    event: task
+    data: {"op": "upsert", "task": {...}}  or  {"op": "delete", "id": 12}
+
+Clients reconnecting with `Last-Event-ID` resume right after the last change
+they saw; if those changes have been compacted away, they get a `reset`
+event and should reload.
+"""
+import json
+from typing import List, Tuple
+
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+
+from . import changes, crud, graph, schemas
+
+POLL_INTERVAL_SECONDS = 0.5
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+
+task_adapter = TypeAdapter(schemas.TaskWithSubtasks)
+
+
+def format_event(event: str, data: dict, event_id: int = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def task_change_events(db: Session, since: int) -> Tuple[int, List[str]]:
+    """Events for the task changes after `since`; returns (new high-water mark, events).
+
+    Several changes to one task collapse into a single event carrying its
+    current state, or a delete if it no longer exists. Tasks whose blocked
+    status flipped because of the changes get an upsert too.
+    """
+    if since < changes.pruned_through(db):
+        # Missed changes were compacted away: the client has to reload
+        seq = crud.latest_change_seq(db)
+        return seq, [format_event("reset", {"seq": seq}, seq)]
+
+    log = crud.get_changes(db, since)
+    if not log:
+        return since, []
+
+    latest = {}
+    for change in log:
+        if change.entity == "task":
+            latest.pop(change.entity_id, None)
+            latest[change.entity_id] = change.seq
+
+    flipped = graph.blocked_status_changed(db, since, log[-1].seq) - latest.keys()
+    tasks = {t.id: t for t in crud.get_tasks_by_ids(db, list(latest) + sorted(flipped))}
+    for task_id in sorted(flipped):
+        if task_id in tasks:
+            latest[task_id] = log[-1].seq
+
+    events = []
+    for task_id, seq in latest.items():
+        task = tasks.get(task_id)
+        if task is None:
+            data = {"op": "delete", "id": task_id}
+        else:
+            data = {"op": "upsert", "task": task_adapter.dump_python(
+                task_adapter.validate_python(task, from_attributes=True), mode="json"
+            )}
+        events.append(format_event("task", data, seq))
+    return log[-1].seq, events
@@ -0,0 +1,54 @@
+"""Full-text task search backed by the SQLite FTS5 index (see migrations.py).
+
+Free-text search terms become an FTS5 MATCH with prefix matching, and results
+are ranked with BM25. Builds of SQLite without FTS5 never get the `tasks_fts`
+table, in which case callers fall back to LIKE scans.
+"""
+import re
+import weakref
+from typing import List, Optional
+
+from sqlalchemy import column, func, literal_column, select, table, text
+from sqlalchemy.orm import Session
+
+# BM25 column weights: title, description, hashtags
+BM25_WEIGHTS = (10.0, 1.0, 5.0)
+
+tasks_fts = table("tasks_fts", column("rowid"))
+
+_availability = weakref.WeakKeyDictionary()
+
+
+def is_available(db: Session) -> bool:
+    """Check (once per engine) whether the FTS index exists in this database."""
+    engine = db.get_bind()
+    if engine not in _availability:
+        found = db.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks_fts'"
+        )).first()
+        _availability[engine] = found is not None
+    return _availability[engine]
+
+
+def match_expression(terms: List[str]) -> Optional[str]:
+    """Build an FTS5 query matching every term as a prefix.
+
+    Terms are quoted so user input can't inject FTS5 operators. Terms with no
+    word characters (e.g. a bare "#") are dropped; returns None if nothing is left.
+    """
+    parts = []
+    for term in terms:
+        if not re.search(r"\w", term):
+            continue
+        parts.append('"' + term.replace('"', '""') + '"*')
+    return " ".join(parts) if parts else None
+
+
+def search_subquery(match: str):
+    """Subquery of (task_id, rank) for tasks matching an FTS5 query; lower rank is better."""
+    rank = func.bm25(literal_column("tasks_fts"), *BM25_WEIGHTS)
+    return (
+        select(tasks_fts.c.rowid.label("task_id"), rank.label("rank"))
+        .where(literal_column("tasks_fts").op("MATCH")(match))
+        .subquery("fts_hits")
+    )
@@ -0,0 +1,238 @@
+"""The task dependency graph: cycle checks and transitive blocked status.
+
+A task is blocked while any task upstream of it (a blocker, a blocker's
+blocker, and so on) is still open, i.e. neither completed nor archived. A task
+is ready when it is open and not blocked.
+
+Each process keeps one DependencyGraph: the edges of `task_dependencies` as
+adjacency sets in both directions, the set of open tasks, and the blocked set
+derived from them. It is brought up to date from `change_log` (see
+changes.py), which records every task and edge write from any process, so a
+write costs work proportional to what it changed and what lies downstream of
+it. Tasks whose status flips are remembered against the change_log sequence
+number, so delta sync and live updates can re-send them although their own
+rows didn't change. The graph only reads committed data, through a connection of its own. It
+is rebuilt from the tables when the log can't bridge the gap: another database
+(a new epoch), compacted history, or more than REBUILD_AFTER_CHANGES entries.
+
+The `is:blocked` and `is:ready` search filters compute the same thing in SQL
+from the task_closure table instead (see closure.py), so they run in the
+query's own transaction and combine with every other filter. Both are kept on
+purpose: `is_blocked` is read for every serialized task, including whole
+subtask trees, and the in-memory set answers it without a query and tells
+delta sync which tasks flipped; a filter that has to page and sort with the
+rest of the search needs the status in SQL. They derive from the same edges
+and open tasks, and the tests check that they agree.
+"""
+import threading
+from collections import defaultdict, deque
+from typing import Deque, Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import and_, event, func, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import chunks
+
+REBUILD_AFTER_CHANGES = 5000
+# Refreshes whose blocked-status changes are remembered for delta sync (see blocked_status_changed)
+FLIP_HISTORY = 1000
+
+_tasks = models.Task.__table__.c
+_edges = models.task_dependencies.c
+_log = models.change_log.c
+
+# Session.info key: the graph was brought up to date in the session's current transaction
+_CHECKED = "dependency_graph_checked"
+
+
+def is_open(tasks=_tasks):
+    """SQL criterion for tasks that still block their dependents."""
+    return and_(tasks.completed.isnot(True), tasks.archived.isnot(True))
+
+
+class DependencyGraph:
+    """Adjacency sets, open tasks and blocked tasks, as of change_log sequence number `seq`."""
+
+    def __init__(self):
+        self.blockers: Dict[int, Set[int]] = defaultdict(set)
+        self.dependents: Dict[int, Set[int]] = defaultdict(set)
+        self.open: Set[int] = set()
+        self.blocked: FrozenSet[int] = frozenset()
+        self.epoch: Optional[str] = None
+        self.seq = 0
+        self.rebuilds = 0
+        # (seq, ids): tasks whose blocked status changed with the changes up to seq.
+        # The history covers every change after `flips_from`.
+        self.flips: Deque[Tuple[int, FrozenSet[int]]] = deque()
+        self.flips_from: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def is_blocked(self, task_id: int) -> bool:
+        return task_id in self.blocked
+
+    def is_ready(self, task_id: int) -> bool:
+        return task_id in self.open and task_id not in self.blocked
+
+    def depends_on(self, task_id: int, other_id: int) -> bool:
+        """Whether `task_id` is downstream of `other_id`."""
+        seen, stack = set(), [task_id]
+        while stack:
+            for blocker_id in self.blockers.get(stack.pop(), ()):
+                if blocker_id == other_id:
+                    return True
+                if blocker_id not in seen:
+                    seen.add(blocker_id)
+                    stack.append(blocker_id)
+        return False
+
+    # Keeping up with the database
+
+    def refresh(self, conn: Connection):
+        """Catch up with everything committed, incrementally where the change log allows."""
+        with self._lock:
+            epoch, latest, oldest = conn.execute(
+                select(
+                    models.data_version.c.epoch,
+                    select(func.max(_log.seq)).scalar_subquery(),
+                    select(func.min(_log.seq)).scalar_subquery(),
+                ).where(models.data_version.c.id == 1)
+            ).one()
+            latest = latest or 0
+            if epoch == self.epoch and latest == self.seq:
+                return
+            if epoch != self.epoch or latest < self.seq:
+                # Another database, or one rolled back: nothing known about what flipped before now
+                self._rebuild(conn)
+                self.flips.clear()
+                self.flips_from = latest
+            elif (oldest or 1) - 1 > self.seq or latest - self.seq > REBUILD_AFTER_CHANGES:
+                self._record_flips(latest, self._rebuild(conn))
+            else:
+                self._record_flips(latest, self._apply(conn, latest))
+            self.epoch, self.seq = epoch, latest
+
+    def _record_flips(self, seq: int, ids: FrozenSet[int]):
+        if ids:
+            self.flips.append((seq, ids))
+            if len(self.flips) > FLIP_HISTORY:
+                self.flips_from = self.flips.popleft()[0]
+
+    def blocked_status_changed(self, since: int, until: int) -> Set[int]:
+        """Tasks whose blocked status may have changed with the changes in (since, until]."""
+        with self._lock:
+            if self.flips_from is None or since < self.flips_from:
+                # Older than the history: any task with a blocker may have flipped
+                return {task_id for task_id, ids in self.blockers.items() if ids}
+            return {task_id for seq, ids in self.flips if since < seq <= until for task_id in ids}
+
+    def _rebuild(self, conn: Connection) -> FrozenSet[int]:
+        previous = self.blocked
+        blockers, dependents = defaultdict(set), defaultdict(set)
+        for task_id, depends_on_id in conn.execute(select(_edges.task_id, _edges.depends_on_id)):
+            blockers[task_id].add(depends_on_id)
+            dependents[depends_on_id].add(task_id)
+        self.blockers, self.dependents = blockers, dependents
+        self.open = set(conn.execute(select(_tasks.id).where(is_open())).scalars())
+        self.blocked = frozenset()
+        self.rebuilds += 1
+        self._update_blocked(blockers.keys())
+        return previous ^ self.blocked
+
+    def _apply(self, conn: Connection, latest: int) -> FrozenSet[int]:
+        changed, task_ids = set(), set()
+        for entity, entity_id, related_id, op in conn.execute(
+            select(_log.entity, _log.entity_id, _log.related_id, _log.op)
+            .where(_log.seq > self.seq, _log.seq <= latest, _log.entity.in_(("task", "dependency")))
+            .order_by(_log.seq)
+        ):
+            if entity == "task":
+                task_ids.add(entity_id)
+            elif op == "delete":
+                self.blockers[entity_id].discard(related_id)
+                self.dependents[related_id].discard(entity_id)
+                changed.add(entity_id)
+            else:
+                self.blockers[entity_id].add(related_id)
+                self.dependents[related_id].add(entity_id)
+                changed.add(entity_id)
+
+        # Only whether a task is open matters here; deleted tasks no longer block anything
+        for chunk in chunks(sorted(task_ids)):
+            now_open = set(conn.execute(select(_tasks.id).where(_tasks.id.in_(chunk), is_open())).scalars())
+            self.open.difference_update(chunk)
+            self.open.update(now_open)
+        return self._update_blocked(changed | task_ids)
+
+    def _update_blocked(self, changed: Iterable[int]) -> FrozenSet[int]:
+        """Recompute blocked status for `changed` tasks and everything downstream of them.
+
+        Returns the tasks whose status changed.
+        """
+        affected, stack = set(), list(changed)
+        while stack:
+            task_id = stack.pop()
+            if task_id not in affected:
+                affected.add(task_id)
+                stack.extend(self.dependents.get(task_id, ()))
+
+        # Statuses outside `affected` can't have changed. Inside it, a task is
+        # blocked if a blocker is open or itself blocked; walking down from the
+        # tasks blocked that way also terminates on cycles left by old data.
+        blocked = set(self.blocked) - affected
+        stack = [
+            task_id for task_id in affected
+            if any(b in self.open or b in blocked for b in self.blockers.get(task_id, ()))
+        ]
+        while stack:
+            task_id = stack.pop()
+            if task_id not in blocked:
+                blocked.add(task_id)
+                stack.extend(self.dependents.get(task_id, ()))
+        flipped = frozenset(blocked.symmetric_difference(self.blocked))
+        self.blocked = frozenset(blocked)
+        return flipped
+
+
+dependency_graph = DependencyGraph()
+
+
+def current(db: Optional[Session]) -> DependencyGraph:
+    """The process's graph, brought up to date once per transaction of `db`.
+
+    Without a session (e.g. a detached task), the graph is returned as it is.
+    """
+    if db is not None and not db.info.get(_CHECKED):
+        with db.get_bind().connect() as conn:
+            dependency_graph.refresh(conn)
+        db.info[_CHECKED] = True
+    return dependency_graph
+
+
+def is_blocked(db: Optional[Session], task_id: int) -> bool:
+    return current(db).is_blocked(task_id)
+
+
+def blocked_status_changed(db: Session, since: int, until: int) -> Set[int]:
+    """Tasks to re-send for the changes in (since, until], beyond those changed themselves."""
+    return current(db).blocked_status_changed(since, until)
+
+
+def check_blockers(db: Session, task_id: int, blocker_ids: Iterable[int]):
+    """Raise ValueError if making `task_id` depend on `blocker_ids` would close a cycle."""
+    graph = current(db)
+    with graph._lock:
+        for blocker_id in blocker_ids:
+            if blocker_id == task_id:
+                raise ValueError(f"Task {task_id} can't block itself")
+            if graph.depends_on(blocker_id, task_id):
+                raise ValueError(
+                    f"Task {blocker_id} already depends on task {task_id}; blocking on it would create a cycle"
+                )
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _transaction_ended(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_CHECKED, None)
@@ -1,68 +1,45 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, BackgroundTasks, UploadFile, File
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, UploadFile, File
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, func
+from sqlalchemy.exc import IntegrityError
+from pydantic import TypeAdapter
 from typing import List, Optional
-import shutil
-import os
-import glob
-from datetime import datetime, timedelta
-import json
+from datetime import datetime
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
 
-from . import models, schemas, database, crud
-from .database import engine, get_db, DB_PATH
+from . import models, schemas, database, crud, cache, versioning, events, changes, portability, scheduler, replication, schedule
+from .database import get_db
 
-models.Base.metadata.create_all(bind=engine)
+replicator = replication.Replicator()
 
-app = FastAPI(title="Sharpei")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    database.init_db(database.engine)
+    # Periodic jobs (backups, archiving, recurrence, maintenance) run here, off the request path
+    jobs = scheduler.Scheduler()
+    if scheduler.SCHEDULER_ENABLED:
+        jobs.start()
+    if replication.REPLICATION_ENABLED:
+        replicator.start()
+    yield
+    await jobs.stop()
+    await run_in_threadpool(replicator.stop)
+
+app = FastAPI(title="Sharpei", lifespan=lifespan)
+logger = logging.getLogger(__name__)
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.mount("/assets", StaticFiles(directory="assets"), name="assets")
 templates = Jinja2Templates(directory="templates")
 
-BACKUP_DIR = os.path.join(os.path.dirname(DB_PATH), "backups")
-BACKUP_INTERVAL_HOURS = 24
-
-def perform_backup():
-    """Create a timestamped backup of the database and cleanup old ones."""
-    if not os.path.exists(BACKUP_DIR):
-        os.makedirs(BACKUP_DIR)
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_path = os.path.join(BACKUP_DIR, f"sharpei_backup_{timestamp}.db")
-    
-    if os.path.exists(DB_PATH):
-        shutil.copy2(DB_PATH, backup_path)
-        
-        # Cleanup: keep last 10 backups
-        backups = sorted(glob.glob(os.path.join(BACKUP_DIR, "sharpei_backup_*.db")))
-        if len(backups) > 10:
-            for b in backups[:-10]:
-                try:
-                    os.remove(b)
-                except OSError:
-                    pass
-
-def check_and_trigger_backup(background_tasks: BackgroundTasks):
-    """Check if a new backup is needed based on cadence."""
-    if not os.path.exists(BACKUP_DIR):
-        background_tasks.add_task(perform_backup)
-        return
-
-    backups = sorted(glob.glob(os.path.join(BACKUP_DIR, "sharpei_backup_*.db")))
-    if not backups:
-        background_tasks.add_task(perform_backup)
-        return
-
-    # Check if latest backup is older than interval
-    latest_backup = backups[-1]
-    mtime = os.path.getmtime(latest_backup)
-    last_backup_time = datetime.fromtimestamp(mtime)
-    
-    if datetime.now() - last_backup_time > timedelta(hours=BACKUP_INTERVAL_HOURS):
-        background_tasks.add_task(perform_backup)
+task_list_adapter = TypeAdapter(List[schemas.TaskWithSubtasks])
 
 @app.get("/")
 def read_root(request: Request):
@@ -78,127 +55,141 @@ def get_service_worker():
 
 # Data Portability
 @app.get("/api/data/export")
-def export_data(db: Session = Depends(get_db)):
-    """Export all categories and tasks as JSON."""
-    categories = crud.get_categories(db)
-    # Get all tasks including archived and subtasks
-    tasks = db.query(models.Task).all()
-    
-    data = {
-        "exported_at": datetime.now().isoformat(),
-        "categories": [
-            {"id": c.id, "name": c.name, "query": c.query} for c in categories
-        ],
-        "tasks": [
-            {
-                "title": t.title,
-                "description": t.description,
-                "due_date": t.due_date.isoformat() if t.due_date else None,
-                "priority": t.priority,
-                "position": t.position,
-                "hashtags": t.hashtags,
-                "recurrence": t.recurrence,
-                "completed": t.completed,
-                "archived": t.archived,
-                "category_id": t.category_id,
-                "parent_id": t.parent_id,
-                "blocked_by_ids": t.blocked_by_ids,
-                "old_id": t.id
-            } for t in tasks
-        ]
-    }
-    
-    filename = f"sharpei_export_{datetime.now().strftime('%Y%m%d')}.json"
-    return JSONResponse(
-        content=data,
+def export_data(format: str = "json"):
+    """Export all categories and tasks, streamed batch by batch (see portability.py)."""
+    if format not in portability.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown export format: {format}")
+    filename = f"sharpei_export_{datetime.now().strftime('%Y%m%d')}.{format}"
+    return StreamingResponse(
+        portability.stream_export(database.engine, format),
+        media_type=portability.EXPORT_FORMATS[format],
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
 @app.post("/api/data/import")
-async def import_data(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    """Import data from JSON, clearing existing data."""
+def import_data(file: UploadFile = File(...), format: Optional[str] = None, mode: str = "replace",
+                db: Session = Depends(get_db)):
+    """Replace or merge data from an export file, read and written in batches (see portability.py)."""
+    if format is None:
+        format = "ndjson" if (file.filename or "").endswith(".ndjson") else "json"
+    if format not in portability.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown import format: {format}")
+    if mode not in portability.IMPORT_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown import mode: {mode}")
     try:
-        contents = await file.read()
-        data = json.loads(contents)
-        
-        # Simple validation
-        if "tasks" not in data or "categories" not in data:
-            raise HTTPException(status_code=400, detail="Invalid export format")
-            
-        # Clear existing
-        crud.clear_all_data(db)
-        
-        # Map old category IDs to new ones
-        cat_id_map = {}
-        for cat_data in data["categories"]:
-            old_id = cat_data.get("id")
-            new_cat = crud.create_category(db, schemas.CategoryCreate(
-                name=cat_data["name"],
-                query=cat_data.get("query")
-            ))
-            if old_id is not None:
-                cat_id_map[old_id] = new_cat.id
-                
-        # Map old task IDs to new ones (for subtasks and dependencies)
-        task_id_map = {}
-        # First pass: create all tasks
-        for task_data in data["tasks"]:
-            # Prepare data
-            old_id = task_data.pop("old_id", None)
-            old_cat_id = task_data.pop("category_id", None)
-            old_parent_id = task_data.pop("parent_id", None)
-            old_blocked_by = task_data.pop("blocked_by_ids", [])
-            
-            # Map category
-            task_data["category_id"] = cat_id_map.get(old_cat_id)
-            # Temporarily nullify parent_id for second pass
-            task_data["parent_id"] = None
-            
-            # Convert due_date string back to datetime
-            if task_data.get("due_date"):
-                task_data["due_date"] = datetime.fromisoformat(task_data["due_date"])
-            
-            # Create task using model directly to preserve all fields
-            db_task = models.Task(**task_data)
-            db.add(db_task)
-            db.flush() # Get new ID
-            
-            if old_id is not None:
-                task_id_map[old_id] = {
-                    "new_id": db_task.id,
-                    "old_parent_id": old_parent_id,
-                    "old_blocked_by": old_blocked_by
-                }
-        
-        # Second pass: restore parent/subtask relationships and dependencies
-        for old_id, mapping in task_id_map.items():
-            updates = {}
-            if mapping["old_parent_id"] is not None:
-                new_parent_id = task_id_map.get(mapping["old_parent_id"], {}).get("new_id")
-                if new_parent_id:
-                    updates["parent_id"] = new_parent_id
-            
-            if updates:
-                db.query(models.Task).filter(models.Task.id == mapping["new_id"]).update(updates)
-            
-            if mapping["old_blocked_by"]:
-                new_blocker_ids = [task_id_map[oid]["new_id"] for oid in mapping["old_blocked_by"] if oid in task_id_map]
-                if new_blocker_ids:
-                    crud.update_task(db, mapping["new_id"], {"blocked_by_ids": new_blocker_ids})
-        
-        db.commit()
-        return {"message": "Data imported successfully"}
-        
+        counts = portability.import_data(
+            db, file.file, format, mode,
+            progress=lambda n: logger.info("Import: %d tasks processed", n)
+        )
+    except (ValueError, IntegrityError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid export file: {e}")
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        db.rollback()
+        logger.exception("Import failed")
         raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
+    return {"message": "Data imported successfully", **counts}
+
+# Conditional GETs: ETags come from the database change counter (see versioning.py)
+def not_modified(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already matches `etag`."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+def validator_headers(etag: str) -> dict:
+    # Let browsers keep the response, but revalidate before every reuse
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+# Live updates
+def _read_events(since: Optional[int]):
+    """One poll of the change log, in its own short-lived session."""
+    db = database.SessionLocal()
+    try:
+        if since is None:
+            return crud.latest_change_seq(db), []
+        return events.task_change_events(db, since)
+    finally:
+        db.close()
+
+@app.get("/api/events")
+async def stream_events(request: Request, since: int = None):
+    """Server-sent events for every committed task change (see events.py).
+
+    Starts at the current end of the log unless `since` or Last-Event-ID says otherwise.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    async def stream():
+        seq, _ = (since, None) if since is not None else await run_in_threadpool(_read_events, None)
+        yield f"retry: {events.RETRY_MILLISECONDS}\n" + events.format_event("ready", {"seq": seq})
+        last_sent = time.monotonic()
+        while not await request.is_disconnected():
+            seq, batch = await run_in_threadpool(_read_events, seq)
+            for event in batch:
+                yield event
+            if batch:
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > events.HEARTBEAT_SECONDS:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(events.POLL_INTERVAL_SECONDS)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# Delta sync
+@app.get("/api/changes", response_model=schemas.ChangeBatch)
+def get_changes(
+    since: int = 0,
+    limit: int = changes.CHANGE_BATCH_SIZE,
+    client_id: str = None,
+    db: Session = Depends(get_db)
+):
+    """Current state of every task, category and dependency changed after `since`, plus tombstones.
+
+    Pass `client_id` to hold back log compaction until this client has synced.
+    """
+    try:
+        return changes.read_changes(db, since, limit, client_id)
+    except changes.HistoryPruned as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/changes/compact")
+def compact_changes(db: Session = Depends(get_db)):
+    """Prune change log entries every registered client has already seen."""
+    return {"pruned": changes.compact(db)}
 
 # Categories
 @app.get("/api/categories", response_model=List[schemas.Category])
 def get_categories(db: Session = Depends(get_db)):
-    return crud.get_categories(db)
+    # No validator: overdue_count changes with the clock alone, without a write
+    return crud.get_category_summaries(db)
+
+@app.get("/api/categories/{category_id}/tasks", response_model=List[schemas.TaskWithSubtasks])
+def get_category_tasks(
+    category_id: int,
+    response: Response,
+    limit: int = 100,
+    cursor: str = None,
+    show_archived: bool = False,
+    db: Session = Depends(get_db)
+):
+    """One page of a category's tasks; the next page's cursor is in X-Next-Cursor."""
+    if not crud.get_category(db, category_id):
+        raise HTTPException(status_code=404, detail="Category not found")
+    try:
+        tasks, next_cursor = crud.get_tasks_page(
+            db, limit, cursor, category_id=category_id, show_archived=show_archived
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return tasks
 
 @app.post("/api/categories", response_model=schemas.Category)
 def create_category(category: schemas.CategoryCreate, db: Session = Depends(get_db)):
@@ -214,14 +205,67 @@ def delete_category(category_id: int, db: Session = Depends(get_db)):
 # Tasks
 @app.get("/api/tasks", response_model=List[schemas.TaskWithSubtasks])
 def get_tasks(
-    background_tasks: BackgroundTasks,
+    request: Request,
     category_id: int = None, 
     q: str = None, 
     show_archived: bool = False, 
+    limit: int = None,
+    cursor: str = None,
     db: Session = Depends(get_db)
 ):
-    check_and_trigger_backup(background_tasks)
-    return crud.get_tasks(db, category_id=category_id, search=q, show_archived=show_archived)
+    """List tasks. With `limit`, returns one page and the next page's cursor in X-Next-Cursor.
+
+    Serialized results are cached until the next write (see cache.py).
+    """
+    version = versioning.current(db)
+    # Clock-dependent results can change without a write, so they get no validator
+    time_dependent = crud.search_is_time_dependent(db, category_id, q)
+    etag = None if time_dependent else versioning.etag(version)
+    if etag and not_modified(request, etag):
+        return Response(status_code=304, headers=validator_headers(etag))
+
+    key = (category_id, q, show_archived, limit, cursor)
+    cached = cache.task_results.get(key, version)
+    if cached is None:
+        next_cursor = None
+        if limit is None:
+            tasks = crud.get_tasks(db, category_id=category_id, search=q, show_archived=show_archived)
+        else:
+            try:
+                tasks, next_cursor = crud.get_tasks_page(
+                    db, limit, cursor, category_id=category_id, search=q, show_archived=show_archived
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        body = task_list_adapter.dump_json(task_list_adapter.validate_python(tasks, from_attributes=True))
+        cached = (body, next_cursor)
+        ttl = cache.TIME_DEPENDENT_TTL_SECONDS if time_dependent else None
+        cache.task_results.put(key, version, cached, ttl=ttl)
+
+    body, next_cursor = cached
+    headers = validator_headers(etag) if etag else {}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """Hit/miss counters of the task list cache."""
+    return cache.task_results.stats()
+
+@app.get("/api/replication/stats")
+def get_replication_stats():
+    """WAL replication status and lag (see replication.py)."""
+    return replicator.stats()
+
+@app.get("/api/jobs")
+def get_jobs():
+    """Periodic jobs, with their interval and last run."""
+    runs = scheduler.last_runs()
+    return [
+        {"name": job.name, "interval_seconds": int(job.interval.total_seconds()), **runs.get(job.name, {"last_run_at": None, "last_error": None})}
+        for job in scheduler.JOBS
+    ]
 
 @app.post("/api/tasks/archive-completed")
 def archive_completed_tasks(category_id: int = None, db: Session = Depends(get_db)):
@@ -234,6 +278,25 @@ def reorder_tasks(payload: schemas.ReorderPayload, db: Session = Depends(get_db)
     crud.reorder_tasks(db, payload.task_ids)
     return {"message": "Reordered successfully"}
 
+@app.post("/api/tasks/{task_id}/move", response_model=schemas.MoveResult)
+def move_task(task_id: int, payload: schemas.MovePayload, db: Session = Depends(get_db)):
+    """Move a task between new neighbours, optionally changing its priority, in one transaction.
+
+    Returns only the rows that changed, so clients can patch their state in place.
+    """
+    try:
+        affected = crud.move_task(
+            db, task_id,
+            before_id=payload.before_id,
+            after_id=payload.after_id,
+            priority=payload.priority
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if affected is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return {"tasks": affected}
+
 @app.post("/api/tasks/bulk-update")
 def bulk_update_tasks(payload: schemas.BulkUpdatePayload, db: Session = Depends(get_db)):
     count = crud.bulk_update_tasks(db, payload.task_ids, payload.updates)
@@ -248,16 +311,53 @@ def bulk_delete_tasks(payload: schemas.BulkDeletePayload, db: Session = Depends(
 def create_task(task: schemas.TaskCreate, db: Session = Depends(get_db)):
     return crud.create_task(db, task)
 
+@app.get("/api/tasks/ready", response_model=List[schemas.Task])
+def get_ready_tasks(request: Request, response: Response, limit: int = crud.DEFAULT_READY_LIMIT,
+                    db: Session = Depends(get_db)):
+    """Open, unblocked tasks ranked by priority, due date and position (see crud.get_ready_tasks)."""
+    etag = versioning.etag(versioning.current(db))
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=validator_headers(etag))
+    try:
+        tasks = crud.get_ready_tasks(db, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers.update(validator_headers(etag))
+    return tasks
+
+@app.get("/api/schedule", response_model=schemas.Schedule)
+def get_schedule(task_days: float = schedule.DEFAULT_TASK_DAYS, db: Session = Depends(get_db)):
+    """Critical path, slack and at-risk tasks over the open dependency graph (see schedule.py)."""
+    try:
+        return schedule.analyze(db, task_days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/api/tasks/{task_id}", response_model=schemas.Task)
-def get_task(task_id: int, db: Session = Depends(get_db)):
+def get_task(task_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    etag = versioning.etag(versioning.current(db))
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=validator_headers(etag))
     db_task = crud.get_task(db, task_id)
     if not db_task:
         raise HTTPException(status_code=404, detail="Task not found")
+    response.headers.update(validator_headers(etag))
     return db_task
 
+@app.get("/api/tasks/{task_id}/dependencies", response_model=schemas.TaskDependencies)
+def get_task_dependencies(task_id: int, db: Session = Depends(get_db)):
+    """Transitive blockers of a task and everything it holds up, from the closure table."""
+    dependencies = crud.get_task_dependencies(db, task_id)
+    if dependencies is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return dependencies
+
 @app.put("/api/tasks/{task_id}", response_model=schemas.Task)
 def update_task(task_id: int, task: schemas.TaskUpdate, db: Session = Depends(get_db)):
-    db_task = crud.update_task(db, task_id, task)
+    try:
+        db_task = crud.update_task(db, task_id, task)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not db_task:
         raise HTTPException(status_code=404, detail="Task not found")
     return db_task
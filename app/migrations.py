@@ -0,0 +1,200 @@
+"""Schema migrations that `Base.metadata.create_all` cannot express.
+
+`create_all` only creates missing tables. Anything else (virtual tables,
+triggers, backfills) is a numbered migration here, tracked with SQLite's
+`PRAGMA user_version`. Migrations run right after every `create_all` (see the
+listener at the bottom of models.py), and both the web app and the MCP server
+call `database.init_db` at startup, so new and existing databases converge on
+the same schema whichever process opens them first.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+
+def migration(version: int):
+    """Register a migration function for the given schema version."""
+    def decorator(fn):
+        MIGRATIONS.append((version, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+
+def upgrade(connection):
+    """Apply every migration newer than the database's user_version."""
+    current = connection.exec_driver_sql("PRAGMA user_version").scalar()
+    for version, fn in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info("Applying migration %d: %s", version, fn.__name__)
+        fn(connection)
+        connection.exec_driver_sql(f"PRAGMA user_version = {version}")
+
+
+def run_after_create(target, connection, **kw):
+    """MetaData `after_create` hook."""
+    upgrade(connection)
+
+
+def has_fts5(connection) -> bool:
+    """Check whether this SQLite build ships the FTS5 extension."""
+    options = connection.exec_driver_sql("PRAGMA compile_options").scalars().all()
+    return "ENABLE_FTS5" in options
+
+
+@migration(1)
+def create_task_search_index(connection):
+    """Full-text index over task title, description and hashtags, kept in sync by triggers."""
+    if not has_fts5(connection):
+        logger.warning("SQLite was built without FTS5; search will use LIKE scans")
+        return
+
+    connection.exec_driver_sql("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            title, description, hashtags,
+            content='tasks', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    """)
+    connection.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts(rowid, title, description, hashtags)
+            VALUES (new.id, new.title, new.description, new.hashtags);
+        END
+    """)
+    connection.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts(tasks_fts, rowid, title, description, hashtags)
+            VALUES ('delete', old.id, old.title, old.description, old.hashtags);
+        END
+    """)
+    # Only fire for the indexed columns, so reorders and completions don't touch the index
+    connection.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_update
+        AFTER UPDATE OF title, description, hashtags ON tasks BEGIN
+            INSERT INTO tasks_fts(tasks_fts, rowid, title, description, hashtags)
+            VALUES ('delete', old.id, old.title, old.description, old.hashtags);
+            INSERT INTO tasks_fts(rowid, title, description, hashtags)
+            VALUES (new.id, new.title, new.description, new.hashtags);
+        END
+    """)
+    connection.exec_driver_sql("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+
+
+@migration(2)
+def backfill_task_tags(connection):
+    """Populate task_tags from existing hashtags and drop tag rows with their task."""
+    from .tags import parse_hashtags
+
+    connection.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS task_tags_delete AFTER DELETE ON tasks BEGIN
+            DELETE FROM task_tags WHERE task_id = old.id;
+        END
+    """)
+    rows = [
+        (task_id, tag)
+        for task_id, hashtags in connection.exec_driver_sql(
+            "SELECT id, hashtags FROM tasks WHERE hashtags IS NOT NULL AND hashtags != ''"
+        )
+        for tag in parse_hashtags(hashtags)
+    ]
+    if rows:
+        connection.exec_driver_sql(
+            "INSERT OR IGNORE INTO task_tags (task_id, tag) VALUES (?, ?)", rows
+        )
+
+
+@migration(3)
+def create_task_list_index(connection):
+    """Index matching the task list sort, so keyset pages are range scans."""
+    connection.exec_driver_sql("""
+        CREATE INDEX IF NOT EXISTS ix_tasks_list_order ON tasks (
+            parent_id, coalesce(priority, 1), coalesce(position, 0), id DESC
+        )
+    """)
+
+
+@migration(4)
+def space_task_positions(connection):
+    """Spread the old 1, 2, 3... positions out to the gap-based scheme (crud.POSITION_GAP)."""
+    connection.exec_driver_sql("UPDATE tasks SET position = coalesce(position, 0) * 1024")
+
+
+@migration(5)
+def seed_data_version(connection):
+    """Create the data_version row. The random epoch keeps validators from a replaced database file from matching."""
+    connection.exec_driver_sql(
+        "INSERT OR IGNORE INTO data_version (id, epoch, version) VALUES (1, lower(hex(randomblob(8))), 0)"
+    )
+
+
+@migration(6)
+def create_task_change_triggers(connection):
+    """Log every task write to change_log in the writing transaction, whichever process made it.
+
+    Dependency edges are logged as upserts of both tasks, since each one's
+    blocked_by_ids / blocking_ids changed.
+    """
+    for event, row in (("INSERT", "new"), ("UPDATE", "new")):
+        connection.exec_driver_sql(f"""
+            CREATE TRIGGER IF NOT EXISTS change_log_task_{event.lower()} AFTER {event} ON tasks BEGIN
+                INSERT INTO change_log (entity, entity_id, op) VALUES ('task', {row}.id, 'upsert');
+            END
+        """)
+    connection.exec_driver_sql("""
+        CREATE TRIGGER IF NOT EXISTS change_log_task_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO change_log (entity, entity_id, op) VALUES ('task', old.id, 'delete');
+        END
+    """)
+    for event, row in (("INSERT", "new"), ("DELETE", "old")):
+        connection.exec_driver_sql(f"""
+            CREATE TRIGGER IF NOT EXISTS change_log_dependency_{event.lower()}
+            AFTER {event} ON task_dependencies BEGIN
+                INSERT INTO change_log (entity, entity_id, op) VALUES ('task', {row}.task_id, 'upsert');
+                INSERT INTO change_log (entity, entity_id, op) VALUES ('task', {row}.depends_on_id, 'upsert');
+            END
+        """)
+
+
+@migration(7)
+def log_category_and_dependency_changes(connection):
+    """Extend change_log to categories and dependency edges; deletes are kept as tombstones."""
+    columns = [row[1] for row in connection.exec_driver_sql("PRAGMA table_info(change_log)")]
+    if "related_id" not in columns:
+        connection.exec_driver_sql("ALTER TABLE change_log ADD COLUMN related_id INTEGER")
+
+    for event, row, op in (("INSERT", "new", "upsert"), ("UPDATE", "new", "upsert"), ("DELETE", "old", "delete")):
+        connection.exec_driver_sql(f"""
+            CREATE TRIGGER IF NOT EXISTS change_log_category_{event.lower()} AFTER {event} ON categories BEGIN
+                INSERT INTO change_log (entity, entity_id, op) VALUES ('category', {row}.id, '{op}');
+            END
+        """)
+    for event, row, op in (("INSERT", "new", "upsert"), ("DELETE", "old", "delete")):
+        connection.exec_driver_sql(f"""
+            CREATE TRIGGER IF NOT EXISTS change_log_edge_{event.lower()} AFTER {event} ON task_dependencies BEGIN
+                INSERT INTO change_log (entity, entity_id, related_id, op)
+                VALUES ('dependency', {row}.task_id, {row}.depends_on_id, '{op}');
+            END
+        """)
+
+
+@migration(8)
+def backfill_task_closure(connection):
+    """Fill task_closure from the existing dependency edges."""
+    from .closure import rebuild
+
+    rebuild(connection)
+
+
+@migration(9)
+def create_ready_queue_index(connection):
+    """Partial index of open tasks in ready-queue order (crud.READY_ORDER), so the queue is read from its head."""
+    connection.exec_driver_sql("""
+        CREATE INDEX IF NOT EXISTS ix_tasks_ready ON tasks (
+            coalesce(priority, 1), due_date IS NULL, due_date, coalesce(position, 0), id
+        ) WHERE completed IS NOT 1 AND archived IS NOT 1
+    """)
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Table
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Table, event
+from sqlalchemy.orm import object_session, relationship
 from .database import Base
+from . import migrations
 
 task_dependencies = Table(
     "task_dependencies",
@@ -9,6 +10,63 @@ task_dependencies = Table(
     Column("depends_on_id", Integer, ForeignKey("tasks.id"), primary_key=True)
 )
 
+# Normalized hashtags, written alongside Task.hashtags (see tags.py)
+task_tags = Table(
+    "task_tags",
+    Base.metadata,
+    Column("task_id", Integer, ForeignKey("tasks.id"), primary_key=True),
+    Column("tag", String, primary_key=True, index=True)
+)
+
+# Transitive closure of task_dependencies: every (upstream, downstream) pair of
+# tasks joined by a chain of blocking edges, and its shortest length (see closure.py)
+task_closure = Table(
+    "task_closure",
+    Base.metadata,
+    Column("ancestor_id", Integer, primary_key=True),
+    Column("descendant_id", Integer, primary_key=True, index=True),
+    Column("depth", Integer, nullable=False)
+)
+
+# Single-row change counter, bumped in every transaction that writes (see versioning.py)
+data_version = Table(
+    "data_version",
+    Base.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("epoch", String, nullable=False),
+    Column("version", Integer, nullable=False, default=0)
+)
+
+# Append-only log of committed changes, written by triggers (see migrations.py and events.py)
+change_log = Table(
+    "change_log",
+    Base.metadata,
+    Column("seq", Integer, primary_key=True),
+    Column("entity", String, nullable=False),
+    Column("entity_id", Integer, nullable=False),
+    Column("op", String, nullable=False),
+    Column("related_id", Integer, nullable=True),  # depends_on_id, for 'dependency' rows
+    sqlite_autoincrement=True
+)
+
+# Delta-sync clients and the change_log sequence number each has confirmed (see changes.py)
+sync_clients = Table(
+    "sync_clients",
+    Base.metadata,
+    Column("client_id", String, primary_key=True),
+    Column("seq", Integer, nullable=False),
+    Column("seen_at", DateTime, nullable=False)
+)
+
+# Last run of each periodic job (see scheduler.py)
+job_runs = Table(
+    "job_runs",
+    Base.metadata,
+    Column("name", String, primary_key=True),
+    Column("last_run_at", DateTime, nullable=False),
+    Column("last_error", Text, nullable=True)
+)
+
 class Category(Base):
     __tablename__ = "categories"
 
@@ -62,3 +120,18 @@ class Task(Base):
     @property
     def blocking_ids(self):
         return [t.id for t in self.blocking]
+
+    @property
+    def is_blocked(self):
+        """Whether an open task is anywhere upstream of this one (see graph.py)."""
+        return graph.is_blocked(object_session(self), self.id)
+
+
+# Virtual tables, triggers and backfills that create_all can't express
+event.listen(Base.metadata, "after_create", migrations.run_after_create)
+
+# Session listeners that bump data_version; registered wherever the models are used
+from . import versioning  # noqa: E402
+
+# The dependency graph behind Task.is_blocked
+from . import graph  # noqa: E402
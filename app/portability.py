@@ -0,0 +1,522 @@
+"""Export and import of the whole dataset.
+
+Exports are streamed: tasks are read in batches of EXPORT_BATCH_SIZE inside a
+single read transaction (a consistent snapshot under WAL), each batch's
+dependencies are fetched with one query, and the output is encoded batch by
+batch, so memory use does not grow with the size of the database.
+
+Two formats are produced:
+
+- `json`: the original document, `{"exported_at", "categories", "tasks"}`.
+- `ndjson`: one record per line, each tagged with a `type` of `meta`,
+  `category` or `task`.
+
+Imports read either format incrementally and insert tasks IMPORT_BATCH_SIZE at
+a time with executemany, keeping the exported ids. Parent, category and
+blocker references are therefore already in place once every row is in, and
+references to records missing from the file are dropped afterwards with a few
+set-based statements. The whole import is one transaction.
+
+A `merge` import instead upserts into the existing data, matching records on
+their exported ids and skipping the ones that haven't changed.
+"""
+import codecs
+import json
+from datetime import datetime
+from typing import Callable, Iterator, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, insert, or_, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import closure, crud, models, tags
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 2000
+IMPORT_MODES = ("replace", "merge")
+READ_CHUNK_SIZE = 64 * 1024
+EXPORT_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+_TASK_COLUMNS = (
+    "id", "title", "description", "due_date", "priority", "position", "hashtags",
+    "recurrence", "completed", "archived", "category_id", "parent_id",
+)
+
+
+def _encode(record: dict) -> str:
+    return json.dumps(record, separators=(",", ":"))
+
+
+def _task_record(row, blocked_by_ids) -> dict:
+    return {
+        "title": row.title,
+        "description": row.description,
+        "due_date": row.due_date.isoformat() if row.due_date else None,
+        "priority": row.priority,
+        "position": row.position,
+        "hashtags": row.hashtags,
+        "recurrence": row.recurrence,
+        "completed": row.completed,
+        "archived": row.archived,
+        "category_id": row.category_id,
+        "parent_id": row.parent_id,
+        "blocked_by_ids": blocked_by_ids,
+        "old_id": row.id,
+    }
+
+
+def _task_batches(conn, batch_size: int) -> Iterator[list]:
+    """Task records in id order, one list per batch."""
+    task_table = models.Task.__table__
+    edges = models.task_dependencies.c
+    result = conn.execution_options(yield_per=batch_size).execute(
+        select(*(task_table.c[name] for name in _TASK_COLUMNS)).order_by(task_table.c.id)
+    )
+    for rows in result.partitions():
+        blocked_by = {row.id: [] for row in rows}
+        for chunk in crud.chunks(blocked_by):
+            for task_id, depends_on_id in conn.execute(
+                select(edges.task_id, edges.depends_on_id)
+                .where(edges.task_id.in_(chunk))
+                .order_by(edges.task_id, edges.depends_on_id)
+            ):
+                blocked_by[task_id].append(depends_on_id)
+        yield [_task_record(row, blocked_by[row.id]) for row in rows]
+
+
+def stream_export(engine: Engine, fmt: str = "json", batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    """Encode every category and task in `fmt`, one chunk per batch of tasks."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}")
+
+    with engine.connect() as conn:
+        # One read transaction for the whole export, so every batch sees the same snapshot
+        conn.exec_driver_sql("BEGIN")
+        try:
+            exported_at = datetime.now().isoformat()
+            categories = [
+                {"id": c.id, "name": c.name, "query": c.query}
+                for c in conn.execute(select(models.Category.id, models.Category.name, models.Category.query)
+                                      .order_by(models.Category.id))
+            ]
+
+            if fmt == "ndjson":
+                yield _encode({"type": "meta", "exported_at": exported_at}) + "\n"
+                yield "".join(_encode({"type": "category", **c}) + "\n" for c in categories)
+                for batch in _task_batches(conn, batch_size):
+                    yield "".join(_encode({"type": "task", **t}) + "\n" for t in batch)
+                return
+
+            yield '{"exported_at":' + json.dumps(exported_at)
+            yield ',"categories":[' + ",".join(_encode(c) for c in categories) + "]"
+            yield ',"tasks":['
+            separator = ""
+            for batch in _task_batches(conn, batch_size):
+                yield separator + ",".join(_encode(t) for t in batch)
+                separator = ","
+            yield "]}"
+        finally:
+            conn.rollback()
+
+
+# Import
+
+class _JSONReader:
+    """Decodes one JSON value at a time from a binary stream, reading as needed."""
+
+    def __init__(self, stream, chunk_size: int = READ_CHUNK_SIZE):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._json = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        data = self._stream.read(self._chunk_size)
+        self._eof = not data
+        # Drop what has been consumed so the buffer stays around one chunk
+        self._buffer = self._buffer[self._pos:] + self._decoder.decode(data, final=self._eof)
+        self._pos = 0
+        return True
+
+    def peek(self) -> Optional[str]:
+        """The next non-whitespace character, or None at the end of the stream."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return None
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Invalid export file: expected {char!r} at offset {self._pos}")
+        self._pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number that ends the buffer may continue in the next chunk
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+
+def _json_array(reader: _JSONReader) -> Iterator:
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.expect("]")
+        return
+    while True:
+        yield reader.value()
+        if reader.peek() != ",":
+            break
+        reader.expect(",")
+    reader.expect("]")
+
+
+def _json_records(stream) -> Iterator[Tuple[str, dict]]:
+    """("category" | "task", record) pairs from an export document."""
+    reader = _JSONReader(stream)
+    sections = {"categories": "category", "tasks": "task"}
+    seen = set()
+    reader.expect("{")
+    while reader.peek() != "}":
+        if seen:
+            reader.expect(",")
+        key = reader.value()
+        reader.expect(":")
+        if key in sections:
+            for record in _json_array(reader):
+                yield sections[key], record
+        else:
+            reader.value()
+        seen.add(key)
+    reader.expect("}")
+    if not seen >= set(sections):
+        raise ValueError("Invalid export format")
+
+
+def _ndjson_records(stream) -> Iterator[Tuple[str, dict]]:
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        kind = record.pop("type", None) if isinstance(record, dict) else None
+        if kind not in ("meta", "category", "task"):
+            raise ValueError(f"Invalid export file: unknown record on line {number}")
+        if kind != "meta":
+            yield kind, record
+
+
+def _task_row(record: dict) -> dict:
+    due_date = record.get("due_date")
+    return {
+        "id": record.get("old_id"),
+        "title": record.get("title"),
+        "description": record.get("description"),
+        "due_date": datetime.fromisoformat(due_date) if due_date else None,
+        "priority": record.get("priority", 1),
+        "position": record.get("position", 0),
+        "hashtags": record.get("hashtags"),
+        "recurrence": record.get("recurrence"),
+        "completed": bool(record.get("completed", False)),
+        "archived": bool(record.get("archived", False)),
+        "category_id": record.get("category_id"),
+        "parent_id": record.get("parent_id"),
+    }
+
+
+def _insert_rows(db: Session, table, rows: list):
+    if rows:
+        db.execute(insert(table), rows)
+
+
+def _drop_dangling_references(db: Session):
+    """Null out parent and category references, and delete edges, that point at nothing."""
+    tasks = models.Task.__table__
+    edges = models.task_dependencies.c
+    task_ids = select(tasks.c.id)
+    db.execute(
+        update(tasks)
+        .where(tasks.c.parent_id.is_not(None), tasks.c.parent_id.not_in(task_ids))
+        .values(parent_id=None)
+    )
+    db.execute(
+        update(tasks)
+        .where(tasks.c.category_id.is_not(None), tasks.c.category_id.not_in(select(models.Category.id)))
+        .values(category_id=None)
+    )
+    db.execute(
+        delete(models.task_dependencies).where(or_(
+            edges.task_id == edges.depends_on_id,
+            edges.task_id.not_in(task_ids),
+            edges.depends_on_id.not_in(task_ids),
+        ))
+    )
+
+
+def _blocker_ids(record: dict) -> list:
+    return list(dict.fromkeys(record.get("blocked_by_ids") or []))
+
+
+def _replace(db: Session, records, batch_size: int, progress) -> dict:
+    tasks = models.Task.__table__
+    crud.clear_all_data(db)
+    categories, deferred = [], []
+    batch, edges = [], []
+    counts = {"categories": 0, "tasks": 0, "dependencies": 0}
+
+    def flush_batch():
+        if not batch:
+            return
+        _insert_rows(db, tasks, batch)
+        _insert_rows(db, models.task_dependencies, edges)
+        counts["tasks"] += len(batch)
+        batch.clear()
+        edges.clear()
+        if progress:
+            progress(counts["tasks"])
+
+    for kind, record in records:
+        if kind == "category":
+            categories.append({"id": record.get("id"), "name": record.get("name"), "query": record.get("query")})
+            continue
+        row = _task_row(record)
+        if row["id"] is None:
+            # Nothing can refer to it; insert it last so its new id can't collide with an exported one
+            deferred.append(row)
+            continue
+        batch.append(row)
+        edges.extend({"task_id": row["id"], "depends_on_id": blocker_id} for blocker_id in _blocker_ids(record))
+        if len(batch) >= batch_size:
+            flush_batch()
+    flush_batch()
+
+    categories.sort(key=lambda c: c["id"] is None)
+    _insert_rows(db, models.Category.__table__, categories)
+    _insert_rows(db, tasks, deferred)
+    counts["categories"] = len(categories)
+    counts["tasks"] += len(deferred)
+
+    _drop_dangling_references(db)
+    closure.rebuild(db)
+    counts["dependencies"] = db.query(models.task_dependencies).count()
+    tags.sync_task_tags(db)
+    return counts
+
+
+class _Merge:
+    """Upserts records into the existing data, keyed on their exported ids.
+
+    A task whose columns and blockers already match is skipped without a
+    write, so re-importing an unchanged file only costs the reads. Tasks
+    without an `old_id` are matched on their content instead. Categories
+    are matched on id, then on name, which is unique; tasks follow a
+    category that was matched under another id. Nothing is deleted.
+    """
+
+    _COLUMNS = [name for name in _TASK_COLUMNS if name != "id"]
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.tasks = models.Task.__table__
+        self.counts = {
+            entity: {"inserted": 0, "updated": 0, "unchanged": 0}
+            for entity in ("categories", "tasks")
+        }
+        self.touched = set()
+        self.rewired = set()
+        self.inserted_without_id = False
+        self.category_ids = {}
+        self.categories = {c.id: (c.name, c.query) for c in db.execute(
+            select(models.Category.id, models.Category.name, models.Category.query))}
+        self._update = (
+            update(self.tasks)
+            .where(self.tasks.c.id == bindparam("b_id"))
+            .values({name: bindparam(f"b_{name}") for name in self._COLUMNS})
+        )
+
+    @property
+    def wrote(self) -> bool:
+        return bool(self.touched or self.inserted_without_id
+                    or self.counts["categories"]["inserted"] or self.counts["categories"]["updated"])
+
+    def category(self, record: dict):
+        """Upsert one category (there are few, so one statement each is fine)."""
+        incoming_id, name, query = record.get("id"), record.get("name"), record.get("query")
+        by_name = {existing[0]: category_id for category_id, existing in self.categories.items()}
+        category_id = by_name.get(name, incoming_id if incoming_id in self.categories else None)
+        counts = self.counts["categories"]
+
+        if category_id is None:
+            values = {"name": name, "query": query}
+            if incoming_id is not None:
+                values["id"] = incoming_id
+            category_id = self.db.execute(insert(models.Category.__table__).values(values)).inserted_primary_key[0]
+            counts["inserted"] += 1
+        elif self.categories[category_id] == (name, query):
+            counts["unchanged"] += 1
+        else:
+            self.db.execute(
+                update(models.Category).where(models.Category.id == category_id).values(name=name, query=query)
+            )
+            counts["updated"] += 1
+        self.categories[category_id] = (name, query)
+        if incoming_id is not None:
+            self.category_ids[incoming_id] = category_id
+
+    def _map_category(self, row: dict) -> dict:
+        row["category_id"] = self.category_ids.get(row["category_id"], row["category_id"])
+        return row
+
+    def task_batch(self, batch: list):
+        """Upsert a batch of (row, blocker ids) pairs whose rows carry their exported id."""
+        ids = [row["id"] for row, _ in batch]
+        existing, blockers = {}, {task_id: [] for task_id in ids}
+        for chunk in crud.chunks(ids):
+            for row in self.db.execute(select(*(self.tasks.c[name] for name in _TASK_COLUMNS))
+                                       .where(self.tasks.c.id.in_(chunk))):
+                existing[row.id] = tuple(row)[1:]
+            edges = models.task_dependencies.c
+            for task_id, depends_on_id in self.db.execute(
+                select(edges.task_id, edges.depends_on_id).where(edges.task_id.in_(chunk))
+            ):
+                blockers[task_id].append(depends_on_id)
+
+        inserts, updates, rewired = [], [], []
+        counts = self.counts["tasks"]
+        for row, blocker_ids in batch:
+            row = self._map_category(row)
+            current = existing.get(row["id"])
+            rewire = current is None or sorted(blockers[row["id"]]) != sorted(blocker_ids)
+            if current is None:
+                inserts.append(row)
+                counts["inserted"] += 1
+            elif current != tuple(row[name] for name in self._COLUMNS):
+                updates.append({f"b_{name}": value for name, value in row.items()})
+                counts["updated"] += 1
+            elif rewire:
+                counts["updated"] += 1
+            else:
+                counts["unchanged"] += 1
+            if rewire:
+                rewired.append((row["id"], blocker_ids))
+
+        _insert_rows(self.db, self.tasks, inserts)
+        if updates:
+            self.db.execute(self._update, updates)
+        if rewired:
+            for chunk in crud.chunks(task_id for task_id, _ in rewired):
+                self.db.execute(delete(models.task_dependencies)
+                                .where(models.task_dependencies.c.task_id.in_(chunk)))
+            _insert_rows(self.db, models.task_dependencies, [
+                {"task_id": task_id, "depends_on_id": blocker_id}
+                for task_id, blocker_ids in rewired for blocker_id in blocker_ids
+            ])
+        self.touched.update(row["id"] for row in inserts)
+        self.touched.update(update_row["b_id"] for update_row in updates)
+        self.touched.update(task_id for task_id, _ in rewired)
+        self.rewired.update(task_id for task_id, _ in rewired)
+
+    def tasks_without_id(self, rows: list):
+        """Insert the rows that no existing task matches column for column."""
+        rows = [self._map_category(row) for row in rows]
+        existing = set()
+        for chunk in crud.chunks({row["title"] for row in rows}):
+            for row in self.db.execute(select(*(self.tasks.c[name] for name in self._COLUMNS))
+                                       .where(self.tasks.c.title.in_(chunk))):
+                existing.add(tuple(row))
+        inserts = []
+        for row in rows:
+            content = tuple(row[name] for name in self._COLUMNS)
+            if content in existing:
+                self.counts["tasks"]["unchanged"] += 1
+            else:
+                existing.add(content)
+                inserts.append(row)
+        _insert_rows(self.db, self.tasks, inserts)
+        self.counts["tasks"]["inserted"] += len(inserts)
+        self.inserted_without_id = bool(inserts)
+
+
+def _merge(db: Session, records, batch_size: int, progress) -> dict:
+    merge = _Merge(db)
+    batch, deferred = [], []
+    seen = 0
+
+    def flush_batch():
+        nonlocal seen
+        if not batch:
+            return
+        merge.task_batch(batch)
+        seen += len(batch)
+        batch.clear()
+        if progress:
+            progress(seen)
+
+    for kind, record in records:
+        if kind == "category":
+            merge.category(record)
+            continue
+        row = _task_row(record)
+        if row["id"] is None:
+            deferred.append(row)
+            continue
+        batch.append((row, _blocker_ids(record)))
+        if len(batch) >= batch_size:
+            flush_batch()
+    flush_batch()
+    if deferred:
+        merge.tasks_without_id(deferred)
+
+    # An unchanged file writes nothing, so the data version (and every cache) stays put
+    if merge.wrote:
+        _drop_dangling_references(db)
+        closure.recompute(db, merge.rewired)
+        tags.sync_task_tags(db, None if merge.inserted_without_id else merge.touched)
+    return merge.counts
+
+
+def import_data(db: Session, stream, fmt: str = "json", mode: str = "replace",
+                batch_size: int = IMPORT_BATCH_SIZE, progress: Optional[Callable[[int], None]] = None) -> dict:
+    """Import an export read from the binary `stream`, in one transaction.
+
+    `replace` deletes all data first and returns the number of categories,
+    tasks and dependencies imported. `merge` upserts into the existing data
+    (see _Merge) and returns, per entity, how many rows were inserted,
+    updated and left unchanged.
+
+    Raises ValueError for a malformed file; nothing is changed in that case.
+    `progress` is called with the number of tasks processed so far after
+    every batch.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown import format {fmt!r}")
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Unknown import mode {mode!r}")
+    records = _ndjson_records(stream) if fmt == "ndjson" else _json_records(stream)
+
+    try:
+        counts = (_merge if mode == "merge" else _replace)(db, records, batch_size, progress)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return counts
@@ -0,0 +1,445 @@
+"""Continuous replication by WAL shipping, with point-in-time restore.
+
+In the spirit of litestream: a replicator thread copies committed WAL frames
+from the live database to a local replica directory about once a second, so a
+restore loses at most that much work instead of a day's.
+
+The replica is a series of generations. A generation starts with a full copy
+of the database (`base.db`) and continues with segments: the WAL frames of the
+transactions committed since, each segment stamped with the time it was
+shipped. Restoring to a point in time copies a generation's base and writes
+the pages of every segment shipped up to that time over it, which is exactly
+what a checkpoint does.
+
+Frames are only useful while the replicator knows its place in the WAL. It
+holds a read transaction open between polls, which keeps SQLite from
+checkpointing frames it hasn't shipped (and so from restarting the WAL behind
+its back), and it checkpoints the WAL itself once it has shipped
+CHECKPOINT_FRAMES frames. Frames are validated with the WAL's own salts and
+checksum chain. If the WAL is ever restarted before everything in it was
+shipped, the replicator can no longer vouch for the frames in between and
+starts a new generation.
+
+Layout under REPLICA_DIR:
+
+    <generation>/generation.json       created_at, page_size
+    <generation>/base.db               the database when the generation began
+    <generation>/<n>-<shipped_ms>.wal.z  compressed frames, in commit order
+
+Replication is off unless SHARPEI_REPLICATION=on, and needs the `wal`
+storage profile. Restore with:
+
+    python -m app.replication list
+    python -m app.replication restore <target.db> [--at 2025-03-01T09:30:00]
+"""
+import argparse
+import dataclasses
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from . import backups
+from .database import DB_PATH, DB_PROFILE, STORAGE_PROFILES
+
+logger = logging.getLogger(__name__)
+
+REPLICA_DIR = os.path.join(backups.BACKUP_DIR, "replica")
+REPLICATION_ENABLED = os.environ.get("SHARPEI_REPLICATION", "off") == "on"
+REPLICATION_INTERVAL_SECONDS = 1.0
+CHECKPOINT_FRAMES = 1000
+GENERATION_MAX_AGE = timedelta(hours=24)
+RETENTION_DAYS = 7
+
+WAL_HEADER_SIZE = 32
+FRAME_HEADER_SIZE = 24
+_WAL_MAGIC = {0x377F0682: "<", 0x377F0683: ">"}  # byte order of the checksums
+
+
+class ReplicationError(Exception):
+    """The replica can't be read or restored."""
+
+
+def _checksum(data: bytes, s1: int, s2: int, byte_order: str) -> Tuple[int, int]:
+    """SQLite's WAL checksum of `data`, continuing from (s1, s2)."""
+    words = struct.unpack(f"{byte_order}{len(data) // 4}I", data)
+    for i in range(0, len(words), 2):
+        s1 = (s1 + words[i] + s2) & 0xFFFFFFFF
+        s2 = (s2 + words[i + 1] + s1) & 0xFFFFFFFF
+    return s1, s2
+
+
+@dataclasses.dataclass
+class WalPosition:
+    """How far into the current WAL the replica has got."""
+    salts: Optional[Tuple[int, int]] = None  # None: the WAL hasn't been started since we last saw it empty
+    offset: int = WAL_HEADER_SIZE
+    checksum: Tuple[int, int] = (0, 0)
+    byte_order: str = "<"
+    page_size: int = 0
+    restartable: bool = False  # everything up to here is checkpointed, so a new WAL may follow
+
+    @property
+    def frames(self) -> int:
+        if not self.page_size:
+            return 0
+        return (self.offset - WAL_HEADER_SIZE) // (FRAME_HEADER_SIZE + self.page_size)
+
+
+def read_wal(wal_path: str, position: WalPosition) -> Tuple[Optional[WalPosition], bytes]:
+    """Committed frames in the WAL after `position`, and the position after them.
+
+    Returns (None, b"") if the WAL no longer continues from `position` (it was
+    restarted or truncated by someone else, possibly with frames we hadn't
+    read), and (position, b"") if there is nothing new.
+    """
+    # An empty WAL is only expected where we are about to start a new one
+    if position.salts is None:
+        missing = (position, b"")
+    elif position.restartable:
+        missing = (WalPosition(), b"")
+    else:
+        missing = (None, b"")
+    try:
+        with open(wal_path, "rb") as f:
+            header = f.read(WAL_HEADER_SIZE)
+            if len(header) < WAL_HEADER_SIZE:
+                return missing
+            magic, _, page_size, _, salt1, salt2, c1, c2 = struct.unpack(">8I", header)
+            if magic not in _WAL_MAGIC:
+                return missing
+            byte_order = _WAL_MAGIC[magic]
+
+            if position.restartable and position.salts != (salt1, salt2):
+                position = WalPosition()
+            if position.salts is None:
+                if _checksum(header[:24], 0, 0, byte_order) != (c1, c2):
+                    return position, b""
+                position = WalPosition((salt1, salt2), WAL_HEADER_SIZE, (c1, c2), byte_order, page_size)
+            elif position.salts != (salt1, salt2):
+                return None, b""
+
+            f.seek(position.offset)
+            data = f.read()
+    except FileNotFoundError:
+        return missing
+
+    frame_size = FRAME_HEADER_SIZE + position.page_size
+    checksum, committed, committed_checksum = position.checksum, 0, position.checksum
+    offset = 0
+    while offset + frame_size <= len(data):
+        frame = data[offset:offset + frame_size]
+        _, commit_size, frame_salt1, frame_salt2, f1, f2 = struct.unpack(">6I", frame[:FRAME_HEADER_SIZE])
+        if (frame_salt1, frame_salt2) != position.salts:
+            break
+        checksum = _checksum(frame[:8] + frame[FRAME_HEADER_SIZE:], *checksum, position.byte_order)
+        if checksum != (f1, f2):
+            break
+        offset += frame_size
+        if commit_size:
+            committed, committed_checksum = offset, checksum
+
+    if not committed:
+        return position, b""
+    return WalPosition(position.salts, position.offset + committed, committed_checksum,
+                       position.byte_order, position.page_size), data[:committed]
+
+
+class Replicator:
+    """Ships the WAL of `db_path` into `replica_dir`; see the module docstring."""
+
+    def __init__(self, db_path: str = DB_PATH, replica_dir: str = REPLICA_DIR,
+                 interval: float = REPLICATION_INTERVAL_SECONDS):
+        self.db_path = db_path
+        self.wal_path = db_path + "-wal"
+        self.replica_dir = replica_dir
+        self.interval = interval
+        self.generation: Optional[str] = None
+        self.generation_started: Optional[datetime] = None
+        self.position = WalPosition()
+        self.segment_index = 0
+        self.frames_shipped = 0
+        self.bytes_shipped = 0
+        self.last_sync_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    # Connection and read lock
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None, check_same_thread=False)
+        return self._conn
+
+    def _hold_wal(self):
+        """Open a read transaction, which stops anyone else from restarting the WAL."""
+        conn = self._connection()
+        conn.execute("BEGIN")
+        conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+    def _release_wal(self):
+        if self._conn is not None and self._conn.in_transaction:
+            self._conn.rollback()
+
+    # Generations
+
+    def _start_generation(self):
+        """Copy the database file as the base of a new generation.
+
+        The copy is taken under our read transaction, so the WAL can't be
+        restarted while it runs. A concurrent checkpoint may still be writing
+        committed pages into the file, so the copy can mix page versions; the
+        generation therefore ships the whole current WAL, whose frames
+        overwrite every page a checkpoint could have touched with its latest
+        committed version.
+        """
+        self._release_wal()
+        conn = self._connection()
+        started = datetime.now()
+        generation = started.strftime("%Y%m%d_%H%M%S_%f")
+        directory = os.path.join(self.replica_dir, generation)
+        os.makedirs(directory, exist_ok=True)
+
+        # Start from an empty WAL where possible, so there is little to replay
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        self._hold_wal()
+        shutil.copyfile(self.db_path, os.path.join(directory, "base.db"))
+        with open(os.path.join(directory, "generation.json"), "w") as f:
+            json.dump({"created_at": started.isoformat(), "page_size": page_size}, f)
+
+        self.generation, self.generation_started = generation, started
+        self.position = WalPosition()
+        self.segment_index = 0
+        logger.info("Replication generation %s started", generation)
+        self._prune_generations()
+
+    def _prune_generations(self):
+        cutoff = datetime.now() - timedelta(days=RETENTION_DAYS)
+        generations = list_generations(self.replica_dir)
+        # The newest generation older than the cutoff still covers the start of the window
+        expired = [g for g in generations if g["created_at"] < cutoff][:-1]
+        for generation in expired:
+            shutil.rmtree(os.path.join(self.replica_dir, generation["id"]), ignore_errors=True)
+
+    # Shipping
+
+    def _write_segment(self, frames: bytes):
+        self.segment_index += 1
+        name = f"{self.segment_index:08d}-{int(time.time() * 1000)}.wal.z"
+        path = os.path.join(self.replica_dir, self.generation, name)
+        with open(path + ".partial", "wb") as f:
+            f.write(zlib.compress(frames))
+        os.replace(path + ".partial", path)
+
+    def _ship(self):
+        """Write every frame committed since our position to a new segment."""
+        position, frames = read_wal(self.wal_path, self.position)
+        if position is None:
+            logger.warning("WAL restarted before it was replicated; starting a new generation")
+            self._start_generation()
+            position, frames = read_wal(self.wal_path, self.position)
+        if frames:
+            self._write_segment(frames)
+            self.frames_shipped += len(frames) // (FRAME_HEADER_SIZE + position.page_size)
+            self.bytes_shipped += len(frames)
+        self.position = position
+
+    def _checkpoint(self):
+        """Checkpoint the WAL ourselves, with every frame in it shipped.
+
+        Writers are held off by a write transaction on a second connection for
+        the few milliseconds it takes to ship the last frames and run a PASSIVE
+        checkpoint, so the checkpoint covers exactly what was shipped. The next
+        writer then restarts the WAL, which our position accepts. If writers
+        are busy we try again on the next sync.
+        """
+        writer = sqlite3.connect(self.db_path, timeout=0, isolation_level=None)
+        try:
+            try:
+                writer.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                return
+            self._ship()
+            self._release_wal()
+            busy, log_frames, checkpointed = self._connection().execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            self._hold_wal()
+            if not busy and checkpointed == log_frames == self.position.frames:
+                self.position = dataclasses.replace(self.position, restartable=True)
+        finally:
+            if writer.in_transaction:
+                writer.rollback()
+            writer.close()
+
+    def sync(self):
+        """Ship every frame committed since the last sync, checkpointing when the WAL gets long."""
+        with self._lock:
+            if self.generation is None or datetime.now() - self.generation_started > GENERATION_MAX_AGE:
+                self._start_generation()
+            self._ship()
+            self.last_sync_at = datetime.now()
+            if self.position.frames >= CHECKPOINT_FRAMES:
+                self._checkpoint()
+
+    # Thread
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+                self.last_error = None
+            except Exception as e:
+                logger.exception("Replication sync failed")
+                self.last_error = str(e)
+                self.generation = None
+                self._release_wal()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if STORAGE_PROFILES[DB_PROFILE]["journal_mode"] != "WAL":
+            logger.warning("Replication needs the wal storage profile; not started")
+            return
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sharpei-replication", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._release_wal()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> dict:
+        """Replication status; `lag_seconds` is the time since the replica last caught up with the WAL."""
+        return {
+            "enabled": self._thread is not None,
+            "generation": self.generation,
+            "frames_shipped": self.frames_shipped,
+            "bytes_shipped": self.bytes_shipped,
+            "last_sync_at": self.last_sync_at,
+            "lag_seconds": (datetime.now() - self.last_sync_at).total_seconds() if self.last_sync_at else None,
+            "last_error": self.last_error,
+        }
+
+
+# Restore
+
+def list_generations(replica_dir: str = REPLICA_DIR) -> List[dict]:
+    """Generations oldest first, each with its id, start time and segment count."""
+    if not os.path.isdir(replica_dir):
+        return []
+    generations = []
+    for name in sorted(os.listdir(replica_dir)):
+        meta_path = os.path.join(replica_dir, name, "generation.json")
+        if not os.path.exists(meta_path):
+            continue
+        with open(meta_path) as f:
+            meta = json.load(f)
+        segments = _segments(os.path.join(replica_dir, name))
+        generations.append({
+            "id": name,
+            "created_at": datetime.fromisoformat(meta["created_at"]),
+            "page_size": meta["page_size"],
+            "segments": len(segments),
+            "last_shipped_at": segments[-1][0] if segments else None,
+        })
+    return generations
+
+
+def _segments(directory: str) -> List[Tuple[datetime, str]]:
+    segments = []
+    for name in os.listdir(directory):
+        if name.endswith(".wal.z"):
+            index, shipped_ms = name[:-len(".wal.z")].split("-")
+            segments.append((int(index), datetime.fromtimestamp(int(shipped_ms) / 1000), name))
+    return [(shipped_at, os.path.join(directory, name)) for _, shipped_at, name in sorted(segments)]
+
+
+def restore(target_path: str, at: Optional[datetime] = None, replica_dir: str = REPLICA_DIR,
+            overwrite: bool = False) -> datetime:
+    """Rebuild the database as it was at `at` (default: the latest shipped state).
+
+    Returns the time of the last segment applied (or of the generation start).
+    """
+    if os.path.exists(target_path) and not overwrite:
+        raise ReplicationError(f"{target_path} already exists")
+    candidates = [g for g in list_generations(replica_dir) if at is None or g["created_at"] <= at]
+    if not candidates:
+        raise ReplicationError("No replica generation covers that time")
+    generation = candidates[-1]
+    directory = os.path.join(replica_dir, generation["id"])
+    page_size = generation["page_size"]
+    frame_size = FRAME_HEADER_SIZE + page_size
+
+    partial_path = target_path + ".partial"
+    shutil.copyfile(os.path.join(directory, "base.db"), partial_path)
+    restored_to = generation["created_at"]
+    with open(partial_path, "r+b") as target:
+        for shipped_at, path in _segments(directory):
+            if at is not None and shipped_at > at:
+                break
+            with open(path, "rb") as f:
+                frames = zlib.decompress(f.read())
+            for offset in range(0, len(frames), frame_size):
+                page_number, commit_size = struct.unpack(">2I", frames[offset:offset + 8])
+                target.seek((page_number - 1) * page_size)
+                target.write(frames[offset + FRAME_HEADER_SIZE:offset + frame_size])
+                if commit_size:
+                    target.truncate(commit_size * page_size)
+            restored_to = shipped_at
+
+    connection = sqlite3.connect(partial_path)
+    try:
+        # Pages shipped from the WAL mark the file as WAL mode; a restore is a standalone file
+        connection.execute("PRAGMA journal_mode=DELETE")
+        result = connection.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        connection.close()
+    if result != "ok":
+        os.remove(partial_path)
+        raise ReplicationError(f"Restored database failed its integrity check: {result}")
+    os.replace(partial_path, target_path)
+    return restored_to
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.replication", description="Sharpei WAL replica")
+    parser.add_argument("--replica", default=REPLICA_DIR, help="replica directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list generations")
+    restore_parser = commands.add_parser("restore", help="rebuild the database at a point in time")
+    restore_parser.add_argument("target")
+    restore_parser.add_argument("--at", type=datetime.fromisoformat, help="local time, e.g. 2025-03-01T09:30:00")
+    restore_parser.add_argument("--force", action="store_true", help="overwrite the target if it exists")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "list":
+            for g in list_generations(args.replica):
+                until = g["last_shipped_at"].isoformat(timespec="seconds") if g["last_shipped_at"] else "-"
+                print(f"{g['id']}  {g['created_at'].isoformat(timespec='seconds')} .. {until}  {g['segments']} segments")
+        else:
+            restored_to = restore(args.target, args.at, args.replica, overwrite=args.force)
+            print(f"Restored {args.target} as of {restored_to.isoformat(timespec='seconds')}")
+    except ReplicationError as e:
+        parser.exit(1, f"error: {e}\n")
+
+
+if __name__ == "__main__":
+    main()
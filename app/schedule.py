@@ -0,0 +1,133 @@
+"""Critical-path schedule analysis over the open part of the dependency graph.
+
+Only open tasks (see graph.is_open) are scheduled; a completed or archived
+blocker no longer holds anything up. Tasks have no durations of their own, so
+each is assumed to take `task_days` days of work, starting today at the
+earliest and not before every open blocker has finished. Due dates are
+day-granular, so a task due on day D has until the end of that day.
+
+Times are in days from the start of today:
+
+- A forward pass in topological order (Kahn's algorithm, O(tasks + edges))
+  gives each task's earliest start and finish.
+- A backward pass gives its latest finish: its own deadline, or the latest
+  start of anything downstream with one, whichever is sooner. Tasks with no
+  deadline anywhere downstream are unconstrained.
+- Slack is latest minus earliest finish. A task is at risk when its slack is
+  negative: at this rate it, or something downstream of it, will miss its
+  due date.
+
+The critical path is the chain of blockers that drives the least-slack task
+(the longest chain, if nothing has a due date). Tasks in a cycle left by old
+data can't be ordered; they are reported separately and left out.
+
+Analyses are cached per day and task_days until the next write (see cache.py).
+"""
+import math
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import cache, models, versioning
+from .graph import is_open
+
+DEFAULT_TASK_DAYS = 1.0
+MAX_TASK_DAYS = 365.0
+
+_tasks = models.Task.__table__.c
+_edges = models.task_dependencies.c
+
+
+def analyze(db: Session, task_days: float = DEFAULT_TASK_DAYS, today: Optional[date] = None) -> dict:
+    """The schedule of every open task, computed at most once per data version."""
+    if not (math.isfinite(task_days) and 0 < task_days <= MAX_TASK_DAYS):
+        raise ValueError(f"task_days must be positive and at most {MAX_TASK_DAYS:g}")
+    today = today or date.today()
+    version = versioning.current(db)
+    key = (today, task_days)
+    result = cache.schedule_results.get(key, version)
+    if result is None:
+        result = _analyze(db, task_days, today)
+        cache.schedule_results.put(key, version, result)
+    return result
+
+
+def _analyze(db: Session, task_days: float, today: date) -> dict:
+    due = dict(db.execute(select(_tasks.id, _tasks.due_date).where(is_open()).order_by(_tasks.id)).all())
+    blockers, dependents = defaultdict(list), defaultdict(list)
+    waiting = dict.fromkeys(due, 0)
+    # Filtered here rather than in SQL: one pass over the edges, whatever plan SQLite would pick
+    for task_id, depends_on_id in db.execute(select(_edges.task_id, _edges.depends_on_id)):
+        if task_id not in due or depends_on_id not in due:
+            continue
+        blockers[task_id].append(depends_on_id)
+        dependents[depends_on_id].append(task_id)
+        waiting[task_id] += 1
+
+    # Kahn's algorithm; `order` grows while it is walked
+    order = [task_id for task_id, count in waiting.items() if count == 0]
+    for task_id in order:
+        for dependent in dependents[task_id]:
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                order.append(dependent)
+    cyclic = [task_id for task_id, count in waiting.items() if count > 0]
+
+    start, finish = {}, {}
+    for task_id in order:
+        start[task_id] = max((finish[b] for b in blockers[task_id]), default=0.0)
+        finish[task_id] = start[task_id] + task_days
+
+    latest = {}
+    for task_id in reversed(order):
+        bounds = [latest[d] - task_days for d in dependents[task_id] if latest.get(d) is not None]
+        if due[task_id] is not None:
+            bounds.append(float((due[task_id].date() - today).days + 1))
+        latest[task_id] = min(bounds) if bounds else None
+    slack = {task_id: None if latest[task_id] is None else latest[task_id] - finish[task_id] for task_id in order}
+
+    critical_path = []
+    constrained = [task_id for task_id in order if slack[task_id] is not None]
+    if constrained:
+        end = min(constrained, key=lambda i: (slack[i], -finish[i], i))
+    else:
+        end = max(order, key=lambda i: (finish[i], -i), default=None)
+    while end is not None:
+        critical_path.append(end)
+        end = max(blockers[end], key=lambda b: (finish[b], -b), default=None)
+    critical_path.reverse()
+    on_path = set(critical_path)
+
+    tasks = [
+        {
+            "id": task_id,
+            "due_date": due[task_id],
+            "earliest_start": start[task_id],
+            "earliest_finish": finish[task_id],
+            "latest_finish": latest[task_id],
+            "slack": slack[task_id],
+            "projected_finish": _projected(today, finish[task_id]),
+            "at_risk": slack[task_id] is not None and slack[task_id] < 0,
+            "critical": task_id in on_path,
+        }
+        for task_id in order
+    ]
+    return {
+        "start": today,
+        "task_days": task_days,
+        "tasks": tasks,
+        "critical_path": critical_path,
+        "at_risk": [t["id"] for t in tasks if t["at_risk"]],
+        "cyclic": cyclic,
+    }
+
+
+def _projected(today: date, finish: float) -> date:
+    """The day work finishing at `finish` ends on; date.max if that is past the calendar."""
+    try:
+        return today + timedelta(days=math.ceil(finish) - 1)
+    except OverflowError:
+        return date.max
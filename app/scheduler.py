@@ -0,0 +1,155 @@
+"""In-process scheduler for periodic jobs.
+
+Started from the app's lifespan, it wakes every TICK_SECONDS and runs, in a
+worker thread, any job whose interval has passed since its last run. The
+last run of each job (and its error, if it failed) is kept in the
+`job_runs` table, so a restart doesn't repeat a job that ran recently and
+request handlers never need to check whether something is due.
+
+Jobs:
+
+- `backup`: a snapshot into the deduplicated backup store (see
+  snapshots.py), every BACKUP_INTERVAL_HOURS.
+- `auto_archive`: archives completed tasks that were due more than
+  AUTO_ARCHIVE_DAYS ago. Off unless SHARPEI_AUTO_ARCHIVE_DAYS is set.
+- `recurrence`: moves completed recurring tasks on to their next due date
+  (see crud.roll_over_recurring_tasks).
+- `maintenance`: compacts the change log, runs `PRAGMA optimize` and
+  checkpoints the WAL.
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from starlette.concurrency import run_in_threadpool
+
+from . import backups, changes, crud, database, models, snapshots
+
+logger = logging.getLogger(__name__)
+
+TICK_SECONDS = 60
+AUTO_ARCHIVE_DAYS = int(os.environ.get("SHARPEI_AUTO_ARCHIVE_DAYS", "0"))
+SCHEDULER_ENABLED = os.environ.get("SHARPEI_SCHEDULER", "on") != "off"
+
+
+@dataclass(frozen=True)
+class Job:
+    name: str
+    interval: timedelta
+    run: Callable[[], object]
+
+
+def _with_session(work):
+    db = database.SessionLocal()
+    try:
+        return work(db)
+    finally:
+        db.close()
+
+
+def run_backup():
+    return snapshots.take_snapshot()
+
+
+def run_auto_archive():
+    if AUTO_ARCHIVE_DAYS <= 0:
+        return 0
+    cutoff = datetime.now() - timedelta(days=AUTO_ARCHIVE_DAYS)
+    return _with_session(lambda db: crud.archive_completed_tasks(db, due_before=cutoff))
+
+
+def run_recurrence():
+    return _with_session(crud.roll_over_recurring_tasks)
+
+
+def run_maintenance():
+    removed = _with_session(changes.compact)
+    with database.engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA optimize")
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)")
+    return removed
+
+
+JOBS = [
+    Job("backup", timedelta(hours=backups.BACKUP_INTERVAL_HOURS), run_backup),
+    Job("auto_archive", timedelta(hours=1), run_auto_archive),
+    Job("recurrence", timedelta(minutes=15), run_recurrence),
+    Job("maintenance", timedelta(hours=6), run_maintenance),
+]
+
+
+def last_runs() -> Dict[str, dict]:
+    """Last run time and error of every job that has run, by job name."""
+    with database.engine.connect() as conn:
+        return {
+            row.name: {"last_run_at": row.last_run_at, "last_error": row.last_error}
+            for row in conn.execute(select(models.job_runs))
+        }
+
+
+def _record_run(name: str, at: datetime, error: Optional[str]):
+    # Bookkeeping only: written outside the ORM session, so it doesn't bump the data version
+    with database.engine.begin() as conn:
+        statement = insert(models.job_runs).values(name=name, last_run_at=at, last_error=error)
+        conn.execute(statement.on_conflict_do_update(
+            index_elements=["name"], set_={"last_run_at": at, "last_error": error}
+        ))
+
+
+def due_jobs(now: datetime, jobs: List[Job] = JOBS) -> List[Job]:
+    runs = last_runs()
+    return [
+        job for job in jobs
+        if job.name not in runs or now - runs[job.name]["last_run_at"] >= job.interval
+    ]
+
+
+def run_due_jobs(now: Optional[datetime] = None, jobs: List[Job] = JOBS) -> List[str]:
+    """Run every job that is due, one after another. Returns the names of the jobs run."""
+    now = now or datetime.now()
+    ran = []
+    for job in due_jobs(now, jobs):
+        error = None
+        try:
+            job.run()
+        except Exception as e:
+            logger.exception("Scheduled job %s failed", job.name)
+            error = str(e)
+        # Recorded even on failure, so a broken job is retried at its interval rather than every tick
+        _record_run(job.name, now, error)
+        ran.append(job.name)
+    return ran
+
+
+class Scheduler:
+    """Runs run_due_jobs every TICK_SECONDS on the event loop, in a worker thread."""
+
+    def __init__(self, tick_seconds: float = TICK_SECONDS):
+        self.tick_seconds = tick_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await run_in_threadpool(run_due_jobs)
+            except Exception:
+                logger.exception("Scheduler tick failed")
+            await asyncio.sleep(self.tick_seconds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -1,11 +1,16 @@
 from pydantic import BaseModel
-from typing import List, Optional
-from datetime import datetime
+from typing import List, Optional, Tuple
+from datetime import date, datetime
 
 
 class ReorderPayload(BaseModel):
     task_ids: List[int]
 
+class MovePayload(BaseModel):
+    before_id: Optional[int] = None
+    after_id: Optional[int] = None
+    priority: Optional[int] = None
+
 class BulkUpdatePayload(BaseModel):
     task_ids: List[int]
     updates: dict
@@ -48,6 +53,8 @@ class TaskUpdate(BaseModel):
 
 class Task(TaskBase):
     id: int
+    # Transitively blocked by an open task (see graph.py); read-only
+    is_blocked: bool = False
     
     class Config:
         from_attributes = True
@@ -61,11 +68,70 @@ class CategoryCreate(CategoryBase):
 
 class Category(CategoryBase):
     id: int
-    tasks: List[Task] = []
+    # Counts of the category's own (non-archived) tasks; smart categories have none
+    open_count: int = 0
+    overdue_count: int = 0
+    completed_count: int = 0
+
+    class Config:
+        from_attributes = True
+
+class CategoryRecord(CategoryBase):
+    id: int
 
     class Config:
         from_attributes = True
 
+class DeletedEntities(BaseModel):
+    tasks: List[int] = []
+    categories: List[int] = []
+    dependencies: List[Tuple[int, int]] = []
+
+class ChangeBatch(BaseModel):
+    # Current state of everything changed after `since`, up to `seq`; fetch again from `seq` while `more`
+    since: int
+    seq: int
+    more: bool
+    tasks: List[Task] = []
+    categories: List[CategoryRecord] = []
+    dependencies: List[Tuple[int, int]] = []
+    deleted: DeletedEntities
+
+class DependencyLink(BaseModel):
+    id: int
+    # Length of the shortest chain of blockers between the two tasks
+    depth: int
+
+class TaskDependencies(BaseModel):
+    # Everything upstream (transitive blockers) and downstream of a task, nearest first
+    blockers: List[DependencyLink]
+    downstream: List[DependencyLink]
+
+class ScheduledTask(BaseModel):
+    id: int
+    due_date: Optional[datetime] = None
+    # In days from the start of the schedule; latest_finish and slack are None without a deadline downstream
+    earliest_start: float
+    earliest_finish: float
+    latest_finish: Optional[float] = None
+    slack: Optional[float] = None
+    projected_finish: date
+    at_risk: bool
+    critical: bool
+
+class Schedule(BaseModel):
+    # Open tasks in topological order; see schedule.py
+    start: date
+    task_days: float
+    tasks: List[ScheduledTask]
+    critical_path: List[int]
+    at_risk: List[int]
+    cyclic: List[int]
+
+class MoveResult(BaseModel):
+    # The moved task first, then any tasks whose position was respaced
+    tasks: List[Task]
+
 # For nested display
 class TaskWithSubtasks(Task):
     subtasks: List['TaskWithSubtasks'] = []
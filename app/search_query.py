@@ -0,0 +1,241 @@
+"""The task search language: tokens, a small AST, and its SQL compilation.
+
+A search string such as `#work !is:completed p:high report` is tokenized on
+whitespace and parsed into a `SearchQuery`: a conjunction of filter clauses
+plus the free-text words. Any clause or word can be negated with a leading
+`!`. See doc/search.md for the user-facing syntax.
+
+Compiling a query builds SQLAlchemy criteria once; `compile_search` keeps the
+results in a bounded LRU keyed by the normalized query string, so repeated
+searches and smart-category clicks skip parsing altogether. Nothing
+time-dependent is baked into a cached plan: `is:overdue` compares against the
+`now` bind parameter, which callers supply at execution time.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Optional, Tuple, Union
+
+from sqlalchemy import DateTime, and_, bindparam, func, literal_column, not_, or_, select
+
+from . import closure, fts, graph, models, tags
+
+PLAN_CACHE_SIZE = 256
+
+PRIORITY_NAMES = {'high': 0, 'h': 0, 'normal': 1, 'n': 1, 'low': 2, 'l': 2}
+STATUSES = ('overdue', 'completed', 'pending', 'archived', 'blocked', 'ready')
+PROPERTIES = {'due': 'due', 'tags': 'tags', 'description': 'description', 'desc': 'description'}
+
+NOW = bindparam("now", type_=DateTime)
+
+
+# AST
+
+@dataclass(frozen=True)
+class Status:
+    """`is:<value>`"""
+    value: str
+
+
+@dataclass(frozen=True)
+class Priority:
+    """`priority:<level>` / `p:<level>`"""
+    level: int
+
+
+@dataclass(frozen=True)
+class Has:
+    """`has:<field>`"""
+    field: str
+
+
+@dataclass(frozen=True)
+class InCategory:
+    """`category:<name>`, a substring match on the category name"""
+    name: str
+
+
+@dataclass(frozen=True)
+class Tagged:
+    """`#a` (match_all) or `#a,#b` (any of them)"""
+    tags: Tuple[str, ...]
+    match_all: bool
+
+
+@dataclass(frozen=True)
+class Word:
+    """A free-text word"""
+    text: str
+
+
+@dataclass(frozen=True)
+class Not:
+    clause: Any
+
+
+Clause = Union[Status, Priority, Has, InCategory, Tagged, Word, Not]
+
+
+@dataclass(frozen=True)
+class SearchQuery:
+    clauses: Tuple[Clause, ...]
+
+    @property
+    def words(self) -> Tuple[str, ...]:
+        return tuple(c.text for c in self.clauses if isinstance(c, Word))
+
+    @property
+    def includes_archived(self) -> bool:
+        """`is:archived` asks for archived tasks, which are hidden by default."""
+        return Status('archived') in self.clauses
+
+
+@dataclass(frozen=True)
+class CompiledSearch:
+    """SQL for a SearchQuery: WHERE criteria plus an optional FTS subquery to join for ranking."""
+    criteria: Tuple[Any, ...]
+    hits: Optional[Any]
+    includes_archived: bool
+    uses_now: bool
+
+
+# Parsing
+
+def normalize(search: str) -> str:
+    """Canonical form of a search string: every part of the language is case-insensitive."""
+    return " ".join(search.lower().split())
+
+
+def parse_token(token: str) -> Optional[Clause]:
+    """Parse one whitespace-delimited token; returns None for filters with unknown values."""
+    if token.startswith('!') and len(token) > 1:
+        inner = parse_token(token[1:])
+        return Not(inner) if inner is not None else None
+
+    if token.startswith('#') and tags.parse_hashtags(token):
+        return Tagged(tuple(tags.parse_hashtags(token)), match_all=',' not in token)
+
+    key, sep, value = token.partition(':')
+    key, value = key.lower(), value.lower()
+    if not sep:
+        return Word(token)
+    if key == 'is':
+        return Status(value) if value in STATUSES else None
+    if key in ('priority', 'p'):
+        if value in PRIORITY_NAMES:
+            return Priority(PRIORITY_NAMES[value])
+        return Priority(int(value)) if value.isdigit() else None
+    if key == 'has':
+        return Has(PROPERTIES[value]) if value in PROPERTIES else None
+    if key == 'category':
+        return InCategory(value) if value else None
+    return Word(token)
+
+
+def parse(search: str) -> SearchQuery:
+    clauses = (parse_token(token) for token in search.split())
+    return SearchQuery(tuple(c for c in clauses if c is not None))
+
+
+# Compilation
+
+def _not_blank(column):
+    return and_(column.isnot(None), column != '')
+
+
+def _text_criterion(words: Tuple[str, ...], use_fts: bool):
+    """Tasks containing every word, as an id subquery (FTS) or a LIKE scan."""
+    match = fts.match_expression(list(words)) if use_fts else None
+    if match:
+        return models.Task.id.in_(
+            select(fts.tasks_fts.c.rowid).where(literal_column("tasks_fts").op("MATCH")(match))
+        )
+    # No FTS5, or nothing indexable (e.g. only punctuation): substring scan
+    text_search = " ".join(words)
+    return or_(*(
+        func.coalesce(column, '').ilike(f"%{text_search}%")
+        for column in (models.Task.title, models.Task.description, models.Task.hashtags)
+    ))
+
+
+def compile_clause(clause: Clause, use_fts: bool):
+    """SQL criterion for one clause. Criteria are NULL-safe, so negating them with NOT is exact."""
+    if isinstance(clause, Not):
+        return not_(compile_clause(clause.clause, use_fts))
+    if isinstance(clause, Status):
+        if clause.value == 'overdue':
+            return and_(
+                models.Task.due_date.isnot(None),
+                models.Task.due_date < NOW,
+                models.Task.completed.isnot(True)
+            )
+        if clause.value == 'completed':
+            return models.Task.completed.is_(True)
+        if clause.value == 'pending':
+            return models.Task.completed.isnot(True)
+        if clause.value == 'blocked':
+            return closure.open_ancestor_exists(models.Task.id)
+        if clause.value == 'ready':
+            return and_(graph.is_open(models.Task), not_(closure.open_ancestor_exists(models.Task.id)))
+        return models.Task.archived.is_(True)
+    if isinstance(clause, Priority):
+        return func.coalesce(models.Task.priority, literal_column("1")) == clause.level
+    if isinstance(clause, Has):
+        if clause.field == 'due':
+            return models.Task.due_date.isnot(None)
+        if clause.field == 'tags':
+            return _not_blank(models.Task.hashtags)
+        return _not_blank(models.Task.description)
+    if isinstance(clause, InCategory):
+        matching = select(models.Category.id).where(models.Category.name.ilike(f"%{clause.name}%"))
+        return and_(models.Task.category_id.isnot(None), models.Task.category_id.in_(matching))
+    if isinstance(clause, Tagged):
+        if clause.match_all:
+            return models.Task.id.in_(tags.tasks_with_all(list(clause.tags)))
+        return models.Task.id.in_(tags.tasks_with_any(list(clause.tags)))
+    if isinstance(clause, Word):
+        return _text_criterion((clause.text,), use_fts)
+    raise TypeError(f"Unknown search clause {clause!r}")
+
+
+def compile_query(query: SearchQuery, use_fts: bool) -> CompiledSearch:
+    criteria = []
+    required_tags = []
+    for clause in query.clauses:
+        if isinstance(clause, Word):
+            continue  # positive words are matched together below
+        if isinstance(clause, Tagged) and clause.match_all:
+            required_tags.extend(t for t in clause.tags if t not in required_tags)
+            continue
+        criteria.append(compile_clause(clause, use_fts))
+
+    if required_tags:
+        criteria.append(compile_clause(Tagged(tuple(required_tags), match_all=True), use_fts))
+
+    hits = None
+    if query.words:
+        match = fts.match_expression(list(query.words)) if use_fts else None
+        if match:
+            # Joined rather than filtered, so results can be ordered by relevance
+            hits = fts.search_subquery(match)
+        else:
+            criteria.append(_text_criterion(query.words, use_fts))
+
+    return CompiledSearch(
+        criteria=tuple(criteria),
+        hits=hits,
+        includes_archived=query.includes_archived,
+        uses_now=Status('overdue') in _all_clauses(query.clauses),
+    )
+
+
+def _all_clauses(clauses):
+    for clause in clauses:
+        yield clause
+        if isinstance(clause, Not):
+            yield from _all_clauses((clause.clause,))
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_search(normalized: str, use_fts: bool) -> CompiledSearch:
+    """Parse and compile a normalized search string (see `normalize`), memoized."""
+    return compile_query(parse(normalized), use_fts)
@@ -0,0 +1,284 @@
+"""Incremental, deduplicated backup snapshots.
+
+A snapshot starts as an online backup (see backups.py) to a temporary file.
+That image is cut into page-aligned chunks of CHUNK_PAGES pages, and each
+chunk is stored once, compressed, under the SHA-256 of its contents. A small
+JSON manifest per snapshot lists its chunks in order. Pages that didn't change
+since the last snapshot hash to chunks that are already stored, so a daily
+snapshot of a mostly unchanged database costs little more than its manifest.
+KEEP_SNAPSHOTS are kept, and chunks no manifest refers to are deleted.
+
+Taking and pruning hold a lock file in the store, so a snapshot taken from the
+command line can't interleave with the scheduled one: pruning would otherwise
+delete chunks a running snapshot has written but not yet listed.
+
+Layout under STORE_DIR:
+
+    snapshots/<id>.json       manifest: page size, file size, chunk hashes
+    chunks/<ab>/<hash>.z      zlib-compressed chunk contents
+    lock                      held while a snapshot is taken or pruned
+
+Restore a snapshot with:
+
+    python -m app.snapshots list
+    python -m app.snapshots restore <id> <target.db>
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional
+
+from . import backups
+from .database import DB_PATH
+
+STORE_DIR = os.path.join(backups.BACKUP_DIR, "store")
+CHUNK_PAGES = 4             # 16 KiB chunks at the default page size
+KEEP_SNAPSHOTS = 400
+COMPRESSION_LEVEL = 6
+LOCK_TIMEOUT_SECONDS = 300
+LOCK_POLL_SECONDS = 0.1
+LOCK_STALE_SECONDS = 6 * 3600   # older lock files were left by a process that died holding them
+
+
+class SnapshotError(Exception):
+    """A snapshot is missing, damaged or can't be restored."""
+
+
+def _snapshot_dir(store_dir: str) -> str:
+    return os.path.join(store_dir, "snapshots")
+
+
+def _chunk_path(store_dir: str, digest: str) -> str:
+    return os.path.join(store_dir, "chunks", digest[:2], f"{digest}.z")
+
+
+def _manifest_path(store_dir: str, snapshot_id: str) -> str:
+    return os.path.join(_snapshot_dir(store_dir), f"{snapshot_id}.json")
+
+
+@contextmanager
+def _store_lock(store_dir: str):
+    """Hold the store's lock file; works across processes as well as threads."""
+    os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, "lock")
+    deadline = time.monotonic() + LOCK_TIMEOUT_SECONDS
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > LOCK_STALE_SECONDS:
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() >= deadline:
+                raise SnapshotError(f"Snapshot store {store_dir} is locked by another process ({path})")
+            time.sleep(LOCK_POLL_SECONDS)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        os.remove(path)
+
+
+def _write_atomically(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial_path = path + ".partial"
+    with open(partial_path, "wb") as f:
+        f.write(data)
+    os.replace(partial_path, path)
+
+
+def _page_size(path: str) -> int:
+    """The page size recorded in a database file's header."""
+    with open(path, "rb") as f:
+        header = f.read(100)
+    size = int.from_bytes(header[16:18], "big")
+    return 65536 if size == 1 else size
+
+
+def list_snapshots(store_dir: str = STORE_DIR) -> List[str]:
+    """Snapshot ids, oldest first."""
+    directory = _snapshot_dir(store_dir)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len(".json")] for name in os.listdir(directory) if name.endswith(".json"))
+
+
+def read_manifest(snapshot_id: str, store_dir: str = STORE_DIR) -> dict:
+    path = _manifest_path(store_dir, snapshot_id)
+    if not os.path.exists(path):
+        raise SnapshotError(f"No snapshot {snapshot_id}")
+    with open(path) as f:
+        return json.load(f)
+
+
+def take_snapshot(source_path: str = DB_PATH, store_dir: str = STORE_DIR) -> Optional[dict]:
+    """Snapshot the database into the store and prune old snapshots.
+
+    Returns the new manifest, or None if there is no database yet.
+    """
+    if not os.path.exists(source_path):
+        return None
+    with _store_lock(store_dir):
+        created_at = datetime.now()
+        base_id = created_at.strftime("%Y%m%d_%H%M%S_%f")
+        snapshot_id, suffix = base_id, 1
+        # The clock can be coarser than a microsecond (or step back)
+        while os.path.exists(_manifest_path(store_dir, snapshot_id)):
+            snapshot_id, suffix = f"{base_id}_{suffix}", suffix + 1
+        image_path = os.path.join(store_dir, f"{snapshot_id}.image")
+
+        backups.copy_database(source_path, image_path)
+        try:
+            chunk_size = _page_size(image_path) * CHUNK_PAGES
+            chunks, new_chunks, stored_bytes = [], 0, 0
+            with open(image_path, "rb") as image:
+                while True:
+                    data = image.read(chunk_size)
+                    if not data:
+                        break
+                    digest = hashlib.sha256(data).hexdigest()
+                    path = _chunk_path(store_dir, digest)
+                    if not os.path.exists(path):
+                        compressed = zlib.compress(data, COMPRESSION_LEVEL)
+                        _write_atomically(path, compressed)
+                        new_chunks += 1
+                        stored_bytes += len(compressed)
+                    chunks.append(digest)
+            manifest = {
+                "id": snapshot_id,
+                "created_at": created_at.isoformat(),
+                "page_size": chunk_size // CHUNK_PAGES,
+                "chunk_size": chunk_size,
+                "size": os.path.getsize(image_path),
+                "chunks": chunks,
+                "new_chunks": new_chunks,
+                "stored_bytes": stored_bytes,
+            }
+        finally:
+            os.remove(image_path)
+
+        _write_atomically(_manifest_path(store_dir, snapshot_id), json.dumps(manifest).encode())
+        _prune(store_dir, KEEP_SNAPSHOTS)
+    return manifest
+
+
+def prune(store_dir: str = STORE_DIR, keep: int = KEEP_SNAPSHOTS) -> int:
+    """Drop all but the newest `keep` snapshots, then every chunk no snapshot uses.
+
+    Returns the number of chunks deleted.
+    """
+    with _store_lock(store_dir):
+        return _prune(store_dir, keep)
+
+
+def _prune(store_dir: str, keep: int) -> int:
+    snapshot_ids = list_snapshots(store_dir)
+    for snapshot_id in snapshot_ids[:-keep]:
+        os.remove(_manifest_path(store_dir, snapshot_id))
+
+    referenced = set()
+    for snapshot_id in snapshot_ids[-keep:]:
+        referenced.update(read_manifest(snapshot_id, store_dir)["chunks"])
+
+    removed = 0
+    chunk_root = os.path.join(store_dir, "chunks")
+    for directory, _, names in os.walk(chunk_root):
+        for name in names:
+            if name.endswith(".z") and name[:-len(".z")] not in referenced:
+                os.remove(os.path.join(directory, name))
+                removed += 1
+    return removed
+
+
+def restore(snapshot_id: str, target_path: str, store_dir: str = STORE_DIR, overwrite: bool = False):
+    """Rebuild a snapshot's database file at `target_path`, verifying every chunk."""
+    manifest = read_manifest(snapshot_id, store_dir)
+    if os.path.exists(target_path) and not overwrite:
+        raise SnapshotError(f"{target_path} already exists")
+
+    partial_path = target_path + ".partial"
+    with open(partial_path, "wb") as target:
+        for digest in manifest["chunks"]:
+            try:
+                with open(_chunk_path(store_dir, digest), "rb") as f:
+                    data = zlib.decompress(f.read())
+            except (OSError, zlib.error) as e:
+                os.remove(partial_path)
+                raise SnapshotError(f"Chunk {digest} of snapshot {snapshot_id} is unreadable: {e}")
+            if hashlib.sha256(data).hexdigest() != digest:
+                os.remove(partial_path)
+                raise SnapshotError(f"Chunk {digest} of snapshot {snapshot_id} is damaged")
+            target.write(data)
+
+    connection = sqlite3.connect(partial_path)
+    try:
+        result = connection.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        connection.close()
+    if result != "ok":
+        os.remove(partial_path)
+        raise SnapshotError(f"Restored snapshot {snapshot_id} failed its integrity check: {result}")
+    os.replace(partial_path, target_path)
+
+
+def store_usage(store_dir: str = STORE_DIR) -> dict:
+    """Number of snapshots and chunks, the bytes on disk and the bytes they represent."""
+    snapshot_ids = list_snapshots(store_dir)
+    chunk_count, stored = 0, 0
+    for directory, _, names in os.walk(os.path.join(store_dir, "chunks")):
+        for name in names:
+            if name.endswith(".z"):
+                chunk_count += 1
+                stored += os.path.getsize(os.path.join(directory, name))
+    return {
+        "snapshots": len(snapshot_ids),
+        "chunks": chunk_count,
+        "stored_bytes": stored,
+        "logical_bytes": sum(read_manifest(i, store_dir)["size"] for i in snapshot_ids),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.snapshots", description="Sharpei backup snapshots")
+    parser.add_argument("--store", default=STORE_DIR, help="snapshot store directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list snapshots")
+    commands.add_parser("take", help="snapshot the database now")
+    restore_parser = commands.add_parser("restore", help="rebuild a snapshot as a database file")
+    restore_parser.add_argument("snapshot_id")
+    restore_parser.add_argument("target")
+    restore_parser.add_argument("--force", action="store_true", help="overwrite the target if it exists")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "list":
+            for snapshot_id in list_snapshots(args.store):
+                manifest = read_manifest(snapshot_id, args.store)
+                print(f"{snapshot_id}  {manifest['size'] / 2**20:8.1f}MB  "
+                      f"{manifest['new_chunks']:5d} new chunks  {manifest['stored_bytes'] / 2**20:8.1f}MB stored")
+            usage = store_usage(args.store)
+            print(f"{usage['snapshots']} snapshots, {usage['logical_bytes'] / 2**20:.1f}MB of database "
+                  f"in {usage['stored_bytes'] / 2**20:.1f}MB on disk")
+        elif args.command == "take":
+            manifest = take_snapshot(store_dir=args.store)
+            print(manifest["id"] if manifest else "No database to snapshot")
+        else:
+            restore(args.snapshot_id, args.target, args.store, overwrite=args.force)
+            print(f"Restored snapshot {args.snapshot_id} to {args.target}")
+    except SnapshotError as e:
+        parser.exit(1, f"error: {e}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Normalized hashtags.
+
+`Task.hashtags` stays the user-facing, free-form string. Every write also
+stores the parsed tags as rows in `task_tags(task_id, tag)` so tag filters are
+exact, indexed lookups rather than substring scans.
+"""
+import re
+from typing import Iterable, List, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+_SEPARATORS = re.compile(r"[\s,]+")
+
+
+def parse_hashtags(hashtags: Optional[str]) -> List[str]:
+    """Split a hashtags string ("#work #q4" or "work, q4") into normalized tags."""
+    if not hashtags:
+        return []
+    tags = []
+    for part in _SEPARATORS.split(hashtags):
+        tag = part.lstrip("#").lower()
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def sync_task_tags(db: Session, task_ids: Optional[Iterable[int]] = None):
+    """Rewrite the task_tags rows of the given tasks (all tasks if None) from their hashtags.
+
+    Runs in the caller's transaction; the caller commits.
+    """
+    query = select(models.Task.id, models.Task.hashtags)
+    clear = delete(models.task_tags)
+    if task_ids is not None:
+        task_ids = list(task_ids)
+        if not task_ids:
+            return
+        query = query.where(models.Task.id.in_(task_ids))
+        clear = clear.where(models.task_tags.c.task_id.in_(task_ids))
+
+    db.execute(clear)
+    rows = [
+        {"task_id": task_id, "tag": tag}
+        for task_id, hashtags in db.execute(query)
+        for tag in parse_hashtags(hashtags)
+    ]
+    if rows:
+        db.execute(insert(models.task_tags), rows)
+
+
+def tasks_with_all(tags: List[str]):
+    """Subquery of task ids carrying every one of the given tags."""
+    return (
+        select(models.task_tags.c.task_id)
+        .where(models.task_tags.c.tag.in_(tags))
+        .group_by(models.task_tags.c.task_id)
+        .having(func.count() == len(tags))
+    )
+
+
+def tasks_with_any(tags: List[str]):
+    """Subquery of task ids carrying at least one of the given tags."""
+    return select(models.task_tags.c.task_id).where(models.task_tags.c.tag.in_(tags))
@@ -0,0 +1,61 @@
+"""Database change counter.
+
+`data_version` holds a single row whose version goes up by one in every
+transaction that writes, and is committed together with that write. Every
+process sharing the database file (the web server, the MCP server) sees the
+same counter, which makes it a cheap validator for result caches and ETags.
+"""
+from typing import Tuple
+
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+Version = Tuple[str, int]
+
+
+def current(db: Session) -> Version:
+    """The database's (epoch, version) as seen by this session."""
+    row = db.execute(
+        select(models.data_version.c.epoch, models.data_version.c.version)
+        .where(models.data_version.c.id == 1)
+    ).one()
+    return row.epoch, row.version
+
+
+def etag(version: Version) -> str:
+    """Strong ETag for responses computed at `version`."""
+    epoch, number = version
+    return f'"{epoch}-{number}"'
+
+
+# Track whether a session wrote anything (unit of work flushes as well as bulk
+# query.update()/delete() and Core DML) and bump the counter in the same commit.
+
+@event.listens_for(Session, "after_flush")
+def _flushed(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _executed(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "before_commit")
+def _bump(session):
+    session.flush()
+    if session.info.pop("wrote", False):
+        # Through the connection, so this UPDATE doesn't mark the session as written again
+        session.connection().execute(
+            update(models.data_version)
+            .where(models.data_version.c.id == 1)
+            .values(version=models.data_version.c.version + 1)
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def _rolled_back(session):
+    session.info.pop("wrote", None)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Benchmark the task_closure table against walking task_dependencies.
+
+Builds a database of N tasks in projects of 50, each task blocked by up to
+three earlier tasks of its project (about two edges per task), then reports
+the closure's size and full rebuild time, the cost of upstream/downstream
+lookups and of the `is:blocked` filter served from the closure versus a
+recursive CTE over the edges, and the cost of keeping the closure up to date
+when blockers are added or removed.
+
+Run with: python benchmarks/bench_closure.py [--tasks 50000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.orm import sessionmaker
+
+from app import closure, crud, models
+from app.database import create_sqlite_engine
+
+PROJECT_SIZE = 50
+LOOKUPS = 1000
+
+ANCESTORS_CTE = text("""
+    WITH RECURSIVE up(id) AS (
+        SELECT depends_on_id FROM task_dependencies WHERE task_id = :task_id
+        UNION
+        SELECT d.depends_on_id FROM task_dependencies d JOIN up ON d.task_id = up.id
+    )
+    SELECT id FROM up
+""")
+DESCENDANTS_CTE = text("""
+    WITH RECURSIVE down(id) AS (
+        SELECT task_id FROM task_dependencies WHERE depends_on_id = :task_id
+        UNION
+        SELECT d.task_id FROM task_dependencies d JOIN down ON d.depends_on_id = down.id
+    )
+    SELECT id FROM down
+""")
+BLOCKED_CTE = text("""
+    WITH RECURSIVE blocked(id) AS (
+        SELECT d.task_id FROM task_dependencies d JOIN tasks b ON b.id = d.depends_on_id
+        WHERE b.completed IS NOT 1 AND b.archived IS NOT 1
+        UNION
+        SELECT d.task_id FROM task_dependencies d JOIN blocked ON d.depends_on_id = blocked.id
+    )
+    SELECT count(*) FROM blocked
+""")
+
+
+def build_database(engine, n_tasks, rng):
+    models.Base.metadata.create_all(bind=engine)
+    rows = [
+        {"id": i, "title": f"Task {i}", "position": i * 1024, "completed": i % 4 == 0, "archived": False}
+        for i in range(1, n_tasks + 1)
+    ]
+    edges = []
+    for i in range(1, n_tasks + 1):
+        first = (i - 1) // PROJECT_SIZE * PROJECT_SIZE + 1
+        earlier = range(first, i)
+        for blocker in rng.sample(earlier, min(len(earlier), rng.randint(1, 3))):
+            edges.append({"task_id": i, "depends_on_id": blocker})
+    with engine.begin() as conn:
+        conn.execute(insert(models.Task), rows)
+        conn.execute(insert(models.task_dependencies), edges)
+    return len(edges)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def per_lookup(conn, ids, fn):
+    start = time.perf_counter()
+    for task_id in ids:
+        fn(conn, task_id)
+    return (time.perf_counter() - start) / len(ids) * 1e6
+
+
+def bench_lookups(engine, n_tasks, rng):
+    ids = [rng.randint(1, n_tasks) for _ in range(LOOKUPS)]
+    with engine.connect() as conn:
+        results = {
+            "ancestors": (
+                per_lookup(conn, ids, closure.ancestors),
+                per_lookup(conn, ids, lambda c, i: c.execute(ANCESTORS_CTE, {"task_id": i}).all()),
+            ),
+            "descendants": (
+                per_lookup(conn, ids, closure.descendants),
+                per_lookup(conn, ids, lambda c, i: c.execute(DESCENDANTS_CTE, {"task_id": i}).all()),
+            ),
+        }
+        blocked = select(func.count()).select_from(models.Task).where(closure.open_ancestor_exists(models.Task.id))
+        via_closure, closure_s = timed(lambda: conn.execute(blocked).scalar())
+        via_cte, cte_s = timed(lambda: conn.execute(BLOCKED_CTE).scalar())
+        assert via_closure == via_cte
+    return results, (closure_s, cte_s, via_closure)
+
+
+def bench_updates(engine, n_tasks, rng):
+    """Average cost of crud.update_task adding one blocker, then removing it again."""
+    db = sessionmaker(bind=engine)()
+    add_s = remove_s = 0.0
+    samples = 200
+    try:
+        for _ in range(samples):
+            task_id = rng.randint(1, n_tasks)
+            if (task_id - 1) % PROJECT_SIZE == 0:
+                task_id += 1
+            task = crud.get_task(db, task_id)
+            original = list(task.blocked_by_ids)
+            first = (task_id - 1) // PROJECT_SIZE * PROJECT_SIZE + 1
+            extra = rng.choice([i for i in range(first, task_id) if i not in original] or [None])
+            if extra is None:
+                continue
+            _, elapsed = timed(crud.update_task, db, task_id, {"blocked_by_ids": original + [extra]})
+            add_s += elapsed
+            _, elapsed = timed(crud.update_task, db, task_id, {"blocked_by_ids": original})
+            remove_s += elapsed
+    finally:
+        db.close()
+    return add_s / samples * 1e3, remove_s / samples * 1e3
+
+
+def remove_database(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    engine = create_sqlite_engine(f"sqlite:///{path}")
+    try:
+        n_edges = build_database(engine, args.tasks, rng)
+        with engine.begin() as conn:
+            _, elapsed = timed(closure.rebuild, conn)
+            rows = conn.execute(select(func.count()).select_from(models.task_closure)).scalar()
+        print(f"{args.tasks} tasks, {n_edges} edges, {rows} closure rows, rebuilt in {elapsed:.2f}s")
+
+        lookups, (closure_s, cte_s, blocked) = bench_lookups(engine, args.tasks, rng)
+        print(f"{'lookup':<12} {'closure':>10} {'recursive CTE':>14}")
+        for name, (via_closure, via_cte) in lookups.items():
+            print(f"{name:<12} {via_closure:>8.0f}us {via_cte:>12.0f}us")
+        print(f"{'is:blocked':<12} {closure_s * 1e3:>8.0f}ms {cte_s * 1e3:>12.0f}ms  ({blocked} tasks)")
+
+        add_ms, remove_ms = bench_updates(engine, args.tasks, rng)
+        print(f"update_task: add a blocker {add_ms:.2f}ms, remove it {remove_ms:.2f}ms")
+    finally:
+        engine.dispose()
+        remove_database(path)
+
+
+if __name__ == "__main__":
+    main()
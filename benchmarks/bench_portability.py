@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Benchmark data export and import throughput and memory.
+
+Builds a database of N tasks (a third of them subtasks, a fifth with a
+blocker), then streams the export in each format, reporting rows per second
+and the peak Python heap allocated while exporting (measured in a second,
+untimed pass). Each export is then imported into an empty database, and
+merged again into the result (a re-import of an unchanged file).
+
+Run with: python benchmarks/bench_portability.py [--tasks 200000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from app import models, portability
+from app.database import create_sqlite_engine
+
+
+def build_database(engine, n_tasks):
+    models.Base.metadata.create_all(bind=engine)
+    rows = [
+        {
+            "id": i,
+            "title": f"Task {i}",
+            "description": f"Description for task {i} " * 4,
+            "priority": i % 3,
+            "position": i * 1024,
+            "hashtags": "#bench" if i % 4 == 0 else None,
+            "completed": i % 7 == 0,
+            "archived": False,
+            "parent_id": i - 1 if i % 3 == 0 and i > 1 else None,
+        }
+        for i in range(1, n_tasks + 1)
+    ]
+    edges = [{"task_id": i, "depends_on_id": i - 2} for i in range(3, n_tasks + 1, 5)]
+    with engine.begin() as conn:
+        conn.execute(insert(models.Task), rows)
+        conn.execute(insert(models.task_dependencies), edges)
+
+
+def bench_export(engine, fmt, n_tasks):
+    start = time.perf_counter()
+    size = sum(len(chunk) for chunk in portability.stream_export(engine, fmt))
+    elapsed = time.perf_counter() - start
+
+    # Separate pass: tracemalloc slows allocation down too much to time under it
+    tracemalloc.start()
+    for _ in portability.stream_export(engine, fmt):
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"rows_per_s": n_tasks / elapsed, "seconds": elapsed, "mb": size / 2**20, "peak_mb": peak / 2**20}
+
+
+def bench_import(export_path, fmt, n_tasks):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    engine = create_sqlite_engine(f"sqlite:///{path}")
+    try:
+        models.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        start = time.perf_counter()
+        with open(export_path, "rb") as stream:
+            counts = portability.import_data(db, stream, fmt)
+        elapsed = time.perf_counter() - start
+        assert counts["tasks"] == n_tasks
+
+        start = time.perf_counter()
+        with open(export_path, "rb") as stream:
+            counts = portability.import_data(db, stream, fmt, mode="merge")
+        merge_elapsed = time.perf_counter() - start
+        db.close()
+        assert counts["tasks"]["unchanged"] == n_tasks
+        return {"rows_per_s": n_tasks / elapsed, "seconds": elapsed,
+                "merge_rows_per_s": n_tasks / merge_elapsed, "merge_seconds": merge_elapsed}
+    finally:
+        engine.dispose()
+        remove_database(path)
+
+
+def remove_database(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=200000)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    engine = create_sqlite_engine(f"sqlite:///{path}")
+    try:
+        build_database(engine, args.tasks)
+        print(f"{args.tasks} tasks")
+        print(f"{'export':<8} {'rows/s':>10} {'time':>8} {'output':>9} {'peak heap':>10}")
+        for fmt in portability.EXPORT_FORMATS:
+            r = bench_export(engine, fmt, args.tasks)
+            print(f"{fmt:<8} {r['rows_per_s']:>10.0f} {r['seconds']:>7.2f}s {r['mb']:>7.1f}MB {r['peak_mb']:>8.1f}MB")
+
+        print(f"{'import':<8} {'rows/s':>10} {'time':>8} {'merge rows/s':>13} {'time':>8}")
+        for fmt in portability.EXPORT_FORMATS:
+            with tempfile.NamedTemporaryFile("w", suffix=f".{fmt}", delete=False) as out:
+                out.writelines(portability.stream_export(engine, fmt))
+            try:
+                r = bench_import(out.name, fmt, args.tasks)
+            finally:
+                os.unlink(out.name)
+            print(f"{fmt:<8} {r['rows_per_s']:>10.0f} {r['seconds']:>7.2f}s"
+                  f" {r['merge_rows_per_s']:>13.0f} {r['merge_seconds']:>7.2f}s")
+    finally:
+        engine.dispose()
+        remove_database(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Benchmark read/write concurrency of the SQLite storage profiles.
+
+Builds a database of N tasks for each storage profile, then runs reader
+threads (listing a page of tasks, like GET /api/tasks) against a writer thread
+(updating and committing single tasks, like a UI save) for a fixed duration.
+
+Run with: python benchmarks/bench_sqlite_concurrency.py [--tasks 50000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.database import STORAGE_PROFILES, create_sqlite_engine
+
+
+def build_database(engine, n_tasks):
+    models.Base.metadata.create_all(bind=engine)
+    rows = [
+        {
+            "title": f"Task {i}",
+            "description": f"Description for task {i} " * 4,
+            "priority": i % 3,
+            "position": i,
+            "completed": i % 7 == 0,
+            "archived": False,
+        }
+        for i in range(n_tasks)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(models.Task), rows)
+
+
+def run_profile(profile, n_tasks, readers, duration):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    engine = create_sqlite_engine(f"sqlite:///{path}", profile=profile)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    build_database(engine, n_tasks)
+
+    stop = threading.Event()
+    read_latencies = []
+    write_latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def reader():
+        local = []
+        while not stop.is_set():
+            start = time.perf_counter()
+            db = Session()
+            try:
+                db.query(models.Task).filter(
+                    models.Task.parent_id == None,
+                    models.Task.archived == False,
+                ).order_by(
+                    models.Task.priority, models.Task.position, models.Task.id.desc()
+                ).limit(200).all()
+            except Exception as e:
+                errors.append(repr(e))
+            finally:
+                db.close()
+            local.append(time.perf_counter() - start)
+        with lock:
+            read_latencies.extend(local)
+
+    def writer():
+        while not stop.is_set():
+            start = time.perf_counter()
+            db = Session()
+            try:
+                task_id = random.randint(1, n_tasks)
+                db.query(models.Task).filter(models.Task.id == task_id).update(
+                    {"description": f"edited {time.time()}"}
+                )
+                db.commit()
+            except Exception as e:
+                errors.append(repr(e))
+                db.rollback()
+            finally:
+                db.close()
+            write_latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+    return {
+        "reads_per_s": len(read_latencies) / duration,
+        "writes_per_s": len(write_latencies) / duration,
+        "read_p50_ms": statistics.median(read_latencies) * 1000 if read_latencies else 0,
+        "read_p99_ms": _percentile(read_latencies, 0.99) * 1000,
+        "write_p99_ms": _percentile(write_latencies, 0.99) * 1000,
+        "errors": len(errors),
+    }
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=50000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{args.tasks} tasks, {args.readers} readers + 1 writer, {args.duration}s per profile")
+    print(f"{'profile':<8} {'reads/s':>9} {'writes/s':>9} {'read p50':>9} {'read p99':>9} {'write p99':>10} {'errors':>7}")
+    for profile in STORAGE_PROFILES:
+        r = run_profile(profile, args.tasks, args.readers, args.duration)
+        print(
+            f"{profile:<8} {r['reads_per_s']:>9.1f} {r['writes_per_s']:>9.1f} "
+            f"{r['read_p50_ms']:>7.1f}ms {r['read_p99_ms']:>7.1f}ms {r['write_p99_ms']:>8.1f}ms {r['errors']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -17,10 +17,12 @@ from datetime import datetime
 from typing import List, Optional
 
 from mcp.server.fastmcp import FastMCP
+from sqlalchemy import inspect
+from sqlalchemy.orm import object_session
 
 from app.models import Task, Category
-from app.database import SessionLocal
-from app import crud, schemas
+from app.database import SessionLocal, init_db
+from app import crud, schemas, changes, schedule
 
 # Create MCP server
 # Use WARNING log level to prevent debug output from corrupting stdio protocol
@@ -38,6 +40,9 @@ def get_db():
 
 def task_to_dict(task: Task) -> dict:
     """Convert a Task object to a dictionary."""
+    if "subtasks" not in inspect(task).dict:
+        # Not prefetched by crud (e.g. freshly created/updated): load the tree in bulk
+        crud.prefetch_task_trees(object_session(task), [task])
     return {
         "id": task.id,
         "title": task.title,
@@ -53,6 +58,7 @@ def task_to_dict(task: Task) -> dict:
         "parent_id": task.parent_id,
         "blocked_by_ids": task.blocked_by_ids,
         "blocking_ids": task.blocking_ids,
+        "is_blocked": task.is_blocked,
         "subtasks": [task_to_dict(sub) for sub in task.subtasks] if task.subtasks else []
     }
 
@@ -105,7 +111,9 @@ def list_tasks(
     search: Optional[str] = None,
     include_archived: bool = False,
     include_subtasks: bool = True,
-    priority: Optional[int] = None
+    priority: Optional[int] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
 ) -> str:
     """List tasks with optional filtering.
 
@@ -115,9 +123,12 @@ def list_tasks(
         include_archived: Whether to include archived tasks (default: False)
         include_subtasks: Whether to include subtask details (default: True)
         priority: Filter by priority (0=High, 1=Normal, 2=Low) (optional)
+        limit: Maximum number of tasks to return; enables pagination (optional)
+        cursor: The next_cursor value from a previous page (optional)
 
     Returns:
-        A list of tasks matching the criteria
+        A list of tasks matching the criteria. When limit is given, an object
+        with "tasks" and "next_cursor" (null on the last page) instead.
     """
     db = get_db()
     try:
@@ -127,13 +138,28 @@ def list_tasks(
         # In original mcp_server.py: "Only top-level tasks if not searching".
         # In crud.get_tasks: Same logic.
         
-        tasks = crud.get_tasks(
-            db, 
-            category_id=category_id, 
-            search=search, 
-            show_archived=include_archived, 
-            priority=priority
-        )
+        next_cursor = None
+        if limit is None:
+            tasks = crud.get_tasks(
+                db, 
+                category_id=category_id, 
+                search=search, 
+                show_archived=include_archived, 
+                priority=priority
+            )
+        else:
+            try:
+                tasks, next_cursor = crud.get_tasks_page(
+                    db,
+                    limit,
+                    cursor,
+                    category_id=category_id,
+                    search=search,
+                    show_archived=include_archived,
+                    priority=priority
+                )
+            except ValueError as e:
+                return json.dumps({"error": str(e)})
 
         result = []
         for task in tasks:
@@ -142,11 +168,41 @@ def list_tasks(
                 task_dict["subtasks"] = f"[{len(task.subtasks)} subtasks]" if task.subtasks else []
             result.append(task_dict)
 
+        if limit is not None:
+            return json.dumps({"tasks": result, "next_cursor": next_cursor}, indent=2)
         return json.dumps(result, indent=2)
     finally:
         db.close()
 
 
+@mcp.tool()
+def get_changes(since: int = 0, client_id: Optional[str] = None, limit: int = 500) -> str:
+    """Get what changed since a previous sync, instead of re-reading every task.
+
+    Args:
+        since: The "seq" value from the previous call; 0 for everything still in the log
+        client_id: A stable name for this client, so its unsynced changes are not pruned (optional)
+        limit: Maximum number of log entries to cover in one call (default: 500)
+
+    Returns:
+        Changed tasks, categories and dependencies in their current state, the
+        ids deleted since then, the new "seq", and "more" if another call is needed.
+        If the log no longer reaches back to `since`, an error: re-read everything
+        with list_tasks and continue from the returned "seq".
+    """
+    db = get_db()
+    try:
+        try:
+            batch = changes.read_changes(db, since, limit, client_id)
+        except changes.HistoryPruned as e:
+            return json.dumps({"error": str(e), "seq": crud.latest_change_seq(db)})
+        except ValueError as e:
+            return json.dumps({"error": str(e)})
+        return json.dumps(schemas.ChangeBatch.model_validate(batch).model_dump(mode="json"), indent=2)
+    finally:
+        db.close()
+
+
 @mcp.tool()
 def get_task(task_id: int) -> str:
     """Get a specific task by ID.
@@ -167,6 +223,57 @@ def get_task(task_id: int) -> str:
         db.close()
 
 
+@mcp.tool()
+def get_ready_tasks(limit: int = crud.DEFAULT_READY_LIMIT) -> str:
+    """Get the tasks that can be worked on right now, most urgent first.
+
+    A task is ready when it is neither completed nor archived and nothing it
+    depends on, directly or transitively, is still open.
+
+    Args:
+        limit: Maximum number of tasks to return (default: 20)
+
+    Returns:
+        Ready tasks ranked by priority, then due date (undated last), then list position
+    """
+    db = get_db()
+    try:
+        try:
+            tasks = crud.get_ready_tasks(db, limit)
+        except ValueError as e:
+            return json.dumps({"error": str(e)})
+        return json.dumps([task_to_dict(task) for task in tasks], indent=2)
+    finally:
+        db.close()
+
+
+@mcp.tool()
+def get_schedule(task_days: float = schedule.DEFAULT_TASK_DAYS) -> str:
+    """Find the dependency chains that will make a due date slip.
+
+    Every open task is assumed to take task_days of work, starting today at
+    the earliest and after all of its open blockers.
+
+    Args:
+        task_days: Days of work assumed per task (default: 1, at most 365)
+
+    Returns:
+        Open tasks in dependency order with their earliest finish, latest
+        finish and slack (in days from today), the ids of at-risk tasks
+        (negative slack), and the critical path: the chain of blockers
+        behind the task with the least slack.
+    """
+    db = get_db()
+    try:
+        try:
+            result = schedule.analyze(db, task_days)
+        except ValueError as e:
+            return json.dumps({"error": str(e)})
+        return json.dumps(schemas.Schedule.model_validate(result).model_dump(mode="json"), indent=2)
+    finally:
+        db.close()
+
+
 @mcp.tool()
 def create_task(
     title: str,
@@ -300,7 +407,10 @@ def update_task(
              return json.dumps(task_to_dict(task), indent=2)
 
         # Use the flexible dict support in crud.update_task
-        task = crud.update_task(db, task_id, update_data)
+        try:
+            task = crud.update_task(db, task_id, update_data)
+        except ValueError as e:
+            return json.dumps({"error": str(e)})
         if not task:
             return json.dumps({"error": f"Task with ID {task_id} not found"})
             
@@ -360,7 +470,7 @@ def archive_completed(category_id: Optional[int] = None) -> str:
         category_id: Only archive completed tasks in this category (optional)
 
     Returns:
-        Number of tasks archived
+        Number of completed tasks archived (subtasks archived with them are not counted)
     """
     db = get_db()
     try:
@@ -403,4 +513,5 @@ def add_subtask(parent_id: int, title: str, description: Optional[str] = None) -
 
 
 if __name__ == "__main__":
+    init_db()
     mcp.run()
@@ -1,7 +1,18 @@
+const TASK_PAGE_SIZE = 100;
+
 function sharpei() {
     return {
         categories: [],
         tasks: [],
+        nextCursor: null,
+        loadingMore: false,
+        listRequestId: 0,
+        listEnd: null,
+        dragOrigin: null,
+        listValidator: null,
+        eventSource: null,
+        liveUpdates: false,
+        refetchTimer: null,
         selectedCategory: null,
         selectedCategoryName: 'All Tasks',
         newCategoryName: '',
@@ -9,6 +20,7 @@ function sharpei() {
         expandedTasks: [],
         searchQuery: '',
         loading: false,
+        importMode: 'replace',
         error: null,
         showArchived: false,
         showDetails: false,
@@ -75,11 +87,17 @@ function sharpei() {
                 .catch(err => this.showError(err.message));
         },
 
+        chooseImportFile(mode) {
+            this.importMode = mode;
+            this.$refs.importFile.click();
+        },
+
         importData(event) {
             const file = event.target.files[0];
             if (!file) return;
 
-            if (!confirm('This will DELETE all current tasks and categories and replace them with the data from the file. Are you sure you want to proceed?')) {
+            const mode = this.importMode;
+            if (mode === 'replace' && !confirm('This will DELETE all current tasks and categories and replace them with the data from the file. Are you sure you want to proceed?')) {
                 event.target.value = '';
                 return;
             }
@@ -88,7 +106,7 @@ function sharpei() {
             formData.append('file', file);
 
             this.loading = true;
-            fetch('/api/data/import', {
+            fetch(`/api/data/import?mode=${mode}`, {
                 method: 'POST',
                 body: formData
             })
@@ -99,7 +117,12 @@ function sharpei() {
             .then(data => {
                 this.showSettings = false;
                 this.fetchCategories().then(() => this.fetchTasks());
-                alert('Data imported successfully!');
+                if (mode === 'merge') {
+                    const t = data.tasks;
+                    alert(`Data merged: ${t.inserted} tasks added, ${t.updated} updated, ${t.unchanged} unchanged.`);
+                } else {
+                    alert('Data imported successfully!');
+                }
             })
             .catch(err => this.showError(err.message))
             .finally(() => {
@@ -210,6 +233,11 @@ function sharpei() {
         init() {
             this.fetchCategories().then(() => {
                 this.fetchTasks();
+                this.connectEvents();
+            });
+
+            this.$watch('viewMode', mode => {
+                if (mode === 'calendar') this.loadAllTasks();
             });
 
             // Timer to notice when the day has flipped
@@ -267,8 +295,8 @@ function sharpei() {
             };
         },
 
-        fetchTasks() {
-            let url = '/api/tasks?';
+        taskListUrl(cursor = null) {
+            let url = `/api/tasks?limit=${TASK_PAGE_SIZE}&`;
             if (this.selectedCategory) {
                 url += `category_id=${this.selectedCategory}&`;
             }
@@ -276,21 +304,97 @@ function sharpei() {
                 url += `q=${encodeURIComponent(this.searchQuery)}&`;
             }
             if (this.showArchived) {
-                url += `show_archived=true`;
+                url += `show_archived=true&`;
+            }
+            if (cursor) {
+                url += `cursor=${encodeURIComponent(cursor)}`;
             }
+            return url;
+        },
+
+        fetchTaskPage(url, etag = null) {
+            // Resolves to null when the server answers 304 Not Modified
+            const headers = etag ? { 'If-None-Match': etag } : {};
+            return fetch(url, { headers }).then(res => {
+                if (res.status === 304) return null;
+                if (!res.ok) throw new Error('Failed to load tasks');
+                return res.json().then(data => ({
+                    data,
+                    cursor: res.headers.get('X-Next-Cursor'),
+                    etag: res.headers.get('ETag')
+                }));
+            });
+        },
+
+        fetchTasks() {
+            // Later pages of a superseded list must not be appended to this one
+            const requestId = ++this.listRequestId;
+            const url = this.taskListUrl();
+            // Only revalidate if the list on screen came from this same URL
+            const etag = this.listValidator && this.listValidator.url === url ? this.listValidator.etag : null;
             this.loading = true;
-            fetch(url)
-                .then(res => {
-                    if (!res.ok) throw new Error('Failed to load tasks');
-                    return res.json();
-                })
-                .then(data => {
+            this.fetchTaskPage(url, etag)
+                .then(page => {
+                    if (requestId !== this.listRequestId || !page) return;
+                    const { data, cursor } = page;
                     this.tasks = data.map(t => this.transformTask(t));
+                    this.nextCursor = cursor;
+                    this.listValidator = page.etag ? { url, etag: page.etag } : null;
+                    if (this.viewMode === 'calendar') {
+                        this.loadAllTasks();
+                    } else {
+                        this.$nextTick(() => this.maybeLoadMore());
+                    }
                 })
                 .catch(err => this.showError(err.message))
                 .finally(() => this.loading = false);
         },
 
+        loadMoreTasks() {
+            if (!this.nextCursor || this.loadingMore) return Promise.resolve(false);
+            const requestId = this.listRequestId;
+            this.loadingMore = true;
+            return this.fetchTaskPage(this.taskListUrl(this.nextCursor))
+                .then(({ data, cursor }) => {
+                    if (requestId !== this.listRequestId) return false;
+                    const known = new Set(this.tasks.map(t => t.id));
+                    const fresh = data.filter(t => !known.has(t.id)).map(t => this.transformTask(t));
+                    this.tasks.push(...fresh);
+                    this.nextCursor = cursor;
+                    return true;
+                })
+                .catch(err => {
+                    this.showError(err.message);
+                    return false;
+                })
+                .finally(() => {
+                    this.loadingMore = false;
+                    this.$nextTick(() => this.maybeLoadMore());
+                });
+        },
+
+        loadAllTasks() {
+            // The calendar needs every task with a due date, not just the first pages
+            return this.loadMoreTasks().then(loaded => {
+                if (loaded && this.nextCursor) return this.loadAllTasks();
+            });
+        },
+
+        observeListEnd(el) {
+            this.listEnd = el;
+            const observer = new IntersectionObserver(entries => {
+                if (entries.some(e => e.isIntersecting)) this.maybeLoadMore();
+            }, { rootMargin: '400px' });
+            observer.observe(el);
+        },
+
+        maybeLoadMore() {
+            if (!this.listEnd || !this.nextCursor || this.viewMode !== 'list') return;
+            if (this.listEnd.getBoundingClientRect().top < window.innerHeight + 400) {
+                this.loadMoreTasks();
+            }
+        },
+
         searchTasks() {
             this.fetchTasks();
         },
@@ -388,34 +492,174 @@ function sharpei() {
                 group: 'tasks',
                 animation: 150,
                 handle: '.drag-handle',
+                onStart: (evt) => {
+                    this.dragOrigin = evt.item.nextSibling;
+                },
                 onEnd: (evt) => {
-                    const taskId = evt.item.getAttribute('data-id');
-                    const fromList = evt.from;
-                    const toList = evt.to;
-                    
-                    const newPriority = parseInt(toList.id.replace('list-p', ''));
-                    const taskIds = Array.from(toList.querySelectorAll('.task-item-container')).map(item => item.getAttribute('data-id'));
-                    
-                    fetch('/api/tasks/reorder', {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({ task_ids: taskIds })
-                    })
-                    .then(res => {
-                        if (!res.ok) throw new Error('Failed to reorder tasks');
-                        if (fromList !== toList) {
-                            const task = this.tasks.find(t => t.id == taskId);
-                            if (task) {
-                                task.priority = newPriority;
-                                this.saveTask(task);
-                            }
-                        } else {
-                            this.fetchTasks();
-                        }
-                    })
-                    .catch(err => this.showError(err.message));
+                    if (evt.from === evt.to && evt.oldIndex === evt.newIndex) return;
+
+                    const taskId = parseInt(evt.item.getAttribute('data-id'));
+                    const move = {
+                        after_id: this.siblingTaskId(evt.item, 'previousElementSibling'),
+                        before_id: this.siblingTaskId(evt.item, 'nextElementSibling')
+                    };
+                    if (evt.from !== evt.to) {
+                        move.priority = parseInt(evt.to.id.replace('list-p', ''));
+                    }
+
+                    // Put the node back where Sortable found it; Alpine re-renders from state
+                    evt.from.insertBefore(evt.item, this.dragOrigin);
+                    this.moveTask(taskId, move);
+                }
+            });
+        },
+
+        siblingTaskId(el, direction) {
+            let sibling = el[direction];
+            while (sibling && !sibling.classList.contains('task-item-container')) {
+                sibling = sibling[direction];
+            }
+            return sibling ? parseInt(sibling.getAttribute('data-id')) : null;
+        },
+
+        moveTask(taskId, move) {
+            // One request changes priority and position; the response holds only the rows that changed
+            fetch(`/api/tasks/${taskId}/move`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(move)
+            })
+            .then(res => {
+                if (!res.ok) throw new Error('Failed to move task');
+                return res.json();
+            })
+            .then(data => this.applyMovedTasks(data.tasks))
+            .catch(err => {
+                this.showError(err.message);
+                this.fetchTasks();
+            });
+        },
+
+        applyMovedTasks(rows) {
+            rows.forEach(row => {
+                const task = this.tasks.find(t => t.id === row.id);
+                if (task) {
+                    task.priority = String(row.priority);
+                    task.position = row.position;
+                }
+            });
+            if (this.searchQuery) {
+                // Search results are ranked server-side; let the server order them
+                this.fetchTasks();
+                return;
+            }
+            this.sortTasks();
+        },
+
+        sortTasks() {
+            this.tasks.sort((a, b) =>
+                (a.priority - b.priority) || ((a.position || 0) - (b.position || 0)) || (b.id - a.id)
+            );
+        },
+
+        connectEvents() {
+            // Committed changes (ours, other tabs', the MCP server's) arrive as task deltas
+            this.eventSource = new EventSource('/api/events');
+            this.eventSource.addEventListener('ready', () => {
+                // Anything may have changed while we were disconnected
+                if (!this.liveUpdates) {
+                    this.liveUpdates = true;
+                    this.fetchTasks();
                 }
             });
+            this.eventSource.addEventListener('task', e => this.applyTaskEvent(JSON.parse(e.data)));
+            // The changes we missed were compacted away
+            this.eventSource.addEventListener('reset', () => this.fetchTasks());
+            this.eventSource.onerror = () => {
+                // EventSource reconnects by itself and resumes from the last event id
+                this.liveUpdates = false;
+            };
+        },
+
+        refreshAfterWrite() {
+            // With live updates on, the write comes back to us as an event
+            if (!this.liveUpdates) this.fetchTasks();
+        },
+
+        locateTask(id, list = this.tasks) {
+            for (const task of list) {
+                if (task.id === id) return { list, task };
+                const found = this.locateTask(id, task.subtasks || []);
+                if (found) return found;
+            }
+            return null;
+        },
+
+        viewAccepts(task) {
+            // Whether a top-level task belongs in the list on screen; null if only the server can tell
+            const category = this.categories.find(c => c.id === this.selectedCategory);
+            if (this.searchQuery || (category && category.query)) return null;
+            if (task.parent_id !== null) return false;
+            if (task.archived && !this.showArchived) return false;
+            return !this.selectedCategory || task.category_id === String(this.selectedCategory);
+        },
+
+        scheduleRefetch() {
+            clearTimeout(this.refetchTimer);
+            this.refetchTimer = setTimeout(() => this.fetchTasks(), 300);
+        },
+
+        applyTaskEvent(event) {
+            const id = event.op === 'delete' ? event.id : event.task.id;
+            const found = this.locateTask(id);
+
+            if (event.op === 'delete') {
+                if (found) found.list.splice(found.list.indexOf(found.task), 1);
+                return;
+            }
+
+            const fresh = this.transformTask(event.task);
+            if (fresh.parent_id !== null) {
+                const parent = this.locateTask(fresh.parent_id);
+                if (found && found.list !== (parent && parent.task.subtasks)) {
+                    found.list.splice(found.list.indexOf(found.task), 1);
+                }
+                if (!parent) return;
+                const existing = parent.task.subtasks.find(t => t.id === id);
+                if (existing) {
+                    if (!this.isDirty(existing)) Object.assign(existing, fresh, { newSubtaskTitle: existing.newSubtaskTitle });
+                } else {
+                    parent.task.subtasks.push(fresh);
+                }
+                return;
+            }
+
+            const accepts = this.viewAccepts(fresh);
+            if (accepts === null) {
+                this.scheduleRefetch();
+                return;
+            }
+            if (found && found.list !== this.tasks) {
+                // Promoted from a subtask
+                found.list.splice(found.list.indexOf(found.task), 1);
+            }
+            const existing = this.tasks.find(t => t.id === id);
+            if (!accepts) {
+                if (existing) this.tasks.splice(this.tasks.indexOf(existing), 1);
+                return;
+            }
+            if (existing) {
+                // Unsaved edits in an open details panel win; saving them will send them back
+                if (this.isDirty(existing)) return;
+                Object.assign(existing, fresh, { newSubtaskTitle: existing.newSubtaskTitle });
+            } else {
+                this.tasks.push(fresh);
+            }
+            this.sortTasks();
+            if (!existing && this.nextCursor && this.tasks[this.tasks.length - 1] === fresh) {
+                // Sorts past the pages loaded so far; it will arrive with a later page
+                this.tasks.pop();
+            }
         },
 
         selectCategory(id) {
@@ -526,7 +770,7 @@ function sharpei() {
             .then(res => {
                 if (!res.ok) throw new Error('Bulk update failed');
                 this.deselectAll();
-                this.fetchTasks();
+                this.refreshAfterWrite();
             })
             .catch(err => this.showError(err.message));
         },
@@ -545,7 +789,7 @@ function sharpei() {
             .then(res => {
                 if (!res.ok) throw new Error('Bulk delete failed');
                 this.deselectAll();
-                this.fetchTasks();
+                this.refreshAfterWrite();
             })
             .catch(err => this.showError(err.message));
         },
@@ -582,7 +826,7 @@ function sharpei() {
             .then(res => {
                 if (!res.ok) throw new Error('Failed to add task');
                 this.newTaskTitle = '';
-                this.fetchTasks();
+                this.refreshAfterWrite();
             })
             .catch(err => this.showError(err.message));
         },
@@ -602,7 +846,7 @@ function sharpei() {
             .then(res => {
                 if (!res.ok) throw new Error('Failed to add subtask');
                 parentTask.newSubtaskTitle = '';
-                this.fetchTasks();
+                this.refreshAfterWrite();
             })
             .catch(err => this.showError(err.message));
         },
@@ -638,11 +882,12 @@ function sharpei() {
                 body: JSON.stringify(data)
             })
             .then(res => {
-                if (!res.ok) throw new Error('Failed to save task');
+                // e.g. a blocker that would create a dependency cycle
+                if (!res.ok) return res.json().then(err => { throw new Error(err.detail || 'Failed to save task'); });
                 if (this.taskSnapshots[task.id]) {
                     this.taskSnapshots[task.id] = this._snapshotFields(task);
                 }
-                this.fetchTasks();
+                this.refreshAfterWrite();
             })
             .catch(err => this.showError(err.message));
         },
@@ -652,7 +897,7 @@ function sharpei() {
                 fetch(`/api/tasks/${id}`, { method: 'DELETE' })
                     .then(res => {
                         if (!res.ok) throw new Error('Failed to delete task');
-                        this.fetchTasks();
+                        this.refreshAfterWrite();
                     })
                     .catch(err => this.showError(err.message));
             }
@@ -669,7 +914,7 @@ function sharpei() {
                     return res.json();
                 })
                 .then(data => {
-                    this.fetchTasks();
+                    this.refreshAfterWrite();
                 })
                 .catch(err => this.showError(err.message));
         },
@@ -719,11 +964,8 @@ function sharpei() {
         },
 
         isBlocked(task) {
-            if (!task.blocked_by_ids || task.blocked_by_ids.length === 0) return false;
-            return task.blocked_by_ids.some(id => {
-                const blocker = this.tasks.find(t => t.id == id);
-                return blocker && !blocker.completed;
-            });
+            // Computed server-side over the whole dependency graph, not just the loaded tasks
+            return !!task.is_blocked;
         },
 
         formatDate(dateStr, isCompleted = false) {
@@ -8,12 +8,13 @@ import time
 
 import pytest
 import uvicorn
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from app.cache import schedule_results, task_results
+from app.database import create_sqlite_engine
 from app.models import Base
 
 
@@ -36,7 +37,10 @@ def test_db():
     os.close(fd)
 
     db_url = f"sqlite:///{db_path}"
-    engine = create_engine(db_url, connect_args={"check_same_thread": False})
+    # Cached results are only valid for the database they came from
+    task_results.clear()
+    schedule_results.clear()
+    engine = create_sqlite_engine(db_url)
     Base.metadata.create_all(bind=engine)
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -47,8 +51,11 @@ def test_db():
         "SessionLocal": SessionLocal
     }
 
-    # Cleanup
-    os.unlink(db_path)
+    # Cleanup (WAL mode leaves -wal/-shm side files next to the database)
+    engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
 
 
 @pytest.fixture
@@ -72,6 +79,9 @@ def api_client(test_db, monkeypatch):
     from app import database
     monkeypatch.setattr(database, 'engine', test_db['engine'])
     monkeypatch.setattr(database, 'SessionLocal', test_db['SessionLocal'])
+    # Periodic jobs are tested directly (test_scheduler.py), not left running behind requests
+    from app import scheduler
+    monkeypatch.setattr(scheduler, 'SCHEDULER_ENABLED', False)
 
     # Now import and create the app
     from app.main import app
@@ -107,6 +117,8 @@ def live_server(test_db, monkeypatch):
     from app import database
     monkeypatch.setattr(database, 'engine', test_db['engine'])
     monkeypatch.setattr(database, 'SessionLocal', test_db['SessionLocal'])
+    from app import scheduler
+    monkeypatch.setattr(scheduler, 'SCHEDULER_ENABLED', False)
 
     # Import app after patching
     from app.main import app
@@ -2,6 +2,8 @@
 """Tests for the Sharpei FastAPI endpoints."""
 import pytest
 
+from app.crud import POSITION_GAP, encode_cursor
+
 
 class TestRootEndpoint:
     """Test the root endpoint."""
@@ -84,6 +86,52 @@ class TestCategoryEndpoints:
         assert tasks[0]["category_id"] is None
 
 
+class TestCategorySummaries:
+    """Test the lightweight category listing and the per-category task endpoint."""
+
+    def test_list_has_counts_not_tasks(self, api_client):
+        """Test that categories carry aggregate counts instead of embedded tasks."""
+        cat = api_client.post("/api/categories", json={"name": "Work"}).json()
+        api_client.post("/api/tasks", json={"title": "Open", "category_id": cat["id"]})
+        api_client.post("/api/tasks", json={
+            "title": "Late", "category_id": cat["id"], "due_date": "2000-01-01T12:00:00"
+        })
+        done = api_client.post("/api/tasks", json={"title": "Done", "category_id": cat["id"]}).json()
+        api_client.put(f"/api/tasks/{done['id']}", json={"completed": True})
+        archived = api_client.post("/api/tasks", json={"title": "Old", "category_id": cat["id"]}).json()
+        api_client.put(f"/api/tasks/{archived['id']}", json={"completed": True, "archived": True})
+
+        data = api_client.get("/api/categories").json()
+
+        assert data == [{
+            "id": cat["id"], "name": "Work", "query": None,
+            "open_count": 2, "overdue_count": 1, "completed_count": 1
+        }]
+
+    def test_category_tasks_paginated(self, api_client):
+        """Test paging through one category's tasks."""
+        cat = api_client.post("/api/categories", json={"name": "Work"}).json()
+        for i in range(3):
+            api_client.post("/api/tasks", json={"title": f"Work {i}", "category_id": cat["id"]})
+        api_client.post("/api/tasks", json={"title": "Elsewhere"})
+
+        first = api_client.get(f"/api/categories/{cat['id']}/tasks", params={"limit": 2})
+        second = api_client.get(
+            f"/api/categories/{cat['id']}/tasks",
+            params={"limit": 2, "cursor": first.headers["X-Next-Cursor"]}
+        )
+
+        assert [t["title"] for t in first.json()] == ["Work 0", "Work 1"]
+        assert [t["title"] for t in second.json()] == ["Work 2"]
+        assert "X-Next-Cursor" not in second.headers
+
+    def test_category_tasks_not_found(self, api_client):
+        """Test the per-category task endpoint with an unknown category."""
+        response = api_client.get("/api/categories/999/tasks")
+
+        assert response.status_code == 404
+
+
 class TestTaskEndpoints:
     """Test task API endpoints."""
 
@@ -239,6 +287,84 @@ class TestTaskFiltering:
         assert response.status_code == 200
         assert len(response.json()) == 1
 
+    def test_search_prefix_match(self, api_client):
+        """Test that free-text search matches word prefixes."""
+        api_client.post("/api/tasks", json={"title": "Quarterly planning"})
+        api_client.post("/api/tasks", json={"title": "Plant tomatoes"})
+
+        response = api_client.get("/api/tasks", params={"q": "plan"})
+
+        titles = [t["title"] for t in response.json()]
+        assert sorted(titles) == ["Plant tomatoes", "Quarterly planning"]
+
+    def test_search_ranks_title_matches_first(self, api_client):
+        """Test that search results are ordered by relevance within a priority."""
+        api_client.post("/api/tasks", json={"title": "Misc", "description": "mentions invoice once"})
+        api_client.post("/api/tasks", json={"title": "Invoice ACME"})
+
+        response = api_client.get("/api/tasks", params={"q": "invoice"})
+
+        titles = [t["title"] for t in response.json()]
+        assert titles == ["Invoice ACME", "Misc"]
+
+    def test_search_index_follows_updates(self, api_client):
+        """Test that the search index is kept in sync on update and delete."""
+        task = api_client.post("/api/tasks", json={"title": "Old name"}).json()
+        api_client.put(f"/api/tasks/{task['id']}", json={"title": "Renamed"})
+
+        assert api_client.get("/api/tasks", params={"q": "old"}).json() == []
+        assert len(api_client.get("/api/tasks", params={"q": "renamed"}).json()) == 1
+
+        api_client.delete(f"/api/tasks/{task['id']}")
+        assert api_client.get("/api/tasks", params={"q": "renamed"}).json() == []
+
+    def test_search_without_fts(self, api_client, monkeypatch):
+        """Test the LIKE fallback used when FTS5 is unavailable."""
+        from app import fts
+        monkeypatch.setattr(fts, "is_available", lambda db: False)
+        api_client.post("/api/tasks", json={"title": "Buy milk"})
+        api_client.post("/api/tasks", json={"title": "Clean house"})
+
+        response = api_client.get("/api/tasks", params={"q": "milk"})
+
+        assert [t["title"] for t in response.json()] == ["Buy milk"]
+
+    def test_tag_filter_is_exact(self, api_client):
+        """Test that #tag matches the whole tag, not a substring of another tag."""
+        api_client.post("/api/tasks", json={"title": "Standup", "hashtags": "#work"})
+        api_client.post("/api/tasks", json={"title": "Gym", "hashtags": "#workout"})
+
+        response = api_client.get("/api/tasks", params={"q": "#work"})
+
+        assert [t["title"] for t in response.json()] == ["Standup"]
+
+    def test_tag_filter_and_or(self, api_client):
+        """Test multi-tag filters: space-separated tags AND, comma-separated tags OR."""
+        api_client.post("/api/tasks", json={"title": "Both", "hashtags": "#work #urgent"})
+        api_client.post("/api/tasks", json={"title": "Work only", "hashtags": "#Work"})
+        api_client.post("/api/tasks", json={"title": "Home only", "hashtags": "home"})
+
+        both = api_client.get("/api/tasks", params={"q": "#work #urgent"}).json()
+        assert [t["title"] for t in both] == ["Both"]
+
+        either = api_client.get("/api/tasks", params={"q": "#urgent,#home"}).json()
+        assert sorted(t["title"] for t in either) == ["Both", "Home only"]
+
+    def test_tag_filter_follows_updates(self, api_client):
+        """Test that tag rows are rewritten on update and bulk update."""
+        task = api_client.post("/api/tasks", json={"title": "Retag me", "hashtags": "#old"}).json()
+        api_client.put(f"/api/tasks/{task['id']}", json={"hashtags": "#new"})
+
+        assert api_client.get("/api/tasks", params={"q": "#old"}).json() == []
+        assert len(api_client.get("/api/tasks", params={"q": "#new"}).json()) == 1
+
+        api_client.post("/api/tasks/bulk-update", json={
+            "task_ids": [task["id"]],
+            "updates": {"hashtags": "#bulk"}
+        })
+        assert api_client.get("/api/tasks", params={"q": "#new"}).json() == []
+        assert len(api_client.get("/api/tasks", params={"q": "#bulk"}).json()) == 1
+
     def test_archived_hidden_by_default(self, api_client):
         """Test that archived tasks are hidden by default."""
         task = api_client.post("/api/tasks", json={"title": "Archive me"}).json()
@@ -317,6 +443,35 @@ class TestTaskFiltering:
         assert len(resp.json()) == 1
         assert resp.json()[0]["title"] == "Urgent mail"
 
+    def test_smart_search_negation(self, api_client):
+        """Test that a leading ! negates a filter, including rows with NULL fields."""
+        done = api_client.post("/api/tasks", json={"title": "Done", "hashtags": "#docs"}).json()
+        api_client.put(f"/api/tasks/{done['id']}", json={"title": "Done", "completed": True})
+        api_client.post("/api/tasks", json={"title": "Open docs", "hashtags": "#docs"})
+        api_client.post("/api/tasks", json={"title": "Open plain"})
+
+        resp = api_client.get("/api/tasks", params={"q": "has:tags !is:completed"})
+        assert [t["title"] for t in resp.json()] == ["Open docs"]
+
+        resp = api_client.get("/api/tasks", params={"q": "!#docs"})
+        assert [t["title"] for t in resp.json()] == ["Open plain"]
+
+        resp = api_client.get("/api/tasks", params={"q": "!has:tags"})
+        assert [t["title"] for t in resp.json()] == ["Open plain"]
+
+    def test_smart_search_overdue(self, api_client):
+        """Test that is:overdue compares against the current time, not the time it was first parsed."""
+        api_client.post("/api/tasks", json={"title": "Past", "due_date": "2000-01-01T00:00:00"})
+        api_client.post("/api/tasks", json={"title": "Future", "due_date": "2999-01-01T00:00:00"})
+        api_client.post("/api/tasks", json={"title": "Undated"})
+
+        for q in ("is:overdue", "IS:OVERDUE"):
+            resp = api_client.get("/api/tasks", params={"q": q})
+            assert [t["title"] for t in resp.json()] == ["Past"]
+
+        resp = api_client.get("/api/tasks", params={"q": "!is:overdue"})
+        assert sorted(t["title"] for t in resp.json()) == ["Future", "Undated"]
+
     def test_smart_category(self, api_client):
         """Test that smart categories correctly filter tasks."""
         # Create a normal task and an overdue task
@@ -340,6 +495,169 @@ class TestTaskFiltering:
         assert tasks[0]["title"] == "High priority task"
 
 
+class TestTaskPagination:
+    """Test keyset pagination of the task list."""
+
+    def _collect(self, api_client, params):
+        pages = []
+        cursor = None
+        while True:
+            query = dict(params, **({"cursor": cursor} if cursor else {}))
+            response = api_client.get("/api/tasks", params=query)
+            assert response.status_code == 200
+            pages.append([t["title"] for t in response.json()])
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                return pages
+
+    def test_pages_cover_full_list_in_order(self, api_client):
+        """Test that walking the cursors yields the unpaginated list exactly once."""
+        for i in range(7):
+            api_client.post("/api/tasks", json={"title": f"Task {i}", "priority": i % 3})
+
+        full = [t["title"] for t in api_client.get("/api/tasks").json()]
+        pages = self._collect(api_client, {"limit": 3})
+
+        assert [len(p) for p in pages] == [3, 3, 1]
+        assert [title for page in pages for title in page] == full
+
+    def test_pagination_with_search_ranking(self, api_client):
+        """Test that cursors also work for relevance-ranked searches."""
+        for i in range(5):
+            api_client.post("/api/tasks", json={"title": f"Report {i}", "description": "report " * i})
+
+        full = [t["title"] for t in api_client.get("/api/tasks", params={"q": "report"}).json()]
+        pages = self._collect(api_client, {"q": "report", "limit": 2})
+
+        assert [title for page in pages for title in page] == full
+
+    def test_no_cursor_on_last_page(self, api_client):
+        """Test that a page holding the rest of the list has no next cursor."""
+        api_client.post("/api/tasks", json={"title": "Only"})
+
+        response = api_client.get("/api/tasks", params={"limit": 10})
+
+        assert len(response.json()) == 1
+        assert "X-Next-Cursor" not in response.headers
+
+    def test_invalid_cursor(self, api_client):
+        """Test that a malformed cursor is rejected."""
+        response = api_client.get("/api/tasks", params={"limit": 10, "cursor": "not-a-cursor"})
+
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("values", [[{"a": 1}, 0, 1], [[1], 0, 1], [1, True, 1]])
+    def test_cursor_with_non_scalar_values(self, api_client, values):
+        """Test that a well-formed cursor holding non-scalar sort keys is rejected."""
+        api_client.post("/api/tasks", json={"title": "Task"})
+        response = api_client.get("/api/tasks", params={"limit": 10, "cursor": encode_cursor(values)})
+
+        assert response.status_code == 400
+
+
+class TestTaskListCache:
+    """Test the versioned task list result cache."""
+
+    def _stats(self, api_client):
+        return api_client.get("/api/cache/stats").json()
+
+    def test_repeated_query_hits_cache(self, api_client):
+        """Test that an unchanged query is served from the cache."""
+        cat = api_client.post("/api/categories", json={"name": "Hot", "query": "priority:high"}).json()
+        api_client.post("/api/tasks", json={"title": "High", "priority": 0})
+
+        first = api_client.get("/api/tasks", params={"category_id": cat["id"]})
+        second = api_client.get("/api/tasks", params={"category_id": cat["id"]})
+
+        assert first.json() == second.json() == [first.json()[0]]
+        stats = self._stats(api_client)
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_writes_invalidate(self, api_client):
+        """Test that every kind of write makes the next read a miss."""
+        t1 = api_client.post("/api/tasks", json={"title": "Task 1"}).json()
+        t2 = api_client.post("/api/tasks", json={"title": "Task 2"}).json()
+        writes = [
+            lambda: api_client.put(f"/api/tasks/{t1['id']}", json={"title": "Renamed"}),
+            lambda: api_client.post("/api/tasks/bulk-update", json={"task_ids": [t1["id"]], "updates": {"completed": True}}),
+            lambda: api_client.post("/api/tasks/reorder", json={"task_ids": [t2["id"], t1["id"]]}),
+            lambda: api_client.post("/api/tasks/archive-completed"),
+        ]
+
+        for write in writes:
+            before = api_client.get("/api/tasks").json()
+            misses = self._stats(api_client)["misses"]
+            write()
+            assert api_client.get("/api/tasks").json() != before
+            assert self._stats(api_client)["misses"] == misses + 1
+
+    def test_pages_cached_with_cursor(self, api_client):
+        """Test that cached pages keep their X-Next-Cursor header."""
+        for i in range(3):
+            api_client.post("/api/tasks", json={"title": f"Task {i}"})
+
+        first = api_client.get("/api/tasks", params={"limit": 2})
+        second = api_client.get("/api/tasks", params={"limit": 2})
+
+        assert second.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+        assert self._stats(api_client)["hits"] == 1
+
+
+class TestConditionalGet:
+    """Test ETag validators on the read endpoints."""
+
+    def test_task_list_not_modified(self, api_client):
+        """Test that a matching If-None-Match gets a 304 until something is written."""
+        api_client.post("/api/tasks", json={"title": "Task 1"})
+        first = api_client.get("/api/tasks")
+        etag = first.headers["ETag"]
+
+        again = api_client.get("/api/tasks", headers={"If-None-Match": etag})
+        assert again.status_code == 304
+        assert again.content == b""
+
+        api_client.post("/api/tasks", json={"title": "Task 2"})
+        changed = api_client.get("/api/tasks", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["ETag"] != etag
+        assert len(changed.json()) == 2
+
+    def test_task_not_modified(self, api_client):
+        """Test the validator on a single task."""
+        task = api_client.post("/api/tasks", json={"title": "Task"}).json()
+        url = f"/api/tasks/{task['id']}"
+
+        etag = api_client.get(url).headers["ETag"]
+        assert api_client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    def test_no_validator_for_category_counts(self, api_client):
+        """Test that the category list, whose overdue counts change with time alone, carries no ETag."""
+        api_client.post("/api/categories", json={"name": "Work"})
+
+        response = api_client.get("/api/categories")
+
+        assert response.status_code == 200
+        assert "ETag" not in response.headers
+
+    def test_writes_outside_the_api_change_etag(self, api_client, mcp_server):
+        """Test that writes from another session (e.g. the MCP server) are seen."""
+        etag = api_client.get("/api/tasks").headers["ETag"]
+
+        mcp_server.create_task(title="From MCP")
+
+        response = api_client.get("/api/tasks", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert [t["title"] for t in response.json()] == ["From MCP"]
+
+    def test_no_validator_for_clock_dependent_search(self, api_client):
+        """Test that is:overdue results, which change with time alone, carry no ETag."""
+        response = api_client.get("/api/tasks", params={"q": "is:overdue"})
+
+        assert response.status_code == 200
+        assert "ETag" not in response.headers
+
+
 class TestTaskReordering:
     """Test task reordering endpoint."""
 
@@ -362,6 +680,145 @@ class TestTaskReordering:
         assert titles == ["Task 3", "Task 1", "Task 2"]
 
 
+class TestTaskMove:
+    """Test the single-row move endpoint."""
+
+    def _titles(self, api_client):
+        return [t["title"] for t in api_client.get("/api/tasks").json()]
+
+    def test_move_between_neighbours(self, api_client):
+        """Test that a move places the task between its neighbours."""
+        t1 = api_client.post("/api/tasks", json={"title": "Task 1"}).json()
+        t2 = api_client.post("/api/tasks", json={"title": "Task 2"}).json()
+        t3 = api_client.post("/api/tasks", json={"title": "Task 3"}).json()
+
+        response = api_client.post(f"/api/tasks/{t3['id']}/move", json={
+            "after_id": t1["id"], "before_id": t2["id"]
+        })
+
+        assert response.status_code == 200
+        moved = response.json()["tasks"]
+        assert [t["id"] for t in moved] == [t3["id"]]
+        assert t1["position"] < moved[0]["position"] < t2["position"]
+        assert self._titles(api_client) == ["Task 1", "Task 3", "Task 2"]
+
+    def test_move_to_ends(self, api_client):
+        """Test moving to the top (before only) and the bottom (after only)."""
+        t1 = api_client.post("/api/tasks", json={"title": "Task 1"}).json()
+        t2 = api_client.post("/api/tasks", json={"title": "Task 2"}).json()
+        t3 = api_client.post("/api/tasks", json={"title": "Task 3"}).json()
+
+        api_client.post(f"/api/tasks/{t3['id']}/move", json={"before_id": t1["id"]})
+        assert self._titles(api_client) == ["Task 3", "Task 1", "Task 2"]
+
+        api_client.post(f"/api/tasks/{t1['id']}/move", json={"after_id": t2["id"]})
+        assert self._titles(api_client) == ["Task 3", "Task 2", "Task 1"]
+
+    def test_move_writes_one_row(self, api_client, test_db):
+        """Test that a move only updates the moved task."""
+        from sqlalchemy import event
+        ids = [api_client.post("/api/tasks", json={"title": f"Task {i}"}).json()["id"] for i in range(20)]
+        updates = []
+
+        def count_updates(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("UPDATE tasks"):
+                updates.append(1 if not executemany else len(parameters))
+
+        event.listen(test_db["engine"], "before_cursor_execute", count_updates)
+        try:
+            api_client.post(f"/api/tasks/{ids[-1]}/move", json={"after_id": ids[0], "before_id": ids[1]})
+        finally:
+            event.remove(test_db["engine"], "before_cursor_execute", count_updates)
+
+        assert sum(updates) == 1
+
+    def test_repeated_moves_rebalance(self, api_client):
+        """Test that exhausting a gap respaces the list and keeps the order right."""
+        first = api_client.post("/api/tasks", json={"title": "First"}).json()
+        last = api_client.post("/api/tasks", json={"title": "Last"}).json()
+        expected = ["First", "Last"]
+        # Keep inserting directly after "First": halves the same gap every time
+        for i in range(15):
+            t = api_client.post("/api/tasks", json={"title": f"Mid {i}"}).json()
+            response = api_client.post(f"/api/tasks/{t['id']}/move", json={"after_id": first["id"]})
+            assert response.status_code == 200
+            expected.insert(1, f"Mid {i}")
+
+        assert self._titles(api_client) == expected
+
+    def test_move_returns_rebalanced_rows(self, api_client):
+        """Test that a move which respaces the list returns every row it rewrote."""
+        first = api_client.post("/api/tasks", json={"title": "First"}).json()
+        ids = [first["id"], api_client.post("/api/tasks", json={"title": "Last"}).json()["id"]]
+        # Halve the gap after "First" until it runs out and the list is respaced
+        for i in range(15):
+            t = api_client.post("/api/tasks", json={"title": f"Mid {i}"}).json()
+            ids.append(t["id"])
+            moved = api_client.post(f"/api/tasks/{t['id']}/move", json={"after_id": first["id"]}).json()["tasks"]
+            if len(moved) > 1:
+                break
+
+        assert moved[0]["id"] == t["id"]
+        assert {row["id"] for row in moved} == set(ids)
+
+    def test_move_across_priorities(self, api_client):
+        """Test that priority and position change together in one call."""
+        high1 = api_client.post("/api/tasks", json={"title": "High 1", "priority": 0}).json()
+        high2 = api_client.post("/api/tasks", json={"title": "High 2", "priority": 0}).json()
+        normal = api_client.post("/api/tasks", json={"title": "Normal"}).json()
+
+        response = api_client.post(f"/api/tasks/{normal['id']}/move", json={
+            "priority": 0, "after_id": high1["id"], "before_id": high2["id"]
+        })
+
+        assert response.status_code == 200
+        moved = response.json()["tasks"][0]
+        assert moved["priority"] == 0
+        assert high1["position"] < moved["position"] < high2["position"]
+        assert self._titles(api_client) == ["High 1", "Normal", "High 2"]
+
+    def test_move_across_priorities_rejects_old_list(self, api_client):
+        """Test that neighbours are checked against the target priority list."""
+        n1 = api_client.post("/api/tasks", json={"title": "Normal 1"}).json()
+        n2 = api_client.post("/api/tasks", json={"title": "Normal 2"}).json()
+
+        response = api_client.post(f"/api/tasks/{n2['id']}/move", json={
+            "priority": 0, "after_id": n1["id"]
+        })
+
+        assert response.status_code == 400
+        assert api_client.get(f"/api/tasks/{n2['id']}").json()["priority"] == 1
+
+    def test_move_rejects_other_list(self, api_client):
+        """Test that neighbours must be in the same priority list."""
+        t1 = api_client.post("/api/tasks", json={"title": "Normal"}).json()
+        t2 = api_client.post("/api/tasks", json={"title": "High", "priority": 0}).json()
+
+        response = api_client.post(f"/api/tasks/{t1['id']}/move", json={"after_id": t2["id"]})
+
+        assert response.status_code == 400
+
+    def test_move_rejects_inverted_neighbours(self, api_client):
+        """Test that after_id must come before before_id, and that nothing moves if it doesn't."""
+        first = api_client.post("/api/tasks", json={"title": "First"}).json()
+        second = api_client.post("/api/tasks", json={"title": "Second"}).json()
+        third = api_client.post("/api/tasks", json={"title": "Third"}).json()
+
+        response = api_client.post(f"/api/tasks/{first['id']}/move", json={
+            "after_id": third["id"], "before_id": second["id"]
+        })
+
+        assert response.status_code == 400
+        assert self._titles(api_client) == ["First", "Second", "Third"]
+        assert api_client.get(f"/api/tasks/{first['id']}").json()["position"] == first["position"]
+
+    def test_move_not_found(self, api_client):
+        """Test moving a non-existent task."""
+        response = api_client.post("/api/tasks/99999/move", json={})
+
+        assert response.status_code == 404
+
+
 class TestArchiveCompleted:
     """Test archive completed endpoint."""
 
@@ -479,10 +936,10 @@ class TestPositionAutoAssignment:
         t2 = api_client.post("/api/tasks", json={"title": "Task 2"}).json()
         t3 = api_client.post("/api/tasks", json={"title": "Task 3"}).json()
 
-        # Each should have incrementing positions
-        assert t1["position"] == 1
-        assert t2["position"] == 2
-        assert t3["position"] == 3
+        # Each should have incrementing, gap-spaced positions
+        assert t1["position"] == POSITION_GAP
+        assert t2["position"] == 2 * POSITION_GAP
+        assert t3["position"] == 3 * POSITION_GAP
 
     def test_position_per_priority(self, api_client):
         """Test that positions are assigned per priority level."""
@@ -490,11 +947,11 @@ class TestPositionAutoAssignment:
         t2 = api_client.post("/api/tasks", json={"title": "High 1", "priority": 0}).json()
         t3 = api_client.post("/api/tasks", json={"title": "Normal 2", "priority": 1}).json()
 
-        # High priority task should have position 1 (first in its group)
-        assert t2["position"] == 1
-        # Normal tasks should be 1 and 2
-        assert t1["position"] == 1
-        assert t3["position"] == 2
+        # High priority task should be first in its group
+        assert t2["position"] == POSITION_GAP
+        # Normal tasks should be first and second
+        assert t1["position"] == POSITION_GAP
+        assert t3["position"] == 2 * POSITION_GAP
 
 
 class TestRecurrence:
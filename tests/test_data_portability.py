@@ -4,7 +4,6 @@ import json
 import os
 import pytest
 from datetime import datetime, timedelta
-from app.main import BACKUP_DIR, perform_backup
 
 def test_export_data(api_client):
     """Test exporting data as JSON."""
@@ -72,15 +71,279 @@ def test_import_data(api_client):
     categories = api_client.get("/api/categories").json()
     assert any(c["name"] == "ImportedCat" for c in categories)
 
-def test_automated_backup_logic(api_client):
-    """Test that the backup function creates a file."""
-    # Ensure backup dir exists
-    if not os.path.exists(BACKUP_DIR):
-        os.makedirs(BACKUP_DIR)
-        
-    # Trigger a backup manually using the app's internal function
-    perform_backup()
-    
-    # Check if a backup file exists
-    backups = [f for f in os.listdir(BACKUP_DIR) if f.startswith("sharpei_backup_")]
-    assert len(backups) > 0
+def _make_blocked_pair(api_client):
+    blocker = api_client.post("/api/tasks", json={"title": "Blocker"}).json()
+    blocked = api_client.post("/api/tasks", json={"title": "Blocked", "blocked_by_ids": [blocker["id"]]}).json()
+    return blocker, blocked
+
+def test_export_streams_in_batches(api_client, test_db):
+    """Test that a batched export is one valid document with every task and its blockers."""
+    from app.portability import stream_export
+
+    blocker, blocked = _make_blocked_pair(api_client)
+    for i in range(5):
+        api_client.post("/api/tasks", json={"title": f"Filler {i}"})
+
+    chunks = list(stream_export(test_db["engine"], "json", batch_size=2))
+    data = json.loads("".join(chunks))
+
+    assert len(chunks) > 4
+    assert [t["old_id"] for t in data["tasks"]] == sorted(t["old_id"] for t in data["tasks"])
+    assert len(data["tasks"]) == 7
+    by_id = {t["old_id"]: t for t in data["tasks"]}
+    assert by_id[blocked["id"]]["blocked_by_ids"] == [blocker["id"]]
+
+def test_export_ndjson(api_client):
+    """Test the line-delimited export format."""
+    api_client.post("/api/categories", json={"name": "Work"})
+    blocker, blocked = _make_blocked_pair(api_client)
+
+    response = api_client.get("/api/data/export", params={"format": "ndjson"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["type"] for r in records] == ["meta", "category", "task", "task"]
+    assert records[3]["blocked_by_ids"] == [blocker["id"]]
+
+def test_export_unknown_format(api_client):
+    """Test that an unknown export format is rejected."""
+    assert api_client.get("/api/data/export", params={"format": "xml"}).status_code == 400
+
+def test_import_round_trip_keeps_ids(api_client):
+    """Test that exporting and re-importing keeps ids, subtasks and blockers."""
+    cat = api_client.post("/api/categories", json={"name": "Work"}).json()
+    blocker, blocked = _make_blocked_pair(api_client)
+    parent = api_client.post("/api/tasks", json={"title": "Parent", "category_id": cat["id"], "hashtags": "#q4"}).json()
+    child = api_client.post("/api/tasks", json={"title": "Child", "parent_id": parent["id"]}).json()
+
+    for fmt in ("json", "ndjson"):
+        exported = api_client.get("/api/data/export", params={"format": fmt}).text
+        response = api_client.post(
+            "/api/data/import",
+            files={"file": (f"export.{fmt}", exported, "application/octet-stream")}
+        )
+        assert response.status_code == 200
+        assert response.json()["tasks"] == 4
+        assert response.json()["dependencies"] == 1
+
+        assert api_client.get(f"/api/tasks/{blocked['id']}").json()["blocked_by_ids"] == [blocker["id"]]
+        restored = next(t for t in api_client.get("/api/tasks").json() if t["id"] == parent["id"])
+        assert restored["category_id"] == cat["id"]
+        assert [s["id"] for s in restored["subtasks"]] == [child["id"]]
+        assert [t["id"] for t in api_client.get("/api/tasks", params={"q": "#q4"}).json()] == [parent["id"]]
+
+def test_import_in_batches_drops_dangling_references(api_client, test_db):
+    """Test a batched import where some references point at records missing from the file."""
+    from io import BytesIO
+    from app.portability import import_data
+
+    tasks = [{"title": f"Task {i}", "old_id": i, "blocked_by_ids": [i - 1] if i > 1 else []} for i in range(1, 6)]
+    tasks += [
+        {"title": "Orphan", "old_id": 10, "parent_id": 99, "category_id": 42, "blocked_by_ids": [98]},
+        {"title": "No id"},
+    ]
+    document = json.dumps({"exported_at": "2025-01-01T00:00:00", "categories": [], "tasks": tasks}, indent=2)
+    progress = []
+
+    db = test_db["SessionLocal"]()
+    try:
+        counts = import_data(db, BytesIO(document.encode()), batch_size=2, progress=progress.append)
+    finally:
+        db.close()
+
+    assert counts == {"categories": 0, "tasks": 7, "dependencies": 4}
+    assert progress == [2, 4, 6]
+    orphan = api_client.get("/api/tasks/10").json()
+    assert orphan["parent_id"] is None
+    assert orphan["category_id"] is None
+    assert orphan["blocked_by_ids"] == []
+    assert len(api_client.get("/api/tasks").json()) == 7
+
+def test_import_invalid_file_keeps_data(api_client):
+    """Test that a malformed import is rejected without touching existing data."""
+    api_client.post("/api/tasks", json={"title": "Keep me"})
+
+    for content in ('{"categories": [], "tasks": [{"title": "Half"', '{"tasks": []}'):
+        response = api_client.post(
+            "/api/data/import",
+            files={"file": ("export.json", content, "application/json")}
+        )
+        assert response.status_code == 400
+
+    assert [t["title"] for t in api_client.get("/api/tasks").json()] == ["Keep me"]
+
+def _import(api_client, content, mode, fmt="json"):
+    return api_client.post(
+        "/api/data/import",
+        params={"mode": mode},
+        files={"file": (f"export.{fmt}", content, "application/octet-stream")}
+    )
+
+def test_merge_import_of_unchanged_file_writes_nothing(api_client):
+    """Test that merging an unchanged export touches no rows and keeps the ETag."""
+    api_client.post("/api/categories", json={"name": "Work"})
+    _make_blocked_pair(api_client)
+    exported = api_client.get("/api/data/export").text
+    etag = api_client.get("/api/tasks").headers["etag"]
+
+    response = _import(api_client, exported, "merge")
+
+    assert response.status_code == 200
+    assert response.json()["tasks"] == {"inserted": 0, "updated": 0, "unchanged": 2}
+    assert response.json()["categories"] == {"inserted": 0, "updated": 0, "unchanged": 1}
+    assert api_client.get("/api/tasks").headers["etag"] == etag
+
+def test_merge_import_upserts_without_deleting(api_client):
+    """Test that a merge inserts new records, updates changed ones and keeps the rest."""
+    cat = api_client.post("/api/categories", json={"name": "Work"}).json()
+    blocker, blocked = _make_blocked_pair(api_client)
+    exported = json.loads(api_client.get("/api/data/export").text)
+
+    local = api_client.post("/api/tasks", json={"title": "Created after export"}).json()
+    by_id = {t["old_id"]: t for t in exported["tasks"]}
+    by_id[blocker["id"]]["title"] = "Blocker, renamed"
+    by_id[blocked["id"]]["blocked_by_ids"] = []
+    exported["tasks"].append({"title": "Brand new", "old_id": 500, "category_id": cat["id"], "blocked_by_ids": [blocker["id"]]})
+    exported["categories"].append({"id": 77, "name": "Home", "query": None})
+
+    response = _import(api_client, json.dumps(exported), "merge")
+
+    assert response.status_code == 200
+    assert response.json()["tasks"] == {"inserted": 1, "updated": 2, "unchanged": 0}
+    assert response.json()["categories"] == {"inserted": 1, "updated": 0, "unchanged": 1}
+    assert api_client.get(f"/api/tasks/{blocker['id']}").json()["title"] == "Blocker, renamed"
+    assert api_client.get(f"/api/tasks/{blocked['id']}").json()["blocked_by_ids"] == []
+    assert api_client.get("/api/tasks/500").json()["blocked_by_ids"] == [blocker["id"]]
+    assert api_client.get(f"/api/tasks/{local['id']}").status_code == 200
+    assert any(c["id"] == 77 and c["name"] == "Home" for c in api_client.get("/api/categories").json())
+
+def test_merge_import_matches_tasks_without_ids_on_content(api_client):
+    """Test that tasks without an old_id are inserted once, however often the file is merged."""
+    ndjson = '{"type": "task", "title": "Hand-written", "priority": 0}\n'
+
+    first = _import(api_client, ndjson, "merge", "ndjson").json()
+    second = _import(api_client, ndjson, "merge", "ndjson").json()
+
+    assert first["tasks"]["inserted"] == 1
+    assert second["tasks"] == {"inserted": 0, "updated": 0, "unchanged": 1}
+    assert [t["title"] for t in api_client.get("/api/tasks").json()] == ["Hand-written"]
+
+def test_backup_includes_wal_contents(api_client, test_db, tmp_path):
+    """Test that a backup taken through the backup API holds writes not yet checkpointed out of the WAL."""
+    import sqlite3
+    from app import backups
+
+    api_client.post("/api/tasks", json={"title": "Only in the WAL so far"})
+    assert os.path.getsize(test_db["path"] + "-wal") > 0
+
+    backup_path = str(tmp_path / "copy.db")
+    backups.copy_database(test_db["path"], backup_path)
+
+    copy = sqlite3.connect(backup_path)
+    try:
+        assert copy.execute("SELECT title FROM tasks").fetchall() == [("Only in the WAL so far",)]
+        assert copy.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    finally:
+        copy.close()
+    assert not any(name.endswith(".partial") for name in os.listdir(tmp_path))
+
+def test_failed_backup_leaves_no_partial_file(test_db, tmp_path, monkeypatch):
+    """Test that a backup that fails part-way removes its partial copy."""
+    from app import backups
+
+    monkeypatch.setattr(backups, "BACKUP_PAGES_PER_STEP", "not a page count")
+    with pytest.raises(TypeError):
+        backups.copy_database(test_db["path"], str(tmp_path / "copy.db"))
+
+    assert os.listdir(tmp_path) == []
+
+class Frozen(datetime):
+    @classmethod
+    def now(cls):
+        return datetime(2100, 1, 1)
+
+def test_snapshots_store_only_changed_chunks(api_client, test_db, tmp_path, monkeypatch):
+    """Test that a second snapshot of a barely changed database reuses the first one's chunks."""
+    from app import snapshots
+    monkeypatch.setattr(snapshots, "CHUNK_PAGES", 1)
+
+    for i in range(200):
+        api_client.post("/api/tasks", json={"title": f"Task {i}", "description": "x" * 500})
+    first = snapshots.take_snapshot(test_db["path"], str(tmp_path))
+    api_client.put("/api/tasks/1", json={"title": "Renamed"})
+    second = snapshots.take_snapshot(test_db["path"], str(tmp_path))
+
+    assert snapshots.list_snapshots(str(tmp_path)) == [first["id"], second["id"]]
+    assert len(second["chunks"]) > 20
+    assert second["new_chunks"] < len(second["chunks"]) // 4
+    usage = snapshots.store_usage(str(tmp_path))
+    assert usage["stored_bytes"] < usage["logical_bytes"] / 2
+
+def test_snapshots_at_the_same_instant_get_distinct_ids(test_db, tmp_path, monkeypatch):
+    """Test that snapshots taken within the clock's resolution don't overwrite each other."""
+    from app import snapshots
+    monkeypatch.setattr(snapshots, "datetime", Frozen)
+
+    ids = [snapshots.take_snapshot(test_db["path"], str(tmp_path))["id"] for _ in range(3)]
+
+    assert len(set(ids)) == 3
+    assert snapshots.list_snapshots(str(tmp_path)) == ids
+
+def test_snapshot_store_lock(test_db, tmp_path, monkeypatch):
+    """Test that a held store lock keeps other snapshots out, and that a stale one is broken."""
+    from app import snapshots
+    monkeypatch.setattr(snapshots, "LOCK_TIMEOUT_SECONDS", 0)
+    lock = tmp_path / "lock"
+    lock.write_text("12345")
+
+    with pytest.raises(snapshots.SnapshotError):
+        snapshots.take_snapshot(test_db["path"], str(tmp_path))
+    with pytest.raises(snapshots.SnapshotError):
+        snapshots.prune(str(tmp_path))
+    assert snapshots.list_snapshots(str(tmp_path)) == []
+
+    stale = (datetime.now() - timedelta(seconds=snapshots.LOCK_STALE_SECONDS + 60)).timestamp()
+    os.utime(lock, (stale, stale))
+    assert snapshots.take_snapshot(test_db["path"], str(tmp_path))
+    assert not lock.exists()
+
+def test_snapshot_restore(api_client, test_db, tmp_path):
+    """Test that a snapshot restores to a working database, and that damage is detected."""
+    import sqlite3
+    from app import snapshots
+
+    api_client.post("/api/tasks", json={"title": "Keep me safe"})
+    manifest = snapshots.take_snapshot(test_db["path"], str(tmp_path / "store"))
+    target = str(tmp_path / "restored.db")
+
+    snapshots.restore(manifest["id"], target, str(tmp_path / "store"))
+    copy = sqlite3.connect(target)
+    try:
+        assert copy.execute("SELECT title FROM tasks").fetchall() == [("Keep me safe",)]
+    finally:
+        copy.close()
+
+    with pytest.raises(snapshots.SnapshotError):
+        snapshots.restore(manifest["id"], target, str(tmp_path / "store"))
+    chunk = snapshots._chunk_path(str(tmp_path / "store"), manifest["chunks"][0])
+    with open(chunk, "wb") as f:
+        f.write(b"garbage")
+    with pytest.raises(snapshots.SnapshotError):
+        snapshots.restore(manifest["id"], str(tmp_path / "other.db"), str(tmp_path / "store"))
+    assert not os.path.exists(str(tmp_path / "other.db"))
+
+def test_snapshot_pruning_drops_unused_chunks(test_db, tmp_path):
+    """Test that pruning keeps the newest snapshots and collects chunks only old ones used."""
+    from app import snapshots
+
+    store = str(tmp_path)
+    snapshots.take_snapshot(test_db["path"], store)
+    manifest = snapshots.read_manifest(snapshots.list_snapshots(store)[0], store)
+    stale = snapshots._chunk_path(store, "ab" + "0" * 62)
+    os.makedirs(os.path.dirname(stale), exist_ok=True)
+    open(stale, "wb").close()
+
+    assert snapshots.prune(store) == 1
+    assert snapshots.prune(store, keep=1) == 0
+    assert all(os.path.exists(snapshots._chunk_path(store, d)) for d in manifest["chunks"])
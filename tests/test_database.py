@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Tests for the Sharpei database engine configuration."""
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app.database import create_sqlite_engine
+
+
+class TestStorageProfile:
+    """Test that storage profile PRAGMAs are applied to pooled connections."""
+
+    def test_wal_profile_pragmas(self, test_db):
+        """Test that the default profile enables WAL and the tuned PRAGMAs."""
+        with test_db["engine"].connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+            assert conn.execute(text("PRAGMA cache_size")).scalar() == -65536
+
+    def test_compat_profile(self, tmp_path):
+        """Test that the compat profile keeps the rollback journal."""
+        engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'compat.db'}", profile="compat")
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 2  # FULL
+        engine.dispose()
+
+    def test_unknown_profile(self):
+        """Test that an unknown profile name is rejected."""
+        with pytest.raises(ValueError):
+            create_sqlite_engine("sqlite://", profile="turbo")
+
+
+class TestMigrations:
+    """Test the schema migrations run after create_all."""
+
+    def test_user_version_is_current(self, test_db):
+        """Test that a fresh database is migrated to the latest version."""
+        from app.migrations import MIGRATIONS
+        with test_db["engine"].connect() as conn:
+            assert conn.execute(text("PRAGMA user_version")).scalar() == MIGRATIONS[-1][0]
+
+    def test_init_db_upgrades_an_old_database(self, tmp_path):
+        """Test that init_db brings a database with only the original tables up to date."""
+        from app import crud, models, schemas
+        from app.database import init_db
+        from app.migrations import MIGRATIONS
+        engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        with engine.begin() as conn:
+            models.Category.__table__.create(conn)
+            models.Task.__table__.create(conn)
+
+        init_db(engine)
+
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA user_version")).scalar() == MIGRATIONS[-1][0]
+        db = sessionmaker(bind=engine)()
+        try:
+            task = crud.create_task(db, schemas.TaskCreate(title="Tagged", hashtags="#work"))
+            assert db.execute(text("SELECT tag FROM task_tags WHERE task_id = :id"), {"id": task.id}).scalars().all() == ["work"]
+        finally:
+            db.close()
+            engine.dispose()
+
+    def test_task_tags_backfill(self, test_db):
+        """Test that existing hashtags are backfilled into task_tags."""
+        from app.migrations import backfill_task_tags
+        with test_db["engine"].begin() as conn:
+            conn.execute(text("INSERT INTO tasks (id, title, hashtags) VALUES (1, 'Legacy', '#Work, home')"))
+            conn.execute(text("DELETE FROM task_tags"))
+            backfill_task_tags(conn)
+            rows = conn.execute(text("SELECT tag FROM task_tags WHERE task_id = 1 ORDER BY tag")).scalars().all()
+        assert rows == ["home", "work"]
+
+
+class TestDataVersion:
+    """Test the database change counter."""
+
+    def test_bumped_once_per_writing_commit(self, test_db):
+        """Test that a commit bumps the version once, however many rows it wrote."""
+        from app import crud, schemas, versioning
+
+        db = test_db["SessionLocal"]()
+        try:
+            epoch, start = versioning.current(db)
+            crud.create_task(db, schemas.TaskCreate(title="Task"))
+            assert versioning.current(db) == (epoch, start + 1)
+
+            ids = [crud.create_task(db, schemas.TaskCreate(title=f"Task {i}")).id for i in range(3)]
+            crud.bulk_update_tasks(db, ids, {"completed": True})
+            assert versioning.current(db) == (epoch, start + 5)
+        finally:
+            db.close()
+
+    def test_read_only_commit_keeps_version(self, test_db):
+        """Test that committing a session that only read leaves the version alone."""
+        from app import crud, versioning
+
+        db = test_db["SessionLocal"]()
+        try:
+            before = versioning.current(db)
+            crud.get_tasks(db)
+            db.commit()
+            assert versioning.current(db) == before
+        finally:
+            db.close()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""Tests for the task change log and the server-sent event batches built from it."""
+import json
+
+from app import crud, events
+
+
+def parse_events(frames):
+    """Split SSE frames into (id, event, data) tuples."""
+    parsed = []
+    for frame in frames:
+        fields = dict(line.split(": ", 1) for line in frame.strip().splitlines())
+        parsed.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+    return parsed
+
+
+def read(test_db, since):
+    db = test_db["SessionLocal"]()
+    try:
+        seq, frames = events.task_change_events(db, since)
+        return seq, parse_events(frames)
+    finally:
+        db.close()
+
+
+def latest(test_db):
+    db = test_db["SessionLocal"]()
+    try:
+        return crud.latest_change_seq(db)
+    finally:
+        db.close()
+
+
+class TestTaskEvents:
+    """Test the events produced for committed task changes."""
+
+    def test_create_update_delete(self, api_client, test_db):
+        """Test that each kind of write becomes an event with the task's current state."""
+        start = latest(test_db)
+        task = api_client.post("/api/tasks", json={"title": "Draft"}).json()
+
+        seq, batch = read(test_db, start)
+        assert [(e, d["op"], d["task"]["title"]) for _, e, d in batch] == [("task", "upsert", "Draft")]
+
+        api_client.put(f"/api/tasks/{task['id']}", json={"title": "Final"})
+        seq, batch = read(test_db, seq)
+        assert batch[0][2]["task"]["title"] == "Final"
+
+        api_client.delete(f"/api/tasks/{task['id']}")
+        seq, batch = read(test_db, seq)
+        assert [d for _, _, d in batch] == [{"op": "delete", "id": task["id"]}]
+
+        assert read(test_db, seq) == (seq, [])
+
+    def test_changes_are_coalesced(self, api_client, test_db):
+        """Test that several changes to one task in a batch collapse into its latest state."""
+        start = latest(test_db)
+        task = api_client.post("/api/tasks", json={"title": "One"}).json()
+        api_client.put(f"/api/tasks/{task['id']}", json={"title": "Two"})
+        other = api_client.post("/api/tasks", json={"title": "Other"}).json()
+        api_client.put(f"/api/tasks/{task['id']}", json={"title": "Three"})
+
+        seq, batch = read(test_db, start)
+
+        assert [d["task"]["title"] for _, _, d in batch] == ["Other", "Three"]
+        assert batch[-1][0] == seq
+
+    def test_dependency_updates_both_tasks(self, api_client, test_db):
+        """Test that adding a blocker sends both ends with their new dependency ids."""
+        blocker = api_client.post("/api/tasks", json={"title": "Blocker"}).json()
+        blocked = api_client.post("/api/tasks", json={"title": "Blocked"}).json()
+        start = latest(test_db)
+
+        api_client.put(f"/api/tasks/{blocked['id']}", json={"title": "Blocked", "blocked_by_ids": [blocker["id"]]})
+
+        _, batch = read(test_db, start)
+        by_id = {d["task"]["id"]: d["task"] for _, _, d in batch}
+        assert by_id[blocked["id"]]["blocked_by_ids"] == [blocker["id"]]
+        assert by_id[blocker["id"]]["blocking_ids"] == [blocked["id"]]
+
+    def test_completing_a_blocker_resends_dependents(self, api_client, test_db):
+        """Test that a dependent unblocked by a completion gets an event; one still blocked doesn't."""
+        a = api_client.post("/api/tasks", json={"title": "A"}).json()
+        b = api_client.post("/api/tasks", json={"title": "B", "blocked_by_ids": [a["id"]]}).json()
+        c = api_client.post("/api/tasks", json={"title": "C", "blocked_by_ids": [b["id"]]}).json()
+        start = latest(test_db)
+
+        api_client.put(f"/api/tasks/{a['id']}", json={"completed": True})
+
+        _, batch = read(test_db, start)
+        # C is still blocked by B, so its status didn't change
+        assert sorted((d["task"]["id"], d["task"]["is_blocked"]) for _, _, d in batch) == [
+            (a["id"], False), (b["id"], False)
+        ]
+        assert c["is_blocked"] is True
+
+    def test_mcp_writes_are_logged(self, mcp_server, test_db):
+        """Test that writes made outside the web server reach the stream."""
+        start = latest(test_db)
+
+        mcp_server.create_task(title="From MCP")
+
+        _, batch = read(test_db, start)
+        assert [d["task"]["title"] for _, _, d in batch] == ["From MCP"]
+
+    def test_reset_after_compaction(self, api_client, test_db, monkeypatch):
+        """Test that a stream resuming from pruned history is told to reload."""
+        from app import changes
+        monkeypatch.setattr(changes, "KEEP_RECENT_CHANGES", 1)
+        for i in range(3):
+            api_client.post("/api/tasks", json={"title": f"Task {i}"})
+        api_client.post("/api/changes/compact")
+
+        seq, batch = read(test_db, 0)
+
+        assert seq == latest(test_db)
+        assert [(e, d) for _, e, d in batch] == [("reset", {"seq": seq})]
+
+
+class TestChangeFeed:
+    """Test GET /api/changes delta batches and log compaction."""
+
+    def test_upserts_and_tombstones(self, api_client):
+        """Test that tasks, categories and dependencies come back with their deletions."""
+        cat = api_client.post("/api/categories", json={"name": "Work"}).json()
+        gone = api_client.post("/api/categories", json={"name": "Gone"}).json()
+        blocker = api_client.post("/api/tasks", json={"title": "Blocker"}).json()
+        blocked = api_client.post("/api/tasks", json={"title": "Blocked", "category_id": cat["id"]}).json()
+        doomed = api_client.post("/api/tasks", json={"title": "Doomed"}).json()
+        api_client.put(f"/api/tasks/{blocked['id']}", json={"title": "Blocked", "blocked_by_ids": [blocker["id"]]})
+        api_client.delete(f"/api/tasks/{doomed['id']}")
+        api_client.delete(f"/api/categories/{gone['id']}")
+
+        batch = api_client.get("/api/changes", params={"since": 0}).json()
+
+        assert sorted(t["title"] for t in batch["tasks"]) == ["Blocked", "Blocker"]
+        assert [c["name"] for c in batch["categories"]] == ["Work"]
+        assert batch["dependencies"] == [[blocked["id"], blocker["id"]]]
+        assert batch["deleted"] == {"tasks": [doomed["id"]], "categories": [gone["id"]], "dependencies": []}
+        assert batch["more"] is False
+
+        # Removing the edge leaves a tombstone for it
+        api_client.put(f"/api/tasks/{blocked['id']}", json={"title": "Blocked", "blocked_by_ids": []})
+        later = api_client.get("/api/changes", params={"since": batch["seq"]}).json()
+        assert later["deleted"]["dependencies"] == [[blocked["id"], blocker["id"]]]
+        assert later["dependencies"] == []
+
+    def test_completing_a_blocker_resends_dependents(self, api_client):
+        """Test that a dependent whose blocked status flipped is in the next batch."""
+        a = api_client.post("/api/tasks", json={"title": "A"}).json()
+        b = api_client.post("/api/tasks", json={"title": "B", "blocked_by_ids": [a["id"]]}).json()
+        seq = api_client.get("/api/changes", params={"since": 0}).json()["seq"]
+
+        api_client.put(f"/api/tasks/{a['id']}", json={"completed": True})
+
+        batch = api_client.get("/api/changes", params={"since": seq}).json()
+        assert sorted((t["id"], t["is_blocked"]) for t in batch["tasks"]) == [(a["id"], False), (b["id"], False)]
+        assert batch["deleted"]["tasks"] == []
+
+    def test_batches_page_through_the_log(self, api_client):
+        """Test that `limit` splits the log and `seq` continues where a batch stopped."""
+        for i in range(5):
+            api_client.post("/api/tasks", json={"title": f"Task {i}"})
+
+        titles, since, more = [], 0, True
+        while more:
+            batch = api_client.get("/api/changes", params={"since": since, "limit": 2}).json()
+            titles += [t["title"] for t in batch["tasks"]]
+            since, more = batch["seq"], batch["more"]
+
+        assert sorted(titles) == [f"Task {i}" for i in range(5)]
+
+    def test_limit_above_page_size_still_reports_more(self, api_client, test_db):
+        """Test that a limit beyond MAX_PAGE_SIZE is clamped without losing `more`."""
+        from sqlalchemy import insert
+        from app import crud, models
+        with test_db["engine"].begin() as conn:
+            conn.execute(insert(models.Task), [{"title": f"Task {i}"} for i in range(crud.MAX_PAGE_SIZE + 100)])
+
+        batch = api_client.get("/api/changes", params={"since": 0, "limit": 1000}).json()
+        assert len(batch["tasks"]) == crud.MAX_PAGE_SIZE
+        assert batch["more"] is True
+
+        rest = api_client.get("/api/changes", params={"since": batch["seq"], "limit": 1000}).json()
+        assert len(rest["tasks"]) == 100
+        assert rest["more"] is False
+
+    def test_pruned_history_is_gone(self, api_client, monkeypatch):
+        """Test that asking for compacted changes returns 410."""
+        from app import changes
+        monkeypatch.setattr(changes, "KEEP_RECENT_CHANGES", 1)
+        for i in range(3):
+            api_client.post("/api/tasks", json={"title": f"Task {i}"})
+
+        assert api_client.post("/api/changes/compact").json()["pruned"] == 2
+
+        assert api_client.get("/api/changes", params={"since": 0}).status_code == 410
+        latest_seq = api_client.get("/api/changes", params={"since": 2}).json()["seq"]
+        assert latest_seq == 3
+
+    def test_client_mark_holds_back_compaction(self, api_client, monkeypatch):
+        """Test that a registered client's unsynced changes survive compaction."""
+        from app import changes
+        monkeypatch.setattr(changes, "KEEP_RECENT_CHANGES", 1)
+        api_client.get("/api/changes", params={"since": 0, "client_id": "laptop"})
+        for i in range(3):
+            api_client.post("/api/tasks", json={"title": f"Task {i}"})
+
+        assert api_client.post("/api/changes/compact").json()["pruned"] == 0
+
+        batch = api_client.get("/api/changes", params={"since": 0, "client_id": "laptop"}).json()
+        assert len(batch["tasks"]) == 3
+        api_client.get("/api/changes", params={"since": batch["seq"], "client_id": "laptop"})
+        assert api_client.post("/api/changes/compact").json()["pruned"] == 2
+
+    def test_mcp_get_changes(self, mcp_server):
+        """Test the MCP tool for delta sync."""
+        task = json.loads(mcp_server.create_task(title="Agent task"))
+
+        batch = json.loads(mcp_server.get_changes(since=0))
+
+        assert [t["id"] for t in batch["tasks"]] == [task["id"]]
+        assert json.loads(mcp_server.get_changes(since=batch["seq"]))["tasks"] == []
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""Tests for the dependency graph: cycle checks and transitive blocked status."""
+import json
+import random
+
+from sqlalchemy import delete, insert, select
+
+from app import crud, graph, models, schemas
+
+
+def create(api_client, title, **data):
+    return api_client.post("/api/tasks", json={"title": title, **data}).json()["id"]
+
+
+def is_blocked(api_client, task_id):
+    return api_client.get(f"/api/tasks/{task_id}").json()["is_blocked"]
+
+
+def search(api_client, q):
+    return sorted(t["id"] for t in api_client.get("/api/tasks", params={"q": q}).json())
+
+
+class TestBlockedStatus:
+    """Test is_blocked on task payloads."""
+
+    def test_blocking_is_transitive(self, api_client):
+        """Test that a task stays blocked until everything upstream of it is resolved."""
+        a = create(api_client, "A")
+        b = create(api_client, "B", blocked_by_ids=[a])
+        c = create(api_client, "C", blocked_by_ids=[b])
+        assert [is_blocked(api_client, i) for i in (a, b, c)] == [False, True, True]
+
+        # B is done, but A, further up the chain, isn't
+        api_client.put(f"/api/tasks/{b}", json={"completed": True})
+        assert is_blocked(api_client, c)
+
+        api_client.put(f"/api/tasks/{a}", json={"completed": True})
+        assert not is_blocked(api_client, b)
+        assert not is_blocked(api_client, c)
+
+    def test_archived_and_deleted_blockers_dont_block(self, api_client):
+        """Test that only open (not completed, not archived, existing) blockers block."""
+        a = create(api_client, "A")
+        b = create(api_client, "B")
+        c = create(api_client, "C", blocked_by_ids=[a, b])
+
+        api_client.put(f"/api/tasks/{a}", json={"archived": True})
+        assert is_blocked(api_client, c)
+        api_client.delete(f"/api/tasks/{b}")
+        assert not is_blocked(api_client, c)
+
+    def test_removing_a_blocker_unblocks(self, api_client):
+        """Test that replacing blocked_by_ids updates the status."""
+        a = create(api_client, "A")
+        b = create(api_client, "B", blocked_by_ids=[a])
+        response = api_client.put(f"/api/tasks/{b}", json={"blocked_by_ids": []})
+        assert response.json()["is_blocked"] is False
+
+    def test_list_and_subtasks_carry_status(self, api_client):
+        """Test that is_blocked is set throughout a listed tree."""
+        a = create(api_client, "A")
+        parent = create(api_client, "Parent")
+        create(api_client, "Child", parent_id=parent, blocked_by_ids=[a])
+
+        tasks = {t["id"]: t for t in api_client.get("/api/tasks").json()}
+        assert tasks[parent]["is_blocked"] is False
+        assert tasks[parent]["subtasks"][0]["is_blocked"] is True
+
+
+class TestCycles:
+    """Test that dependency cycles are rejected on write."""
+
+    def test_cycle_is_rejected(self, api_client):
+        """Test that closing a loop fails with 400 and leaves the edges alone."""
+        a = create(api_client, "A")
+        b = create(api_client, "B", blocked_by_ids=[a])
+        c = create(api_client, "C", blocked_by_ids=[b])
+
+        response = api_client.put(f"/api/tasks/{a}", json={"blocked_by_ids": [c]})
+        assert response.status_code == 400
+        assert "cycle" in response.json()["detail"]
+        assert api_client.get(f"/api/tasks/{a}").json()["blocked_by_ids"] == []
+
+    def test_self_block_is_rejected(self, api_client):
+        """Test that a task can't block itself."""
+        a = create(api_client, "A")
+        response = api_client.put(f"/api/tasks/{a}", json={"blocked_by_ids": [a]})
+        assert response.status_code == 400
+
+    def test_mcp_reports_cycle(self, mcp_server):
+        """Test that the MCP update_task tool returns an error for a cycle."""
+        a = json.loads(mcp_server.create_task(title="A"))["id"]
+        b = json.loads(mcp_server.create_task(title="B", blocked_by_ids=[a]))["id"]
+        result = json.loads(mcp_server.update_task(a, blocked_by_ids=[b]))
+        assert "cycle" in result["error"]
+
+
+class TestSearchTokens:
+    """Test the is:blocked and is:ready filters."""
+
+    def test_blocked_and_ready(self, api_client):
+        """Test that the filters agree with is_blocked, through chains and completed blockers."""
+        a = create(api_client, "A")
+        b = create(api_client, "B", blocked_by_ids=[a], completed=True)
+        c = create(api_client, "C", blocked_by_ids=[b])
+        d = create(api_client, "D")
+
+        assert search(api_client, "is:blocked") == [b, c]
+        assert search(api_client, "is:ready") == [a, d]
+        assert search(api_client, "!is:blocked") == [a, d]
+
+        api_client.put(f"/api/tasks/{a}", json={"completed": True})
+        assert search(api_client, "is:blocked") == []
+        assert search(api_client, "is:ready") == [c, d]
+
+
+class TestIncrementalUpdates:
+    """Test that the incrementally maintained graph matches one rebuilt from scratch."""
+
+    def test_random_edits_match_rebuild(self, test_db):
+        """Test random edge and status edits, including raw SQL writes, against a rebuild."""
+        rng = random.Random(7)
+        db = test_db["SessionLocal"]()
+        try:
+            ids = [crud.create_task(db, schemas.TaskCreate(title=f"T{i}")).id for i in range(40)]
+            graph.current(db)
+            rebuilds = graph.dependency_graph.rebuilds
+
+            for step in range(150):
+                task_id = rng.choice(ids)
+                action = rng.random()
+                if action < 0.5:
+                    # Only edges to lower ids: acyclic by construction
+                    blockers = rng.sample([i for i in ids if i < task_id], min(2, ids.index(task_id)))
+                    crud.update_task(db, task_id, {"blocked_by_ids": blockers})
+                elif action < 0.8:
+                    crud.update_task(db, task_id, {"completed": rng.random() < 0.5})
+                elif action < 0.9:
+                    # Written outside the ORM, as another process or a bulk delete would
+                    db.execute(delete(models.task_dependencies).where(models.task_dependencies.c.task_id == task_id))
+                    db.commit()
+                else:
+                    other = rng.choice([i for i in ids if i < task_id] or [None])
+                    if other is not None:
+                        db.execute(insert(models.task_dependencies).prefix_with("OR IGNORE"),
+                                   {"task_id": task_id, "depends_on_id": other})
+                        db.commit()
+
+                incremental = graph.current(db)
+                fresh = graph.DependencyGraph()
+                with test_db["engine"].connect() as conn:
+                    fresh.refresh(conn)
+                assert incremental.blocked == fresh.blocked, f"step {step}"
+                assert incremental.open == fresh.open, f"step {step}"
+
+            assert graph.dependency_graph.rebuilds == rebuilds
+        finally:
+            db.close()
+
+
+def closure_from_edges(db):
+    """(ancestor, descendant) -> shortest depth, by breadth-first search over task_dependencies."""
+    blockers = {}
+    for task_id, depends_on_id in db.execute(
+        select(models.task_dependencies.c.task_id, models.task_dependencies.c.depends_on_id)
+    ):
+        blockers.setdefault(task_id, set()).add(depends_on_id)
+    expected = {}
+    for task_id in blockers:
+        depth, level, seen = 1, set(blockers[task_id]), set()
+        while level:
+            for ancestor in level - seen:
+                expected[(ancestor, task_id)] = depth
+            seen |= level
+            level = {b for t in level for b in blockers.get(t, ())} - seen
+            depth += 1
+    return expected
+
+
+def closure_rows(db):
+    c = models.task_closure.c
+    return {(a, d): depth for a, d, depth in db.execute(select(c.ancestor_id, c.descendant_id, c.depth))}
+
+
+class TestClosure:
+    """Test the task_closure table and the queries served from it."""
+
+    def test_random_edits_match_edges(self, test_db):
+        """Test random creates, blocker changes and deletes against a closure computed from the edges."""
+        rng = random.Random(11)
+        db = test_db["SessionLocal"]()
+        try:
+            ids = []
+            for step in range(200):
+                action = rng.random()
+                if action < 0.35 or len(ids) < 5:
+                    blockers = rng.sample(ids, min(len(ids), rng.randint(0, 2)))
+                    ids.append(crud.create_task(db, schemas.TaskCreate(title=f"T{step}", blocked_by_ids=blockers)).id)
+                elif action < 0.75:
+                    # Only edges to older tasks: acyclic by construction
+                    task_id = rng.choice(ids[1:])
+                    older = [i for i in ids if i < task_id]
+                    crud.update_task(db, task_id, {"blocked_by_ids": rng.sample(older, min(len(older), rng.randint(0, 3)))})
+                elif action < 0.9:
+                    task_id = rng.choice(ids)
+                    crud.delete_task(db, task_id)
+                    ids.remove(task_id)
+                else:
+                    doomed = rng.sample(ids, 2)
+                    crud.bulk_delete_tasks(db, doomed)
+                    ids = [i for i in ids if i not in doomed]
+                assert closure_rows(db) == closure_from_edges(db), f"step {step}"
+        finally:
+            db.close()
+
+    def test_blocked_status_matches_graph(self, test_db):
+        """Test that the closure-based is:blocked criterion agrees with the graph through edge and status edits."""
+        from app import closure
+        rng = random.Random(13)
+        db = test_db["SessionLocal"]()
+        try:
+            ids = [crud.create_task(db, schemas.TaskCreate(title=f"T{i}")).id for i in range(30)]
+            for step in range(150):
+                task_id = rng.choice(ids[1:])
+                action = rng.random()
+                if action < 0.4:
+                    # Only edges to older tasks: acyclic by construction
+                    older = [i for i in ids if i < task_id]
+                    crud.update_task(db, task_id, {"blocked_by_ids": rng.sample(older, min(len(older), rng.randint(0, 2)))})
+                elif action < 0.75:
+                    crud.update_task(db, task_id, {"completed": rng.random() < 0.5})
+                elif action < 0.9:
+                    crud.update_task(db, task_id, {"archived": rng.random() < 0.5})
+                else:
+                    crud.delete_task(db, task_id)
+                    ids.remove(task_id)
+
+                in_sql = set(db.execute(
+                    select(models.Task.id).where(closure.open_ancestor_exists(models.Task.id))
+                ).scalars())
+                assert graph.current(db).blocked == in_sql, f"step {step}"
+        finally:
+            db.close()
+
+    def test_dependencies_endpoint(self, api_client):
+        """Test transitive blockers and downstream tasks, nearest first."""
+        a = create(api_client, "A")
+        b = create(api_client, "B", blocked_by_ids=[a])
+        c = create(api_client, "C", blocked_by_ids=[b, a])
+        d = create(api_client, "D", blocked_by_ids=[c])
+
+        response = api_client.get(f"/api/tasks/{c}/dependencies").json()
+        assert response["blockers"] == [{"id": a, "depth": 1}, {"id": b, "depth": 1}]
+        assert response["downstream"] == [{"id": d, "depth": 1}]
+        assert [link["id"] for link in api_client.get(f"/api/tasks/{a}/dependencies").json()["downstream"]] == [b, c, d]
+        assert api_client.get("/api/tasks/9999/dependencies").status_code == 404
+
+    def test_import_rebuilds_closure(self, api_client, test_db):
+        """Test that a replace import leaves the closure matching the imported edges."""
+        a = create(api_client, "A")
+        b = create(api_client, "B", blocked_by_ids=[a])
+        create(api_client, "C", blocked_by_ids=[b])
+        exported = api_client.get("/api/data/export").content
+
+        response = api_client.post("/api/data/import", files={"file": ("export.json", exported, "application/json")})
+        assert response.status_code == 200
+        db = test_db["SessionLocal"]()
+        try:
+            assert len(closure_rows(db)) == 3
+            assert closure_rows(db) == closure_from_edges(db)
+        finally:
+            db.close()
+
+
+class TestReadyQueue:
+    """Test GET /api/tasks/ready and the get_ready_tasks MCP tool."""
+
+    def test_ranking_and_filtering(self, api_client):
+        """Test that only open, unblocked tasks come back, by priority, due date, then position."""
+        low = create(api_client, "Low", priority=2)
+        undated = create(api_client, "Undated", priority=0)
+        later = create(api_client, "Later", priority=0, due_date="2030-02-01T00:00:00")
+        sooner = create(api_client, "Sooner", priority=0, due_date="2030-01-01T00:00:00")
+        create(api_client, "Blocked", priority=0, blocked_by_ids=[low])
+        create(api_client, "Done", priority=0, completed=True)
+        archived = create(api_client, "Archived", priority=0)
+        api_client.put(f"/api/tasks/{archived}", json={"archived": True})
+
+        ready = api_client.get("/api/tasks/ready").json()
+        assert [t["id"] for t in ready] == [sooner, later, undated, low]
+        assert not any(t["is_blocked"] for t in ready)
+
+        assert [t["id"] for t in api_client.get("/api/tasks/ready", params={"limit": 2}).json()] == [sooner, later]
+        assert api_client.get("/api/tasks/ready", params={"limit": 0}).status_code == 400
+
+    def test_completing_a_blocker_releases_downstream(self, api_client):
+        """Test that a task joins the queue once everything upstream is done."""
+        a = create(api_client, "A")
+        b = create(api_client, "B", blocked_by_ids=[a])
+        c = create(api_client, "C", blocked_by_ids=[b])
+        assert [t["id"] for t in api_client.get("/api/tasks/ready").json()] == [a]
+
+        api_client.put(f"/api/tasks/{a}", json={"completed": True})
+        api_client.put(f"/api/tasks/{b}", json={"completed": True})
+        assert [t["id"] for t in api_client.get("/api/tasks/ready").json()] == [c]
+
+    def test_mcp_tool(self, mcp_server):
+        """Test that the MCP tool returns the same queue."""
+        a = json.loads(mcp_server.create_task(title="A", priority=2))["id"]
+        json.loads(mcp_server.create_task(title="B", blocked_by_ids=[a]))
+        c = json.loads(mcp_server.create_task(title="C", priority=0))["id"]
+
+        assert [t["id"] for t in json.loads(mcp_server.get_ready_tasks())] == [c, a]
+        assert "error" in json.loads(mcp_server.get_ready_tasks(limit=0))
@@ -275,6 +275,32 @@ class TestFiltering:
         assert len(result) == 1
 
 
+class TestPagination:
+    """Test cursor pagination of list_tasks."""
+
+    def test_paginated_list(self, mcp_server):
+        """Test walking list_tasks pages with next_cursor."""
+        for i in range(5):
+            mcp_server.create_task(f"Task {i}")
+
+        first = json.loads(mcp_server.list_tasks(limit=2))
+        assert [t["title"] for t in first["tasks"]] == ["Task 0", "Task 1"]
+        assert first["next_cursor"]
+
+        second = json.loads(mcp_server.list_tasks(limit=2, cursor=first["next_cursor"]))
+        third = json.loads(mcp_server.list_tasks(limit=2, cursor=second["next_cursor"]))
+
+        assert [t["title"] for t in second["tasks"]] == ["Task 2", "Task 3"]
+        assert [t["title"] for t in third["tasks"]] == ["Task 4"]
+        assert third["next_cursor"] is None
+
+    def test_invalid_cursor(self, mcp_server):
+        """Test that a bad cursor returns an error."""
+        result = json.loads(mcp_server.list_tasks(limit=2, cursor="garbage"))
+
+        assert "error" in result
+
+
 class TestArchiving:
     """Test archive functionality."""
 
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Query-count regression tests: serializing tasks must not lazy-load per task."""
+import json
+
+import pytest
+from sqlalchemy import event, text
+
+
+class QueryCounter:
+    """Count SELECT statements issued on an engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def build_tree(create, n_roots):
+    """Create n_roots tasks, each with two levels of subtasks and a dependency chain."""
+    previous = None
+    for i in range(n_roots):
+        root = create(title=f"Root {i}", blocked_by_ids=[previous] if previous else None)
+        child = create(title=f"Child {i}", parent_id=root)
+        create(title=f"Grandchild {i}", parent_id=child, blocked_by_ids=[root])
+        previous = root
+
+
+@pytest.fixture
+def api_create(api_client):
+    def create(**data):
+        return api_client.post("/api/tasks", json=data).json()["id"]
+    return create
+
+
+@pytest.fixture
+def mcp_create(mcp_server):
+    def create(**data):
+        return json.loads(mcp_server.create_task(**data))["id"]
+    return create
+
+
+class TestApiQueryCounts:
+    """GET /api/tasks cost must not grow with the number of tasks."""
+
+    def _list_queries(self, api_client, engine):
+        with QueryCounter(engine) as counter:
+            response = api_client.get("/api/tasks")
+        assert response.status_code == 200
+        return counter.count, response.json()
+
+    def test_list_queries_bounded(self, api_client, api_create, test_db):
+        """Test that listing 5 or 25 task trees costs the same number of queries."""
+        build_tree(api_create, 5)
+        small_count, small = self._list_queries(api_client, test_db["engine"])
+
+        build_tree(api_create, 20)
+        large_count, large = self._list_queries(api_client, test_db["engine"])
+
+        assert len(small) == 5 and len(large) == 25
+        assert large[0]["subtasks"][0]["subtasks"][0]["blocked_by_ids"]
+        assert large_count == small_count
+
+
+class TestMcpQueryCounts:
+    """MCP list_tasks cost must not grow with the number of tasks."""
+
+    def test_list_queries_bounded(self, mcp_server, mcp_create, test_db):
+        """Test that listing 5 or 25 task trees costs the same number of queries."""
+        build_tree(mcp_create, 5)
+        with QueryCounter(test_db["engine"]) as small:
+            mcp_server.list_tasks()
+
+        build_tree(mcp_create, 20)
+        with QueryCounter(test_db["engine"]) as large:
+            result = json.loads(mcp_server.list_tasks())
+
+        assert len(result) == 25
+        assert large.count == small.count
+
+
+class TestMoveQueryCounts:
+    """A move that respaces its list must not lazy-load per returned task."""
+
+    def _rebalancing_move(self, api_client, test_db):
+        root_ids = [t["id"] for t in api_client.get("/api/tasks").json()]
+        # Pack the roots onto adjacent positions so that the next move has to respace them all
+        with test_db["engine"].begin() as conn:
+            for position, task_id in enumerate(root_ids):
+                conn.execute(text("UPDATE tasks SET position = :p WHERE id = :id"), {"p": position, "id": task_id})
+        with QueryCounter(test_db["engine"]) as counter:
+            response = api_client.post(f"/api/tasks/{root_ids[-1]}/move", json={"after_id": root_ids[0]})
+        assert response.status_code == 200
+        assert len(response.json()["tasks"]) == len(root_ids)
+        return counter.count
+
+    def test_rebalance_queries_bounded(self, api_client, api_create, test_db):
+        """Test that respacing 5 or 25 task trees costs the same number of queries."""
+        build_tree(api_create, 5)
+        small_count = self._rebalancing_move(api_client, test_db)
+
+        build_tree(api_create, 20)
+        large_count = self._rebalancing_move(api_client, test_db)
+
+        assert large_count == small_count
+
+
+class TestTreeDepth:
+    """Loading a subtask tree must not cost a query per level."""
+
+    def test_depth_does_not_add_queries(self, mcp_server, mcp_create, test_db):
+        """Test that a 3-deep and a 40-deep tree load with the same number of queries."""
+        def chain(depth):
+            root = parent = mcp_create(title="Root")
+            for level in range(depth):
+                parent = mcp_create(title=f"Level {level}", parent_id=parent)
+            return root
+
+        counts = []
+        for depth in (3, 40):
+            root = chain(depth)
+            with QueryCounter(test_db["engine"]) as counter:
+                task = json.loads(mcp_server.get_task(root))
+            counts.append(counter.count)
+            levels = 0
+            while task["subtasks"]:
+                task, levels = task["subtasks"][0], levels + 1
+            assert levels == depth
+        assert counts[0] == counts[1]
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Tests for WAL-shipping replication and point-in-time restore."""
+import sqlite3
+import time
+from datetime import datetime
+
+import pytest
+
+from app import replication
+
+
+def titles(path):
+    connection = sqlite3.connect(path)
+    try:
+        return [title for (title,) in connection.execute("SELECT title FROM tasks ORDER BY id")]
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def replicator(test_db, tmp_path):
+    replicator = replication.Replicator(test_db["path"], str(tmp_path / "replica"))
+    yield replicator
+    replicator.stop()
+
+
+class TestReplication:
+    """Test shipping WAL frames and restoring from them."""
+
+    def test_restore_latest_and_point_in_time(self, api_client, replicator, tmp_path):
+        """Test that a restore replays shipped transactions up to the requested time."""
+        api_client.post("/api/tasks", json={"title": "Before"})
+        replicator.sync()
+        time.sleep(0.01)
+        between = datetime.now()
+        time.sleep(0.01)
+        api_client.post("/api/tasks", json={"title": "After"})
+        replicator.sync()
+
+        replica = str(tmp_path / "replica")
+        replication.restore(str(tmp_path / "latest.db"), replica_dir=replica)
+        replication.restore(str(tmp_path / "earlier.db"), at=between, replica_dir=replica)
+
+        assert titles(str(tmp_path / "latest.db")) == ["Before", "After"]
+        assert titles(str(tmp_path / "earlier.db")) == ["Before"]
+        assert replicator.stats()["frames_shipped"] > 0
+        assert replicator.stats()["lag_seconds"] is not None
+
+    def test_own_checkpoints_keep_the_generation(self, api_client, replicator, tmp_path, monkeypatch):
+        """Test that the replicator checkpoints the WAL itself without losing its place."""
+        monkeypatch.setattr(replication, "CHECKPOINT_FRAMES", 5)
+        replicator.sync()
+        generation = replicator.generation
+        for i in range(10):
+            api_client.post("/api/tasks", json={"title": f"Task {i}"})
+            replicator.sync()
+
+        assert replicator.generation == generation
+        replication.restore(str(tmp_path / "restored.db"), replica_dir=str(tmp_path / "replica"))
+        assert titles(str(tmp_path / "restored.db")) == [f"Task {i}" for i in range(10)]
+
+    def test_wal_restarted_elsewhere_starts_new_generation(self, api_client, replicator, test_db, tmp_path):
+        """Test that losing track of the WAL starts a new generation rather than a gap."""
+        replicator.sync()
+        generation = replicator.generation
+        api_client.post("/api/tasks", json={"title": "First"})
+        replicator.sync()
+
+        # Someone else checkpoints and truncates the WAL while the replicator isn't holding it
+        replicator._release_wal()
+        api_client.post("/api/tasks", json={"title": "Unshipped"})
+        other = sqlite3.connect(test_db["path"])
+        other.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        other.close()
+        api_client.post("/api/tasks", json={"title": "Third"})
+        replicator.sync()
+
+        assert replicator.generation != generation
+        replication.restore(str(tmp_path / "restored.db"), replica_dir=str(tmp_path / "replica"))
+        assert titles(str(tmp_path / "restored.db")) == ["First", "Unshipped", "Third"]
+
+    def test_restore_refuses_to_overwrite(self, replicator, tmp_path):
+        """Test that restoring onto an existing file needs overwrite=True."""
+        replicator.sync()
+        target = tmp_path / "existing.db"
+        target.write_bytes(b"")
+
+        with pytest.raises(replication.ReplicationError):
+            replication.restore(str(target), replica_dir=str(tmp_path / "replica"))
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Tests for critical-path schedule analysis."""
+from datetime import date, datetime
+
+from app import crud, schedule, schemas
+
+TODAY = date(2030, 1, 1)
+
+
+def add(db, title, due=None, blocked_by=(), **fields):
+    due_date = datetime(2030, 1, due, 12) if due else None
+    task = crud.create_task(db, schemas.TaskCreate(title=title, due_date=due_date, blocked_by_ids=list(blocked_by)))
+    if fields:
+        crud.update_task(db, task.id, fields)
+    return task.id
+
+
+def by_id(result):
+    return {t["id"]: t for t in result["tasks"]}
+
+
+class TestAnalysis:
+    """Test slack, at-risk flags and the critical path."""
+
+    def test_chain_that_misses_its_deadline(self, test_db):
+        """Test that a too-long chain puts every task on it at risk, and nothing else."""
+        db = test_db["SessionLocal"]()
+        try:
+            a = add(db, "A")
+            b = add(db, "B", blocked_by=[a])
+            c = add(db, "C", due=2, blocked_by=[b])  # three days of work, due end of tomorrow
+            d = add(db, "D", due=10)
+            e = add(db, "E")
+
+            result = schedule.analyze(db, today=TODAY)
+            tasks = by_id(result)
+            assert [tasks[i]["slack"] for i in (a, b, c)] == [-1, -1, -1]
+            assert tasks[c]["earliest_start"] == 2 and tasks[c]["projected_finish"] == date(2030, 1, 3)
+            assert tasks[d]["slack"] == 9
+            assert tasks[e]["slack"] is None and tasks[e]["latest_finish"] is None
+            assert result["at_risk"] == [a, b, c]
+            assert result["critical_path"] == [a, b, c]
+            assert [t["id"] for t in result["tasks"]].index(a) < [t["id"] for t in result["tasks"]].index(c)
+        finally:
+            db.close()
+
+    def test_closed_tasks_and_task_days(self, test_db):
+        """Test that completed blockers drop out, and that slack scales with task_days."""
+        db = test_db["SessionLocal"]()
+        try:
+            done = add(db, "Done", completed=True)
+            a = add(db, "A", due=3, blocked_by=[done])
+            b = add(db, "B", due=4, blocked_by=[a])
+
+            result = schedule.analyze(db, today=TODAY)
+            assert done not in by_id(result)
+            assert [by_id(result)[i]["slack"] for i in (a, b)] == [2, 2]
+
+            result = schedule.analyze(db, task_days=2.5, today=TODAY)
+            assert [by_id(result)[i]["slack"] for i in (a, b)] == [-1, -1]  # A must finish by 1.5 for B to make day 4
+            assert result["at_risk"] == [a, b]
+        finally:
+            db.close()
+
+    def test_longest_chain_without_due_dates(self, test_db):
+        """Test that the critical path is the longest chain when nothing has a deadline."""
+        db = test_db["SessionLocal"]()
+        try:
+            a = add(db, "A")
+            b = add(db, "B", blocked_by=[a])
+            add(db, "C")
+            d = add(db, "D", blocked_by=[b])
+            assert schedule.analyze(db, today=TODAY)["critical_path"] == [a, b, d]
+        finally:
+            db.close()
+
+
+class TestEndpoint:
+    """Test GET /api/schedule and its cache."""
+
+    def test_cached_until_the_next_write(self, api_client):
+        """Test that polling reuses the analysis and a write invalidates it."""
+        from app import cache
+
+        a = api_client.post("/api/tasks", json={"title": "A", "due_date": "2000-01-01T12:00:00"}).json()["id"]
+        first = api_client.get("/api/schedule").json()
+        assert first["at_risk"] == [a]
+        hits = cache.schedule_results.hits
+        assert api_client.get("/api/schedule").json() == first
+        assert cache.schedule_results.hits == hits + 1
+
+        api_client.put(f"/api/tasks/{a}", json={"completed": True})
+        assert api_client.get("/api/schedule").json()["tasks"] == []
+
+    def test_invalid_task_days(self, api_client, mcp_server):
+        """Test that task_days must be positive, finite and at most MAX_TASK_DAYS."""
+        for task_days in (0, -1, "inf", "nan", 1e300, schedule.MAX_TASK_DAYS + 1):
+            assert api_client.get("/api/schedule", params={"task_days": task_days}).status_code == 400
+        assert "error" in mcp_server.get_schedule(task_days=-1)
+        assert "error" in mcp_server.get_schedule(task_days=float("inf"))
+        assert "error" in mcp_server.get_schedule(task_days=1e300)
+        assert api_client.get("/api/schedule", params={"task_days": schedule.MAX_TASK_DAYS}).status_code == 200
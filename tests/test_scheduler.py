@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Tests for the periodic job scheduler and its jobs."""
+from datetime import datetime, timedelta
+
+from app import scheduler
+
+
+class TestRunDueJobs:
+    """Test when jobs run and how their runs are recorded."""
+
+    def test_jobs_run_once_per_interval(self, api_client):
+        """Test that a job runs when first seen, then only after its interval has passed."""
+        calls = []
+        jobs = [scheduler.Job("probe", timedelta(hours=1), lambda: calls.append(1))]
+        start = datetime(2025, 1, 1, 9, 0)
+
+        assert scheduler.run_due_jobs(start, jobs) == ["probe"]
+        assert scheduler.run_due_jobs(start + timedelta(minutes=59), jobs) == []
+        assert scheduler.run_due_jobs(start + timedelta(hours=1), jobs) == ["probe"]
+        assert len(calls) == 2
+        assert scheduler.last_runs()["probe"] == {"last_run_at": start + timedelta(hours=1), "last_error": None}
+
+    def test_failed_job_is_recorded_and_waits_its_interval(self, api_client):
+        """Test that a failing job records its error and doesn't stop the others."""
+        def broken():
+            raise RuntimeError("disk full")
+        calls = []
+        jobs = [
+            scheduler.Job("broken", timedelta(hours=1), broken),
+            scheduler.Job("probe", timedelta(hours=1), lambda: calls.append(1)),
+        ]
+        start = datetime(2025, 1, 1, 9, 0)
+
+        assert scheduler.run_due_jobs(start, jobs) == ["broken", "probe"]
+        assert scheduler.run_due_jobs(start + timedelta(minutes=1), jobs) == []
+        assert scheduler.last_runs()["broken"]["last_error"] == "disk full"
+        assert calls == [1]
+
+    def test_recording_runs_leaves_data_version_alone(self, api_client):
+        """Test that job bookkeeping doesn't invalidate cached task lists."""
+        etag = api_client.get("/api/tasks").headers["etag"]
+        scheduler.run_due_jobs(datetime.now(), [scheduler.Job("noop", timedelta(hours=1), lambda: None)])
+        assert api_client.get("/api/tasks").headers["etag"] == etag
+
+    def test_jobs_endpoint(self, api_client):
+        """Test that every job is listed with its last run."""
+        scheduler.run_due_jobs(datetime(2025, 1, 1), [scheduler.Job("recurrence", timedelta(minutes=15), lambda: None)])
+
+        jobs = {job["name"]: job for job in api_client.get("/api/jobs").json()}
+
+        assert set(jobs) == {job.name for job in scheduler.JOBS}
+        assert jobs["recurrence"]["last_run_at"] == "2025-01-01T00:00:00"
+        assert jobs["backup"]["last_run_at"] is None
+
+
+class TestJobs:
+    """Test the work done by the built-in jobs."""
+
+    def test_recurrence_rolls_over_bulk_completed_tasks(self, api_client):
+        """Test that a recurring task completed by a bulk update moves to its next due date."""
+        task = api_client.post("/api/tasks", json={
+            "title": "Water plants", "recurrence": "3d", "due_date": "2025-03-01T09:00:00"
+        }).json()
+        api_client.post("/api/tasks/bulk-update", json={"task_ids": [task["id"]], "updates": {"completed": True}})
+
+        assert scheduler.run_recurrence() == 1
+
+        rolled = api_client.get(f"/api/tasks/{task['id']}").json()
+        assert rolled["completed"] is False
+        assert rolled["due_date"] == "2025-03-04T09:00:00"
+
+    def test_auto_archive(self, api_client, monkeypatch):
+        """Test that completed tasks due long enough ago are archived, and only when enabled."""
+        old = api_client.post("/api/tasks", json={"title": "Old", "due_date": "2020-01-01T00:00:00"}).json()
+        recent = api_client.post("/api/tasks", json={"title": "Recent", "due_date": datetime.now().isoformat()}).json()
+        for task in (old, recent):
+            api_client.put(f"/api/tasks/{task['id']}", json={"completed": True})
+
+        assert scheduler.run_auto_archive() == 0
+        monkeypatch.setattr(scheduler, "AUTO_ARCHIVE_DAYS", 7)
+        assert scheduler.run_auto_archive() == 1
+
+        assert api_client.get(f"/api/tasks/{old['id']}").json()["archived"] is True
+        assert api_client.get(f"/api/tasks/{recent['id']}").json()["archived"] is False
+
+    def test_maintenance(self, api_client):
+        """Test that maintenance runs against the live database."""
+        api_client.post("/api/tasks", json={"title": "Something to compact"})
+        assert scheduler.run_maintenance() == 0
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Tests for the search query parser and plan cache."""
+from app import search_query
+from app.search_query import Has, InCategory, Not, Priority, SearchQuery, Status, Tagged, Word
+
+
+class TestParse:
+    """Test tokenizing and parsing into the AST."""
+
+    def test_filters_and_words(self):
+        """Test that every token kind parses to its clause."""
+        query = search_query.parse("is:overdue p:high priority:2 has:desc category:work #a #b,#c report")
+
+        assert query == SearchQuery((
+            Status("overdue"),
+            Priority(0),
+            Priority(2),
+            Has("description"),
+            InCategory("work"),
+            Tagged(("a",), match_all=True),
+            Tagged(("b", "c"), match_all=False),
+            Word("report"),
+        ))
+        assert query.words == ("report",)
+
+    def test_negation(self):
+        """Test that ! negates filters, tags and words."""
+        query = search_query.parse("!is:completed !#docs !draft")
+
+        assert query.clauses == (
+            Not(Status("completed")),
+            Not(Tagged(("docs",), match_all=True)),
+            Not(Word("draft")),
+        )
+        assert query.words == ()
+
+    def test_unknown_filter_values_are_dropped(self):
+        """Test that filters with values outside the grammar are ignored."""
+        query = search_query.parse("is:someday p:urgent has:kids category: !is:bogus")
+
+        assert query.clauses == ()
+
+    def test_archived_flag(self):
+        """Test that only a positive is:archived reveals archived tasks."""
+        assert search_query.parse("is:archived").includes_archived
+        assert not search_query.parse("!is:archived").includes_archived
+
+
+class TestPlanCache:
+    """Test the compiled-plan LRU."""
+
+    def test_normalized_queries_share_a_plan(self):
+        """Test that case and whitespace variants hit the same cache entry."""
+        first = search_query.compile_search(search_query.normalize("P:High  Report"), True)
+        second = search_query.compile_search(search_query.normalize("p:high report"), True)
+
+        assert first is second
+
+    def test_overdue_binds_now(self):
+        """Test that is:overdue leaves the current time as a bind parameter."""
+        plan = search_query.compile_search("!is:overdue", False)
+
+        assert plan.uses_now
+        assert not search_query.compile_search("is:completed", False).uses_now
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Tests for whole-subtree operations: delete, archive and move."""
+
+
+def create(api_client, title, **data):
+    return api_client.post("/api/tasks", json={"title": title, **data}).json()["id"]
+
+
+def tree(api_client, **data):
+    """Root -> Child -> Grandchild, with extra fields on the root."""
+    root = create(api_client, "Root", **data)
+    child = create(api_client, "Child", parent_id=root, category_id=data.get("category_id"))
+    grandchild = create(api_client, "Grandchild", parent_id=child, category_id=data.get("category_id"))
+    return root, child, grandchild
+
+
+def get(api_client, task_id):
+    return api_client.get(f"/api/tasks/{task_id}")
+
+
+class TestDelete:
+    """Test that deletes take whole subtrees."""
+
+    def test_bulk_delete_takes_grandchildren(self, api_client):
+        """Test that bulk delete leaves no orphaned descendants, edges or closure rows."""
+        root, child, grandchild = tree(api_client)
+        other = create(api_client, "Other", blocked_by_ids=[grandchild])
+
+        response = api_client.post("/api/tasks/bulk-delete", json={"task_ids": [root]})
+        assert "3" in response.json()["message"]
+        assert [get(api_client, i).status_code for i in (root, child, grandchild)] == [404, 404, 404]
+        other_task = get(api_client, other).json()
+        assert other_task["blocked_by_ids"] == [] and other_task["is_blocked"] is False
+        assert api_client.get(f"/api/tasks/{other}/dependencies").json()["blockers"] == []
+
+    def test_delete_of_a_subtask_keeps_its_parent(self, api_client):
+        """Test that deleting a middle task removes only its own subtree."""
+        root, child, grandchild = tree(api_client)
+        api_client.delete(f"/api/tasks/{child}")
+        assert get(api_client, grandchild).status_code == 404
+        assert get(api_client, root).json()["title"] == "Root"
+
+
+class TestArchive:
+    """Test that archiving follows the tree."""
+
+    def test_archive_and_unarchive_cascade(self, api_client):
+        """Test that archiving a task archives every descendant, and unarchiving restores them."""
+        root, child, grandchild = tree(api_client)
+        api_client.put(f"/api/tasks/{root}", json={"archived": True})
+        assert all(get(api_client, i).json()["archived"] for i in (child, grandchild))
+        assert api_client.get("/api/tasks/ready").json() == []
+
+        api_client.put(f"/api/tasks/{root}", json={"archived": False})
+        assert not any(get(api_client, i).json()["archived"] for i in (child, grandchild))
+
+    def test_unchanged_fields_dont_cascade(self, api_client):
+        """Test that saving a parent as-is leaves separately archived subtasks alone."""
+        root, child, _ = tree(api_client)
+        api_client.put(f"/api/tasks/{child}", json={"archived": True})
+        api_client.put(f"/api/tasks/{root}", json={"title": "Renamed", "archived": False})
+        assert get(api_client, child).json()["archived"] is True
+
+    def test_archive_completed_takes_subtasks(self, api_client):
+        """Test that archiving a completed task also archives its open subtasks, counting only the task."""
+        root, child, grandchild = tree(api_client, completed=True)
+        response = api_client.post("/api/tasks/archive-completed")
+        assert response.json()["message"] == "Archived 1 completed tasks"
+        assert all(get(api_client, i).json()["archived"] for i in (root, child, grandchild))
+
+
+class TestMove:
+    """Test that recategorizing and reparenting move whole subtrees."""
+
+    def test_recategorize_cascades(self, api_client):
+        """Test that a new category applies to every descendant."""
+        work = api_client.post("/api/categories", json={"name": "Work"}).json()["id"]
+        root, child, grandchild = tree(api_client)
+        api_client.put(f"/api/tasks/{root}", json={"category_id": work})
+        assert [get(api_client, i).json()["category_id"] for i in (child, grandchild)] == [work, work]
+
+        api_client.post("/api/tasks/bulk-update", json={"task_ids": [root], "updates": {"category_id": None}})
+        assert [get(api_client, i).json()["category_id"] for i in (child, grandchild)] == [None, None]
+
+    def test_reparent_takes_new_parents_category(self, api_client):
+        """Test that a subtree moved under a new parent joins that parent's category."""
+        home = api_client.post("/api/categories", json={"name": "Home"}).json()["id"]
+        target = create(api_client, "Target", category_id=home)
+        root, child, grandchild = tree(api_client)
+
+        response = api_client.put(f"/api/tasks/{child}", json={"parent_id": target})
+        assert response.status_code == 200
+        assert [get(api_client, i).json()["category_id"] for i in (child, grandchild)] == [home, home]
+        listed = {t["id"]: t for t in api_client.get("/api/tasks").json()}
+        assert [t["id"] for t in listed[target]["subtasks"]] == [child]
+        assert listed[root]["subtasks"] == []
+        assert get(api_client, root).json()["category_id"] is None
+
+    def test_cannot_move_under_own_subtask(self, api_client):
+        """Test that reparenting into the task's own subtree is rejected."""
+        root, _, grandchild = tree(api_client)
+        response = api_client.put(f"/api/tasks/{root}", json={"parent_id": grandchild})
+        assert response.status_code == 400
+        assert get(api_client, root).json()["parent_id"] is None
+        assert api_client.put(f"/api/tasks/{root}", json={"parent_id": 9999}).status_code == 400